@@ -1,21 +1,42 @@
 from exchange_connector import ExchangeConnector
 from trading_engine import TradingEngine
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from database import init_db, DBSession
-from models import User, Strategy, Backtest, Trade, StrategyStatus, TradingMode, APIKey
+from models import User, Strategy, Backtest, Trade, StrategyStatus, TradingMode, APIKey, UserRole
 from auth import hash_password, verify_password, create_access_token, get_user_from_token
 from datetime import datetime
+from sqlalchemy import func
 from api_key_manager import key_manager
+import candle_codec
+import http_cache
+import metrics
+import quotas
+import risk_engine
+import tracing
 import os
 
 app = Flask(__name__, static_folder='frontend/build', static_url_path='')
+# Only the X-Forwarded-For entry our own proxies appended is trusted (the quota key depends on it).
+app.wsgi_app = ProxyFix(app.wsgi_app, x_for=quotas.TRUSTED_PROXY_HOPS, x_proto=quotas.TRUSTED_PROXY_HOPS)
 CORS(app)
-
-# Initialize database on startup
-with app.app_context():
-    init_db()
-    print("✅ Database initialized")
+metrics.instrument_app(app)
+tracing.instrument_app(app)
+quotas.instrument_app(app)
+http_cache.enable_compression(app)
+
+# EXCHANGE_SIM=1 (or a fault spec) swaps ccxt for the local simulator -- see exchange_sim.
+if os.environ.get('EXCHANGE_SIM'):
+    import exchange_sim
+    exchange_sim.install_from_env()
+
+# Initialize database on startup. Under gunicorn.conf.py (preload_app) this runs once, in the
+# master, before workers fork; SKIP_DB_INIT=1 skips it where the schema is managed separately.
+if os.environ.get('SKIP_DB_INIT') != '1':
+    with app.app_context():
+        init_db()
+        print("✅ Database initialized")
 
 # ==================== SERVE REACT FRONTEND ====================
 
@@ -32,13 +53,14 @@ def serve(path):
 def get_current_user(token):
     if not token or not token.startswith('Bearer '):
         return None
-    token = token.replace('Bearer ', '')
-    user_data = get_user_from_token(token)
-    if not user_data:
-        return None
-    with DBSession() as db:
-        user = db.query(User).filter(User.id == user_data['user_id']).first()
-        return user
+    with tracing.span('auth.get_current_user'):
+        token = token.replace('Bearer ', '')
+        user_data = get_user_from_token(token)
+        if not user_data:
+            return None
+        with DBSession() as db:
+            user = db.query(User).filter(User.id == user_data['user_id']).first()
+            return user
 
 # ==================== AUTH ENDPOINTS ====================
 
@@ -158,9 +180,16 @@ def get_strategies():
             return jsonify({'error': 'Unauthorized'}), 401
 
         with DBSession() as db:
+            count, latest = db.query(func.count(Strategy.id), func.max(Strategy.updated_at)).filter(
+                Strategy.user_id == user.id).one()
+            etag = http_cache.make_etag('strategies', user.id, count, latest)
+            cached = http_cache.not_modified(etag)
+            if cached:
+                return cached
+
             strategies = db.query(Strategy).filter(Strategy.user_id == user.id).all()
 
-            return jsonify([{
+            return http_cache.tag(jsonify([{
                 'id': s.id,
                 'name': s.name,
                 'description': s.description,
@@ -175,7 +204,7 @@ def get_strategies():
                 'losing_trades': s.losing_trades,
                 'total_profit': s.total_profit,
                 'created_at': s.created_at.isoformat() if s.created_at else None
-            } for s in strategies]), 200
+            } for s in strategies]), etag), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -190,6 +219,15 @@ def get_strategy(strategy_id):
             return jsonify({'error': 'Unauthorized'}), 401
 
         with DBSession() as db:
+            latest = db.query(Strategy.updated_at).filter(
+                Strategy.id == strategy_id,
+                Strategy.user_id == user.id
+            ).scalar()
+            etag = http_cache.make_etag('strategy', user.id, strategy_id, latest)
+            cached = http_cache.not_modified(etag) if latest else None
+            if cached:
+                return cached
+
             strategy = db.query(Strategy).filter(
                 Strategy.id == strategy_id,
                 Strategy.user_id == user.id
@@ -198,7 +236,7 @@ def get_strategy(strategy_id):
             if not strategy:
                 return jsonify({'error': 'Strategy not found'}), 404
 
-            return jsonify({
+            return http_cache.tag(jsonify({
                 'id': strategy.id,
                 'name': strategy.name,
                 'description': strategy.description,
@@ -212,7 +250,7 @@ def get_strategy(strategy_id):
                 'take_profit_pct': strategy.take_profit_pct,
                 'status': strategy.status.value,
                 'trading_mode': strategy.trading_mode.value
-            }), 200
+            }), etag), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -461,6 +499,8 @@ def trading_execute_buy():
         )
 
         return jsonify(result), 200
+    except risk_engine.RiskRejected as e:
+        return jsonify({'error': str(e), 'rule': e.rule}), 422
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -496,6 +536,27 @@ def trading_execute_sell():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/trading/basket', methods=['POST'])
+def trading_execute_basket():
+    """Several orders in one round trip: {"mode": "paper", "orders": [{"symbol", "side", "amount", ...}]}."""
+    try:
+        auth_header = request.headers.get('Authorization')
+        user = get_current_user(auth_header)
+        if not user:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        data = request.get_json()
+        engine = TradingEngine(user.id, data.get('exchange', 'gemini'))
+        result = engine.execute_basket(data.get('orders'), mode=data.get('mode', 'paper'))
+
+        return jsonify(result), 200 if result['success'] else 207
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except risk_engine.RiskRejected as e:
+        return jsonify({'error': str(e), 'rule': e.rule}), 422
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/trading/positions', methods=['GET'])
 def get_positions():
     try:
@@ -540,9 +601,14 @@ def get_trade_history():
         exchange = request.args.get('exchange', 'gemini')
         
         engine = TradingEngine(user.id, exchange)
+        etag = http_cache.make_etag('history', user.id, limit, engine.get_trade_history_version())
+        cached = http_cache.not_modified(etag)
+        if cached:
+            return cached
+
         history = engine.get_trade_history(limit=limit)
         
-        return jsonify({'trades': history}), 200
+        return http_cache.tag(jsonify({'trades': history}), etag), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -550,16 +616,72 @@ def get_trade_history():
 
 @app.route('/api/market/candles', methods=['GET'])
 def market_candles():
+    """Candles as JSON (default), columnar typed arrays or Arrow -- see candle_codec.
+
+    ?since=<ms> returns only bars at or after that open time (the chart's delta poll).
+    """
+    try:
+        mime = candle_codec.negotiate(request.headers.get('Accept'), request.args.get('format'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 406
     try:
         import market_proxy
         symbol = request.args.get('symbol', 'BTCUSDT')
         interval = request.args.get('interval', '1m')
         limit = int(request.args.get('limit', 500))
-        candles = market_proxy.fetch_candles(symbol, interval, limit)
-        return jsonify(candles), 200
+        since = request.args.get('since', type=int)
+        candles = market_proxy.fetch_candles(symbol, interval, limit, since=since)
+        if since is not None:
+            candles = [c for c in candles if c[0] >= since]
+        precision = request.args.get('precision', 32, type=int)
+
+        # Versioned by the bars themselves: the last (forming) bar changes on every trade.
+        etag = http_cache.make_etag('candles', symbol, interval, limit, since, mime, precision,
+                                    len(candles), candles[0][0] if candles else None,
+                                    list(candles[-1]) if candles else None)
+        cached = http_cache.not_modified(etag)
+        if cached:
+            cached.vary.add('Accept')
+            return cached
+
+        body = candle_codec.encode(candles, mime, precision=precision)
+        response = Response(body, status=200, mimetype=mime)
+        response.vary.add('Accept')
+        return http_cache.tag(response, etag)
     except Exception as e:
         return jsonify({'error': str(e)}), 502
 
+# ==================== TRACE VIEWER (admin) ====================
+
+@app.route('/api/traces', methods=['GET'])
+def list_traces():
+    try:
+        auth_header = request.headers.get('Authorization')
+        user = get_current_user(auth_header)
+        if not user or user.role != UserRole.ADMIN:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        limit = request.args.get('limit', 50, type=int)
+        slow_only = request.args.get('slow', '0') == '1'
+        return jsonify({'traces': tracing.recent_traces(limit=limit, slow_only=slow_only)}), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/traces/<request_id>', methods=['GET'])
+def get_trace(request_id):
+    try:
+        auth_header = request.headers.get('Authorization')
+        user = get_current_user(auth_header)
+        if not user or user.role != UserRole.ADMIN:
+            return jsonify({'error': 'Unauthorized'}), 401
+
+        trace = tracing.find_trace(request_id)
+        if not trace:
+            return jsonify({'error': 'Trace not found'}), 404
+        return jsonify(trace), 200
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ==================== HEALTH CHECK ====================
 
 @app.route('/api/health', methods=['GET'])
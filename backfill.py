@@ -0,0 +1,205 @@
+"""Parallel, resumable historical OHLCV backfill into candle_store.
+
+    python backfill.py BTCUSDT --since 2023-01-01                # 1m bars up to now
+    python backfill.py ETHUSDT --since 2024-06-01 --until 2025-01-01 --timeframe 5m
+    python backfill.py BTCUSDT --since 2023-01-01 --exchange coinbase --concurrency 4
+
+How it works:
+  - [since, until) is cut into pages of the exchange's maximum bars per request.
+    Each page gets its own `since` cursor, so pages are independent.
+  - Pages run concurrently on a thread pool, paced by one token bucket per
+    exchange at its ccxt rateLimit.
+  - Finished pages are flushed to the store in batches. Their cursors then go
+    into a checkpoint file next to the data, so a rerun skips them.
+  - After the main pass, the stored range is scanned for gaps and each gap is
+    refetched once. Ranges the exchange has no bars for (outages, listings) are
+    recorded as empty, so later runs don't retry them.
+
+Kraken's OHLC endpoint only serves its most recent 720 bars. Deep history
+therefore comes from binanceus/coinbase, which is the symbol index's default
+order anyway.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import metrics
+from candle_store import CandleStore, shared as default_store
+from resampler import timeframe_ms
+
+PAGE_LIMITS = {'binanceus': 1000, 'binance': 1000, 'coinbase': 300, 'kraken': 720}
+DEFAULT_PAGE_LIMIT = 500
+DEFAULT_CONCURRENCY = 8
+FLUSH_PAGES = 50          # pages buffered between store writes/checkpoints
+MAX_RETRIES = 5
+
+
+class RateLimiter:
+    """Spaces acquire() calls at least 1/rate seconds apart across threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate
+        self.next = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next, now)
+            self.next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Checkpoint:
+    """Page cursors already stored and ranges known to be empty, for one exchange/symbol/timeframe."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = set()
+        self.empty = []
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            self.done = set(data.get('done', []))
+            self.empty = [tuple(r) for r in data.get('empty', [])]
+        except (OSError, ValueError):
+            pass
+
+    def known_empty(self, gap) -> bool:
+        return any(lo <= gap[0] and gap[1] <= hi for lo, hi in self.empty)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({'done': sorted(self.done), 'empty': sorted(self.empty)}, f)
+        os.replace(tmp, self.path)
+
+
+def _to_ms(value) -> int:
+    if isinstance(value, (int, float)):
+        return int(value)
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _resolve(symbol: str, exchange: str = None):
+    import market_proxy
+    market = market_proxy.symbols().resolve(symbol, exchange=exchange, fallback=exchange is None)
+    if market is not None:
+        return market.exchange, market.symbol
+    if exchange is None:
+        raise Exception(f"no market data source lists {symbol}")
+    from trading_engine import TradingEngine
+    return exchange, TradingEngine._to_ccxt_symbol(symbol)
+
+
+def backfill(symbol: str, timeframe: str = '1m', since='2023-01-01', until=None, exchange: str = None,
+             concurrency: int = DEFAULT_CONCURRENCY, store: CandleStore = None, log=print) -> dict:
+    """Fill the store with `symbol` bars in [since, until). Safe to rerun: finished pages are skipped."""
+    import ccxt
+
+    store = store or default_store
+    started = time.perf_counter()
+    exid, ccxt_symbol = _resolve(symbol, exchange)
+    step, _ = timeframe_ms(timeframe)
+    start = -(-_to_ms(since) // step) * step
+    end = (_to_ms(until) if until else int(time.time() * 1000)) // step * step   # forming bar excluded
+    page = PAGE_LIMITS.get(exid, DEFAULT_PAGE_LIMIT)
+    span = page * step
+
+    checkpoint = Checkpoint(os.path.join(store.path(exid, symbol, timeframe), '_backfill.json'))
+    limiter = RateLimiter(1000.0 / getattr(ccxt, exid)().rateLimit)
+    local = threading.local()
+
+    def fetch(since_ms: int, until_ms: int) -> list:
+        if not hasattr(local, 'ex'):
+            local.ex = getattr(ccxt, exid)({'enableRateLimit': False})   # paced by the shared limiter
+        for attempt in range(MAX_RETRIES):
+            limiter.acquire()
+            try:
+                with metrics.upstream_call(exid, 'fetch_ohlcv'):
+                    rows = local.ex.fetch_ohlcv(ccxt_symbol, timeframe, since=since_ms, limit=page)
+                return [r for r in rows if since_ms <= r[0] < until_ms]
+            except (ccxt.NetworkError, ccxt.RateLimitExceeded):
+                if attempt == MAX_RETRIES - 1:
+                    raise
+                time.sleep(2 ** attempt)
+
+    def run(pages):
+        """Fetch [(since, until), ...] concurrently; flush every FLUSH_PAGES. Returns rows stored per page."""
+        got = {}
+        buffered, finished = [], []
+        with ThreadPoolExecutor(concurrency) as pool:
+            futures = {pool.submit(fetch, lo, hi): (lo, hi) for lo, hi in pages}
+            for future in as_completed(futures):
+                window = futures[future]
+                rows = future.result()
+                got[window] = len(rows)
+                buffered.extend(rows)
+                finished.append(window)
+                if len(finished) >= FLUSH_PAGES:
+                    flush(buffered, finished)
+                    log(f"  {exid} {symbol} {timeframe}: {len(got)}/{len(pages)} pages")
+            flush(buffered, finished)
+        return got
+
+    def flush(buffered, finished):
+        store.write(exid, symbol, timeframe, buffered)
+        # Only whole pages on the epoch-aligned grid are checkpointed, so a rerun with a
+        # different --since/--until still lines up and refetches the partial edges.
+        checkpoint.done.update(lo for lo, hi in finished if lo % span == 0 and hi - lo == span)
+        checkpoint.save()
+        buffered.clear()
+        finished.clear()
+
+    grid = range(start // span * span, end, span)
+    pages = [(max(lo, start), min(lo + span, end)) for lo in grid if lo not in checkpoint.done]
+    log(f"⏬ {exid} {ccxt_symbol} {timeframe}: {len(pages)} pages to fetch "
+        f"({len(grid) - len(pages)} already stored)")
+    fetched = run(pages)
+
+    gaps = [g for g in store.gaps(exid, symbol, timeframe, start, end) if not checkpoint.known_empty(g)]
+    refetch = [(lo, min(lo + span, hi)) for g_lo, hi in gaps for lo in range(g_lo, hi, span)]
+    refilled = run(refetch) if refetch else {}
+    for gap in gaps:
+        if not any(n for (lo, hi), n in refilled.items() if gap[0] <= lo < gap[1]):
+            checkpoint.empty.append(gap)
+    checkpoint.save()
+
+    report = {
+        'exchange': exid, 'symbol': ccxt_symbol, 'timeframe': timeframe,
+        'pages': len(pages), 'rows': sum(fetched.values()) + sum(refilled.values()),
+        'gaps_found': len(gaps), 'gaps_empty': len(checkpoint.empty),
+        'stored_rows': len(store.read(exid, symbol, timeframe, start, end)),
+        'seconds': round(time.perf_counter() - started, 1),
+    }
+    log(f"✅ {report['stored_rows']} bars stored in {report['seconds']}s "
+        f"({report['gaps_found']} gaps refetched, {report['gaps_empty']} known empty)")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('symbol')
+    parser.add_argument('--timeframe', default='1m')
+    parser.add_argument('--since', required=True, help='ISO date/time (UTC) or epoch ms')
+    parser.add_argument('--until', help='ISO date/time (UTC) or epoch ms; defaults to now')
+    parser.add_argument('--exchange', help='defaults to the first exchange listing the symbol')
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY)
+    args = parser.parse_args()
+    if os.environ.get('EXCHANGE_SIM'):
+        import exchange_sim
+        exchange_sim.install_from_env()
+    backfill(args.symbol, args.timeframe, args.since, args.until, args.exchange, args.concurrency)
+
+
+if __name__ == '__main__':
+    main()
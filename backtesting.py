@@ -1,13 +1,18 @@
-﻿import pandas as pd
+﻿import heapq
+import itertools
+import sys
+from collections import deque
+import pandas as pd
 import numpy as np
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, NamedTuple, Optional
 from dataclasses import dataclass
 from enum import Enum
 
 class OrderType(Enum):
     MARKET = "market"
     LIMIT = "limit"
+    STOP = "stop"
 
 class OrderSide(Enum):
     BUY = "buy"
@@ -24,6 +29,8 @@ class Trade:
     pnl: float = 0.0
     pnl_pct: float = 0.0
     fees: float = 0.0
+    exit_reason: Optional[str] = None
+    symbol: Optional[str] = None
     
     def close(self, exit_time: datetime, exit_price: float, fee_pct: float = 0.001):
         self.exit_time = exit_time
@@ -133,16 +140,475 @@ class BacktestEngine:
         print(f"  Sharpe Ratio:   {stats['sharpe_ratio']:.2f}")
         print("\n" + "="*60)
 
-def simple_ma_crossover_strategy(df: pd.DataFrame, fast_period: int = 10, slow_period: int = 30) -> pd.DataFrame:
+def simple_ma_crossover_strategy(df: pd.DataFrame, fast_period: int = 10, slow_period: int = 30, series_key=None, stored_series=None,
+                                 registry=None) -> pd.DataFrame:
+    """Pass series_key (e.g. (exchange, pair, timeframe)) to share the MAs with other strategies on the same series,
+    through `registry` (an IndicatorRegistry; the process-wide indicators.shared by default).
+
+    Pass stored_series=(exchange, pair, timeframe) when df was read from the candle store to load the MAs
+    precomputed from feature_store instead.
+    """
     df = df.copy()
-    df['ma_fast'] = df['close'].rolling(window=fast_period).mean()
-    df['ma_slow'] = df['close'].rolling(window=slow_period).mean()
+    if stored_series is not None:
+        from feature_store import shared as features
+        from indicators import spec
+        features.attach(df, *stored_series, {'ma_fast': spec('sma', period=fast_period), 'ma_slow': spec('sma', period=slow_period)})
+    elif series_key is not None:
+        from indicators import shared, spec
+        (registry or shared).apply(series_key, df, {'ma_fast': spec('sma', period=fast_period), 'ma_slow': spec('sma', period=slow_period)})
+    else:
+        df['ma_fast'] = df['close'].rolling(window=fast_period).mean()
+        df['ma_slow'] = df['close'].rolling(window=slow_period).mean()
     df['signal'] = 0
     df.loc[df['ma_fast'] > df['ma_slow'], 'signal'] = 1
     df.loc[df['ma_fast'] < df['ma_slow'], 'signal'] = -1
     df['position'] = df['signal'].diff()
     return df
 
+TOUCH_BLOCK = 64         # bars per block in first_touch()'s block-minimum index
+TOUCH_QUERY_CHUNK = 16384
+
+def _block_minima(values: np.ndarray):
+    """values padded to whole blocks, and a sparse table where level l holds min(blocks[b:b + 2**l])."""
+    n_blocks = max(1, -(-len(values) // TOUCH_BLOCK))
+    padded = np.full(n_blocks * TOUCH_BLOCK, np.inf)
+    padded[:len(values)] = values
+    table = [padded.reshape(n_blocks, TOUCH_BLOCK).min(axis=1)]
+    while (1 << len(table)) <= n_blocks:
+        prev, step = table[-1], 1 << (len(table) - 1)
+        table.append(np.minimum(prev[:-step], prev[step:]))
+    return padded, table
+
+def first_touch(values, starts, ends, levels, above: bool = False) -> np.ndarray:
+    """For each query i, the first index k in [starts[i], ends[i]) with values[k] <= levels[i]
+    (values[k] >= levels[i] when above=True), or -1.
+
+    All queries are answered together. The rest of each start block is scanned directly; a
+    sparse table over block minima then jumps to the first later block that can hold a touch,
+    and that block is scanned for the bar. A query costs O(TOUCH_BLOCK + log(n / TOUCH_BLOCK))
+    however long its window is. NaN levels never touch.
+    """
+    sign = -1.0 if above else 1.0
+    padded, table = _block_minima(sign * np.asarray(values, dtype=float))
+    levels = sign * np.asarray(levels, dtype=float)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.minimum(np.asarray(ends, dtype=np.int64), len(values))
+    offsets = np.arange(TOUCH_BLOCK)
+    result = np.full(len(starts), -1, dtype=np.int64)
+
+    def scan(block, lo, hi, level):
+        idx = block[:, None] * TOUCH_BLOCK + offsets
+        hits = (padded[idx] <= level[:, None]) & (idx >= lo[:, None]) & (idx < hi[:, None])
+        return np.where(hits.any(axis=1), idx[:, 0] + hits.argmax(axis=1), -1)
+
+    for q in range(0, len(starts), TOUCH_QUERY_CHUNK):
+        sl = slice(q, q + TOUCH_QUERY_CHUNK)
+        lo, hi, level = starts[sl], ends[sl], levels[sl]
+        live = lo < hi
+        first = np.where(live, lo // TOUCH_BLOCK, 0)
+        found = np.where(live, scan(first, lo, hi, level), -1)
+        # Jump whole blocks whose minimum is above the level, up to the block holding hi - 1.
+        pos, last = first + 1, -(-hi // TOUCH_BLOCK)
+        todo = (found < 0) & live & (pos < last)
+        for l in range(len(table) - 1, -1, -1):
+            step, mins = 1 << l, table[l]
+            jump = todo & (pos + step <= last)
+            jump[jump] = mins[pos[jump]] > level[jump]
+            pos = np.where(jump, pos + step, pos)
+        todo &= pos < last
+        if todo.any():
+            found[todo] = scan(pos[todo], lo[todo], hi[todo], level[todo])
+        result[sl] = found
+    return result
+
+def bracket_exits(open_, high, low, entry_bars, starts, ends, stop_prices=None, targets=(),
+                  target_reason: str = 'take_profit'):
+    """Stop/target exits for many candidate trades at once, with no per-bar loop.
+
+    Trade i is watched over bars [starts[i], ends[i]). It is stopped on the first bar whose
+    low reaches stop_prices[i] (NaN for no stop). `targets` is a list of
+    (first_offset, end_offset, prices): from first_offset to end_offset bars after
+    entry_bars[i] the target is prices[i], reached when the bar's high gets there. Several
+    entries describe a stepped target such as a minimal_roi table.
+
+    Fills: on the entry bar itself a level fills at its price; on later bars a gap through
+    the level fills at the open. If one bar reaches both the stop and a target, the stop
+    wins. OHLC can't tell which came first, so the worse fill is assumed.
+
+    Returns (bars, prices, reasons); bars is -1 where neither level is reached.
+    """
+    entry_bars = np.asarray(entry_bars, dtype=np.int64)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    bars = np.full(len(entry_bars), -1, dtype=np.int64)
+    prices = np.full(len(entry_bars), np.nan)
+    reasons = np.full(len(entry_bars), None, dtype=object)
+
+    target_bars = np.full(len(entry_bars), -1, dtype=np.int64)
+    target_prices = np.full(len(entry_bars), np.nan)
+    for first_offset, end_offset, level in targets:
+        lo = np.maximum(starts, entry_bars + first_offset)
+        hi = np.minimum(ends, entry_bars + end_offset)
+        hit = first_touch(high, lo, hi, level, above=True)
+        better = (hit >= 0) & ((target_bars < 0) | (hit < target_bars))
+        target_bars[better] = hit[better]
+        target_prices[better] = np.asarray(level, dtype=float)[better]
+    hit = target_bars >= 0
+    bars[hit] = target_bars[hit]
+    prices[hit] = np.where(target_bars[hit] > entry_bars[hit],
+                           np.maximum(open_[target_bars[hit]], target_prices[hit]), target_prices[hit])
+    reasons[hit] = target_reason
+
+    if stop_prices is not None:
+        stop_prices = np.asarray(stop_prices, dtype=float)
+        stop_bars = first_touch(low, starts, np.where(hit, target_bars + 1, ends), stop_prices)
+        hit = stop_bars >= 0
+        bars[hit] = stop_bars[hit]
+        prices[hit] = np.where(stop_bars[hit] > entry_bars[hit],
+                               np.minimum(open_[stop_bars[hit]], stop_prices[hit]), stop_prices[hit])
+        reasons[hit] = 'stop_loss'
+    return bars, prices, reasons
+
+def chain_trades(entry_bars, entry_prices, exit_bars, exit_prices, reasons) -> List[tuple]:
+    """Pick the trades actually taken from per-candidate exits: one position at a time, so after
+    each exit the next trade is the first candidate entering after the exit bar."""
+    trades = []
+    i = 0
+    while i < len(entry_bars):
+        trades.append((int(entry_bars[i]), float(entry_prices[i]), int(exit_bars[i]),
+                       float(exit_prices[i]), reasons[i]))
+        i = np.searchsorted(entry_bars, exit_bars[i], side='right')
+    return trades
+
+def replay_trades(engine: BacktestEngine, timestamps: List[datetime], close: np.ndarray, trades: List[tuple], stake: Optional[float] = None, risk_pct: float = 2.0) -> BacktestEngine:
+    """Book precomputed long trades on `engine` and build its equity curve without a per-bar loop.
+
+    `trades` is a sorted, non-overlapping list of (entry_idx, entry_price, exit_idx, exit_price, reason).
+    Size is `stake / entry_price` when a quote-currency stake is given, otherwise risk_pct of capital.
+    The equity curve matches calling update_equity() on every bar; an 'end_of_data' exit is booked
+    after the last bar's equity, as run_backtest_example() does.
+    """
+    n = len(close)
+    capital = np.empty(n)
+    size_held = np.zeros(n)
+    entry_held = np.zeros(n)
+    last = 0
+    for entry_idx, entry_price, exit_idx, exit_price, reason in trades:
+        capital[last:entry_idx] = engine.capital
+        size = stake / entry_price if stake else None
+        if not engine.open_position(timestamps[entry_idx], entry_price, OrderSide.BUY, size=size, risk_pct=risk_pct):
+            last = entry_idx
+            continue
+        hold_end = exit_idx + 1 if reason == 'end_of_data' else exit_idx
+        capital[entry_idx:hold_end] = engine.capital
+        size_held[entry_idx:hold_end] = engine.positions[0].size
+        entry_held[entry_idx:hold_end] = entry_price
+        engine.close_position(timestamps[exit_idx], exit_price)
+        engine.closed_trades[-1].exit_reason = reason
+        last = hold_end
+    capital[last:] = engine.capital
+    engine.equity_curve = (capital + (close - entry_held) * size_held).tolist()
+    engine.timestamps = list(timestamps)
+    return engine
+
+def run_signal_backtest(df: pd.DataFrame, initial_capital: float = 10000, fee_pct: float = 0.001, risk_pct: float = 10,
+                        stop_loss_pct: Optional[float] = None, take_profit_pct: Optional[float] = None) -> BacktestEngine:
+    """Vectorized equivalent of run_backtest_example()'s loop for a frame from simple_ma_crossover_strategy().
+
+    stop_loss_pct/take_profit_pct (percent of entry, as stored on Strategy) also close a position
+    on the first bar after entry whose low/high reaches the level, including the exit signal's own
+    bar. Fills and the both-touched rule are bracket_exits()'s.
+    """
+    position = df['position'].to_numpy()
+    close = df['close'].to_numpy(dtype=float)
+    n = len(close)
+    entries = np.flatnonzero(position == 2)
+    exits = np.flatnonzero(position == -2)
+    k = np.searchsorted(exits, entries, side='right')
+    exit_bars = np.append(exits, n - 1)[k]
+    exit_prices = close[exit_bars]
+    reasons = np.where(k < len(exits), 'exit_signal', 'end_of_data').astype(object)
+    if stop_loss_pct or take_profit_pct:
+        entry_prices = close[entries]
+        stops = entry_prices * (1 - stop_loss_pct / 100) if stop_loss_pct else None
+        targets = [(0, n, entry_prices * (1 + take_profit_pct / 100))] if take_profit_pct else []
+        bars, prices, why = bracket_exits(df['open'].to_numpy(dtype=float), df['high'].to_numpy(dtype=float),
+                                          df['low'].to_numpy(dtype=float), entries, entries + 1, exit_bars + 1,
+                                          stops, targets)
+        hit = bars >= 0
+        exit_bars, exit_prices, reasons = np.where(hit, bars, exit_bars), np.where(hit, prices, exit_prices), np.where(hit, why, reasons)
+    trades = chain_trades(entries, close[entries], exit_bars, exit_prices, reasons)
+    engine = BacktestEngine(initial_capital=initial_capital, fee_pct=fee_pct, max_positions=1)
+    return replay_trades(engine, df['timestamp'].tolist(), close, trades, risk_pct=risk_pct)
+
+class Bar(NamedTuple):
+    index: int
+    timestamp: datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+@dataclass
+class Order:
+    id: int
+    side: OrderSide
+    type: OrderType
+    size: float
+    price: Optional[float] = None
+    placed_bar: int = 0
+    expires_bar: Optional[int] = None
+    tag: Optional[str] = None
+    filled: float = 0.0
+    avg_price: float = 0.0
+    status: str = 'open'         # open, triggered, filled, cancelled, expired, rejected
+
+    @property
+    def remaining(self) -> float:
+        return self.size - self.filled
+
+    @property
+    def active(self) -> bool:
+        return self.status in ('open', 'triggered')
+
+class EventBacktest(BacktestEngine):
+    """Bar-by-bar backtest with resting limit and stop orders.
+
+    Each bar runs the same steps in order:
+      1. orders whose ttl has run out expire,
+      2. sells, then buys, fill: triggered stops and market orders first, then
+         limits and newly crossed stops by price priority (time priority at one price),
+      3. equity is marked at the close,
+      4. on_bar(engine, bar) runs and may submit() or cancel() orders. They are
+         live from the next bar, so a strategy never trades on the bar it decided on.
+
+    Orders submitted from on_fill go live after the current bar's fills, like any other.
+
+    Fills: a limit fills at its price, or at the open if the bar gapped through it.
+    A stop triggers when the bar reaches it and fills like a market order at its
+    price, or at the open on a gap. Market orders fill at the open. With volume_pct,
+    each side fills at most that share of the bar's volume. The rest stays working
+    and continues next bar; triggered stops and market orders fill at the next open.
+
+    Resting orders sit in per-side, per-type price heaps, so a bar only pops the
+    orders it crosses. Expiry has its own heap, and cancels are lazy. The cost of a
+    bar grows with its fills, not with the number of resting orders.
+
+    Positions are long only. Each buy fill opens a lot; sells close lots FIFO, splitting
+    the last one if needed. A sell needs a position to fill, and waits until there is
+    one. A buy fill is cut to the cash available, and rejected if there is none. Lots still
+    open after the last bar are closed at its close with reason 'end_of_data'.
+
+    Booking is plain cash accounting rather than the base engine's: a buy pays
+    price * size plus its fee, a sell receives price * size less its fee, and equity is
+    cash plus the open lots marked at the close.
+    """
+
+    def __init__(self, initial_capital: float = 10000, fee_pct: float = 0.001, volume_pct: Optional[float] = 10.0):
+        super().__init__(initial_capital=initial_capital, fee_pct=fee_pct, max_positions=sys.maxsize)
+        self.volume_pct = volume_pct
+        self.orders: Dict[int, Order] = {}
+        self.fills: List[tuple] = []        # (bar index, order id, side, price, size)
+        self.bar: Optional[Bar] = None
+        self._ids = itertools.count(1)
+        self._seq = itertools.count()
+        # (side, type) -> heap of (priority, seq, order); most aggressive price on top
+        self._resting = {key: [] for key in itertools.product(OrderSide, (OrderType.LIMIT, OrderType.STOP))}
+        self._queued = {side: deque() for side in OrderSide}   # triggered stops and market orders, FIFO
+        self._expiry = []                                      # (expires_bar, seq, order)
+        self._deferred = None         # orders submitted from on_fill, activated after the bar's fills
+        self.on_fill = None
+
+    # ---- orders ----------------------------------------------------------
+
+    def submit(self, side: OrderSide, size: float, price: Optional[float] = None,
+               order_type: OrderType = OrderType.LIMIT, ttl: Optional[int] = None, tag: Optional[str] = None) -> Order:
+        """Place an order, live from the next bar for ttl bars (None: good till cancelled)."""
+        if size <= 0:
+            raise ValueError("size must be positive")
+        if order_type != OrderType.MARKET and price is None:
+            raise ValueError(f"{order_type.value} orders need a price")
+        placed = self.bar.index if self.bar is not None else -1
+        order = Order(id=next(self._ids), side=side, type=order_type, size=size, price=price, placed_bar=placed,
+                      expires_bar=placed + ttl if ttl is not None else None, tag=tag)
+        self.orders[order.id] = order
+        if self._deferred is not None:
+            self._deferred.append(order)
+        else:
+            self._activate(order)
+        return order
+
+    def _activate(self, order: Order):
+        if order.type == OrderType.MARKET:
+            order.status = 'triggered'
+            self._queued[order.side].append(order)
+        else:
+            heapq.heappush(self._resting[(order.side, order.type)], (self._priority(order), next(self._seq), order))
+        if order.expires_bar is not None:
+            heapq.heappush(self._expiry, (order.expires_bar, next(self._seq), order))
+
+    def cancel(self, order_id: int) -> bool:
+        order = self.orders.get(order_id)
+        if order is None or not order.active:
+            return False
+        order.status = 'cancelled'      # dropped from its heap when it reaches the top
+        return True
+
+    @staticmethod
+    def _priority(order: Order) -> float:
+        # Buy limits and sell stops are crossed from above (highest price first),
+        # sell limits and buy stops from below (lowest first).
+        crossed_from_above = (order.side == OrderSide.BUY) == (order.type == OrderType.LIMIT)
+        return -order.price if crossed_from_above else order.price
+
+    @staticmethod
+    def _crossed(order: Order, bar: Bar) -> bool:
+        if (order.side == OrderSide.BUY) == (order.type == OrderType.LIMIT):
+            return bar.low <= order.price
+        return bar.high >= order.price
+
+    @staticmethod
+    def _fill_price(order: Order, bar: Bar, triggered_now: bool) -> float:
+        if order.type == OrderType.MARKET or (order.type == OrderType.STOP and not triggered_now):
+            return bar.open
+        if (order.side == OrderSide.BUY) == (order.type == OrderType.LIMIT):
+            return min(bar.open, order.price)
+        return max(bar.open, order.price)
+
+    # ---- simulation ------------------------------------------------------
+
+    def run(self, df: pd.DataFrame, on_bar: Callable[['EventBacktest', Bar], None],
+            on_fill: Optional[Callable[['EventBacktest', Order, float, float], None]] = None) -> 'EventBacktest':
+        """Simulate over df (timestamp, open, high, low, close, volume). on_fill(engine, order, price, size)
+        runs after every fill."""
+        self.on_fill = on_fill or self.on_fill
+        timestamps = df['timestamp'].tolist()
+        columns = [df[c].to_numpy(dtype=float).tolist() for c in ('open', 'high', 'low', 'close', 'volume')]
+        for i, (ts, o, h, l, c, v) in enumerate(zip(timestamps, *columns)):
+            bar = self.bar = Bar(i, ts, o, h, l, c, v)
+            while self._expiry and self._expiry[0][0] < i:
+                order = heapq.heappop(self._expiry)[2]
+                if order.active:
+                    order.status = 'expired'
+            self._deferred = []
+            for side in (OrderSide.SELL, OrderSide.BUY):
+                budget = v * self.volume_pct / 100 if self.volume_pct is not None else float('inf')
+                budget = self._fill_queued(side, bar, budget)
+                self._fill_resting(side, bar, budget)
+            deferred, self._deferred = self._deferred, None
+            for order in deferred:
+                self._activate(order)
+            self.update_equity(ts, c)
+            on_bar(self, bar)
+        if self.positions and self.bar is not None:
+            while self.positions:
+                self.close_position(self.bar.timestamp, self.bar.close)
+                self.closed_trades[-1].exit_reason = 'end_of_data'
+        return self
+
+    def _fill_queued(self, side: OrderSide, bar: Bar, budget: float) -> float:
+        queue, waiting = self._queued[side], []
+        while queue and budget > 0:
+            order = queue.popleft()
+            if not order.active:
+                continue
+            budget -= self._fill(order, bar, self._fill_price(order, bar, False), budget)
+            if order.active:
+                waiting.append(order)
+        queue.extendleft(reversed(waiting))
+        return budget
+
+    def _fill_resting(self, side: OrderSide, bar: Bar, budget: float):
+        # Stops and limits of one side compete for the same volume; take whichever heap
+        # top is crossed, stops first, until neither is or the volume runs out.
+        stops, limits = self._resting[(side, OrderType.STOP)], self._resting[(side, OrderType.LIMIT)]
+        parked = []
+        while budget > 0:
+            heap = None
+            for candidate in (stops, limits):
+                while candidate and not candidate[0][2].active:
+                    heapq.heappop(candidate)
+                if candidate and self._crossed(candidate[0][2], bar):
+                    heap = candidate
+                    break
+            if heap is None:
+                break
+            entry = heapq.heappop(heap)
+            order = entry[2]
+            if order.type == OrderType.STOP:
+                order.status = 'triggered'
+            filled = self._fill(order, bar, self._fill_price(order, bar, True), budget)
+            budget -= filled
+            if order.active:
+                if order.type == OrderType.STOP:
+                    self._queued[side].append(order)
+                elif filled:
+                    heapq.heappush(heap, entry)       # volume ran out; keeps its place
+                    break
+                else:
+                    parked.append((heap, entry))      # a sell with nothing to sell yet
+        for heap, entry in parked:
+            heapq.heappush(heap, entry)
+
+    def _fill(self, order: Order, bar: Bar, price: float, budget: float) -> float:
+        """Fill as much of order as budget, cash and position allow; returns the size filled."""
+        size = min(order.remaining, budget)
+        if order.side == OrderSide.BUY:
+            size = min(size, self.capital / (price * (1 + self.fee_pct)))
+            if size <= 0:
+                order.status = 'rejected'
+                return 0.0
+            self.open_position(bar.timestamp, price, OrderSide.BUY, size=size)
+        else:
+            size = min(size, sum(t.size for t in self.positions))
+            if size <= 0:
+                return 0.0
+            self._close_lots(bar.timestamp, price, size, order.tag or f'{order.type.value}_order')
+        order.avg_price = (order.avg_price * order.filled + price * size) / (order.filled + size)
+        order.filled += size
+        if order.remaining <= 1e-12:
+            order.status = 'filled'
+        self.fills.append((bar.index, order.id, order.side, price, size))
+        if self.on_fill is not None:
+            self.on_fill(self, order, price, size)
+        return size
+
+    def _close_lots(self, timestamp: datetime, price: float, size: float, reason: str):
+        while size > 1e-12 and self.positions:
+            lot = self.positions[0]
+            if lot.size > size:
+                lot.size -= size
+                self.positions.insert(0, Trade(entry_time=lot.entry_time, entry_price=lot.entry_price, exit_time=None,
+                                               exit_price=None, side=lot.side, size=size))
+            size -= self.positions[0].size
+            self.close_position(timestamp, price)
+            self.closed_trades[-1].exit_reason = reason
+
+    # ---- booking ---------------------------------------------------------
+
+    def open_position(self, timestamp: datetime, price: float, side: OrderSide, size: Optional[float] = None,
+                      risk_pct: float = 2.0):
+        if size is None:
+            size = self.capital * (risk_pct / 100) / price
+        self.positions.append(Trade(entry_time=timestamp, entry_price=price, exit_time=None, exit_price=None,
+                                    side=side, size=size))
+        self.capital -= price * size * (1 + self.fee_pct)
+        return True
+
+    def close_position(self, timestamp: datetime, price: float, position_idx: int = 0):
+        if position_idx >= len(self.positions):
+            return False
+        trade = self.positions.pop(position_idx)
+        trade.close(timestamp, price, self.fee_pct)
+        self.capital += price * trade.size * (1 - self.fee_pct)
+        self.closed_trades.append(trade)
+        return True
+
+    def update_equity(self, timestamp: datetime, current_price: float):
+        self.equity_curve.append(self.capital + sum(t.size for t in self.positions) * current_price)
+        self.timestamps.append(timestamp)
+
 def run_backtest_example():
     from market_data import MarketDataProvider
     print("🔄 Fetching historical data...")
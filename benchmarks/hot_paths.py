@@ -0,0 +1,288 @@
+"""Reproducible benchmarks for the platform's hot paths.
+
+Seeds synthetic data (candles, users, trades) into a scratch database, stubs
+the exchange so nothing touches the network, and times each hot path:
+
+  backtest_per_bar         BacktestEngine open/close/update_equity loop
+  get_stats                BacktestEngine.get_stats() on a finished run
+  ma_crossover             simple_ma_crossover_strategy() over the candle set
+  signal_backtest          run_signal_backtest() on the crossover signals, signal exits only
+  signal_backtest_sl_tp    the same with stop_loss_pct/take_profit_pct (intrabar exits)
+  api_market_candles       GET /api/market/candles (stubbed upstream)
+  paper_round_trip         TradingEngine.execute_buy + execute_sell (paper)
+  get_current_user         token decode + user lookup
+  api_auth_login           POST /api/auth/login (bcrypt verify)
+  get_trade_history        TradingEngine.get_trade_history() on a large trades table
+
+Usage (from the repo root):
+
+    python benchmarks/hot_paths.py                       # small scale, scratch SQLite
+    python benchmarks/hot_paths.py --scale full          # 2M candles, 1M trades, 5k users
+    python benchmarks/hot_paths.py --database-url postgresql://localhost/prismtrade_bench --reset
+    python benchmarks/hot_paths.py --save                # write benchmarks/baselines/<db>-<scale>.json
+
+Seeding drops and recreates every table, so --database-url also needs --reset:
+point it only at a database you can throw away.
+
+Each run compares against the saved baseline for the same database and scale,
+if there is one. Baselines are plain JSON with rounded numbers, so a
+regression shows up as a readable diff.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+
+SCALES = {
+    'small': {'candles': 200_000, 'users': 200, 'trades': 50_000, 'iterations': 200},
+    'full': {'candles': 2_000_000, 'users': 5_000, 'trades': 1_000_000, 'iterations': 1_000},
+}
+
+
+# ---- timing ----------------------------------------------------------------
+
+def measure(fn, iterations: int, warmup: int = 3) -> dict:
+    """Call fn() `iterations` times; latency percentiles in ms and throughput in calls/s."""
+    for _ in range(warmup):
+        fn()
+    latencies = np.empty(iterations)
+    started = time.perf_counter()
+    for i in range(iterations):
+        t = time.perf_counter()
+        fn()
+        latencies[i] = time.perf_counter() - t
+    total = time.perf_counter() - started
+    return {
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / total, 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'mean_ms': round(float(latencies.mean()) * 1000, 3),
+    }
+
+
+# ---- synthetic data --------------------------------------------------------
+
+def synthetic_candles(n: int, seed: int = 42, start_ms: int = 1_600_000_000_000, step_ms: int = 60_000):
+    """[[ms, o, h, l, c, v], ...]-shaped ndarray following a random walk."""
+    rng = np.random.default_rng(seed)
+    close = 30000 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    open_ = np.concatenate(([close[0]], close[:-1]))
+    spread = np.abs(rng.normal(0, 0.0005, n))
+    high = np.maximum(open_, close) * (1 + spread)
+    low = np.minimum(open_, close) * (1 - spread)
+    volume = rng.gamma(2.0, 5.0, n)
+    ts = start_ms + np.arange(n, dtype=np.int64) * step_ms
+    return np.column_stack([ts, open_, high, low, close, volume])
+
+
+def is_scratch_url(url: str) -> bool:
+    """True for an in-memory SQLite URL or a SQLite file under the temp directory."""
+    if not url.startswith('sqlite:'):
+        return False
+    path = url.split(':///', 1)[1] if ':///' in url else ''
+    if path in ('', ':memory:'):
+        return True
+    tmp = os.path.realpath(tempfile.gettempdir())
+    return os.path.realpath(path).startswith(tmp + os.sep)
+
+
+def seed_database(n_users: int, n_trades: int, password: str, reset: bool = False):
+    """Bulk-insert users and closed LIVE trades. Returns the id of the benchmark user.
+
+    Drops every table first, so it refuses anything but a scratch SQLite file
+    under the temp directory unless reset is True.
+    """
+    from datetime import datetime, timedelta
+    from sqlalchemy import insert
+    from auth import hash_password
+    from database import engine, init_db
+    from models import Base, Trade, TradeStatus, TradingMode, User
+
+    if not reset and not is_scratch_url(os.environ.get('DATABASE_URL', '')):
+        raise RuntimeError('refusing to drop the tables of a non-scratch database without reset=True')
+    Base.metadata.drop_all(bind=engine)
+    init_db()
+    # One bcrypt hash shared by every user: hashing thousands would dominate seeding.
+    password_hash = hash_password(password)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'username': f'bench{i}', 'email': f'bench{i}@example.com', 'password_hash': password_hash,
+             'paper_balance': 1e12, 'live_balance': 0.0, 'max_open_trades': 3, 'risk_per_trade': 2.0,
+             'created_at': now}
+            for i in range(n_users)])
+
+    rng = np.random.default_rng(7)
+    user_ids = rng.integers(1, n_users + 1, n_trades)
+    user_ids[: n_trades // 10] = 1    # user 1 is the heavy hitter read by get_trade_history
+    entry = 30000 * np.exp(rng.normal(0, 0.1, n_trades))
+    exit_ = entry * np.exp(rng.normal(0, 0.02, n_trades))
+    amount = rng.uniform(0.001, 0.1, n_trades)
+    chunk = 50_000
+    with engine.begin() as conn:
+        for start in range(0, n_trades, chunk):
+            rows = []
+            for i in range(start, min(start + chunk, n_trades)):
+                entry_time = now - timedelta(minutes=int(i))
+                rows.append({
+                    'user_id': int(user_ids[i]), 'trading_pair': 'BTCUSDT', 'side': 'buy',
+                    'entry_price': float(entry[i]), 'entry_amount': float(amount[i]),
+                    'entry_time': entry_time, 'exit_price': float(exit_[i]), 'exit_amount': float(amount[i]),
+                    'exit_time': entry_time + timedelta(minutes=5),
+                    'profit_loss': float((exit_[i] - entry[i]) * amount[i]), 'profit_loss_pct': 0.0,
+                    'fees': 0.0, 'status': TradeStatus.CLOSED.name, 'trading_mode': TradingMode.LIVE.name,
+                    'exit_reason': 'bench', 'created_at': entry_time, 'updated_at': entry_time,
+                })
+            conn.execute(insert(Trade.__table__), rows)
+    return 1
+
+
+# ---- benchmarks ------------------------------------------------------------
+
+def run(scale: str, reset: bool = False) -> dict:
+    import pandas as pd
+    import market_proxy
+    from backtesting import BacktestEngine, OrderSide, run_signal_backtest, simple_ma_crossover_strategy
+    from trading_engine import TradingEngine
+
+    cfg = SCALES[scale]
+    iterations = cfg['iterations']
+    candles = synthetic_candles(cfg['candles'])
+
+    # Stubbed exchange: market_proxy serves the synthetic candles, no network.
+    candle_rows = candles.tolist()
+    market_proxy.fetch_candles = lambda symbol, timeframe='1m', limit=500, since=None: candle_rows[-limit:]
+    market_proxy.fetch_last_price = lambda symbol: float(candles[-1, 4])
+
+    password = 'bench-password'
+    started = time.perf_counter()
+    user_id = seed_database(cfg['users'], cfg['trades'], password, reset)
+    seed_s = time.perf_counter() - started
+
+    import app as app_module
+    from auth import create_access_token
+    client = app_module.app.test_client()
+    token = 'Bearer ' + create_access_token({'sub': str(user_id)})
+
+    results = {}
+    df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+
+    # BacktestEngine per-bar cost: the loop from run_backtest_example, timed per bar.
+    signals = simple_ma_crossover_strategy(df.iloc[:50_000])
+    position = signals['position'].to_numpy()
+    close = signals['close'].to_numpy()
+    stamps = signals['timestamp'].tolist()
+
+    def backtest_loop():
+        engine = BacktestEngine(initial_capital=10000, fee_pct=0.001, max_positions=1)
+        for i in range(len(close)):
+            if position[i] == 2 and engine.can_open_position():
+                engine.open_position(stamps[i], close[i], OrderSide.BUY, risk_pct=10)
+            elif position[i] == -2 and engine.positions:
+                engine.close_position(stamps[i], close[i])
+            engine.update_equity(stamps[i], close[i])
+        return engine
+
+    loop = measure(backtest_loop, iterations=5, warmup=1)
+    loop['per_bar_us'] = round(loop['mean_ms'] * 1000 / len(close), 3)
+    results['backtest_per_bar'] = loop
+
+    finished = backtest_loop()
+    results['get_stats'] = measure(finished.get_stats, iterations=max(10, iterations // 10))
+    results['ma_crossover'] = measure(lambda: simple_ma_crossover_strategy(df), iterations=5, warmup=1)
+    results['ma_crossover']['bars'] = len(df)
+    crossover = simple_ma_crossover_strategy(df)
+    results['signal_backtest'] = measure(lambda: run_signal_backtest(crossover), iterations=5, warmup=1)
+    results['signal_backtest_sl_tp'] = measure(
+        lambda: run_signal_backtest(crossover, stop_loss_pct=2.0, take_profit_pct=4.0), iterations=5, warmup=1)
+
+    results['api_market_candles'] = measure(
+        lambda: client.get('/api/market/candles?symbol=BTCUSDT&interval=1m&limit=500'), iterations)
+
+    engine = TradingEngine(user_id, 'binance')
+
+    def paper_round_trip():
+        engine.execute_buy('BTCUSDT', 0.01, mode='paper', price=30000.0)
+        engine.execute_sell('BTCUSDT', 0.01, mode='paper', price=30010.0)
+
+    results['paper_round_trip'] = measure(paper_round_trip, iterations)
+    results['get_current_user'] = measure(lambda: app_module.get_current_user(token), iterations)
+    results['api_auth_login'] = measure(
+        lambda: client.post('/api/auth/login', json={'username': 'bench1', 'password': password}),
+        iterations=max(10, iterations // 20))
+    results['get_trade_history'] = measure(lambda: engine.get_trade_history(limit=50), iterations)
+
+    return {'seed_seconds': round(seed_s, 2), 'results': results}
+
+
+def compare(current: dict, baseline: dict):
+    print(f"\n{'path':<22}{'p50 ms':>12}{'base':>12}{'Δ%':>9}{'p99 ms':>12}{'base':>12}{'Δ%':>9}")
+    for name, r in current['results'].items():
+        b = baseline.get('results', {}).get(name)
+        row = f"{name:<22}"
+        for key in ('p50_ms', 'p99_ms'):
+            if b and b.get(key):
+                delta = (r[key] - b[key]) / b[key] * 100
+                row += f"{r[key]:>12.3f}{b[key]:>12.3f}{delta:>+8.1f}%"
+            else:
+                row += f"{r[key]:>12.3f}{'-':>12}{'':>9}"
+        print(row)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', choices=sorted(SCALES), default='small')
+    parser.add_argument('--database-url', help='defaults to a scratch SQLite file')
+    parser.add_argument('--reset', action='store_true', help='allow dropping the tables of --database-url')
+    parser.add_argument('--save', action='store_true', help='overwrite the baseline for this db/scale')
+    args = parser.parse_args()
+    if args.database_url and not args.reset and not is_scratch_url(args.database_url):
+        parser.error('seeding drops every table of --database-url; pass --reset if that is intended')
+
+    scratch = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        os.environ['DATABASE_URL'] = f'sqlite:///{scratch.name}'
+    os.environ['QUOTAS_DISABLED'] = '1'      # time the handlers, not the per-user quotas
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    dialect = os.environ['DATABASE_URL'].split(':', 1)[0].split('+')[0]
+    try:
+        report = run(args.scale, args.reset)
+    finally:
+        if scratch:
+            os.unlink(scratch.name)
+    report['meta'] = {
+        'scale': args.scale, **SCALES[args.scale], 'database': dialect,
+        'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+    }
+
+    path = os.path.join(BASELINE_DIR, f'{dialect}-{args.scale}.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            compare(report, json.load(f))
+    else:
+        compare(report, {})
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Baseline saved to {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
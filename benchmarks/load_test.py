@@ -0,0 +1,429 @@
+"""HTTP load test: realistic user mixes against a local server, stepped until it saturates.
+
+Starts gunicorn on a scratch database with a stubbed market source, so nothing
+touches an exchange. Then it drives closed-loop virtual users over HTTP:
+
+  chart       loads 500 1m candles, then delta-polls /api/market/candles?since= every 3s
+  dashboard   GET /api/strategies and /api/trading/history (with If-None-Match) every 10s
+  trader      paper POST /api/trading/buy then /api/trading/sell every 5s
+
+The mix (e.g. chart=40,dashboard=10,trader=5) is scaled by each --steps
+multiplier in turn. For every step it reports sustained RPS, error rate and
+p50/p90/p99 latency per route. The saturation point is the first step where
+any of these holds:
+
+  - throughput grows by less than 10% over the previous step
+  - the error rate passes --max-error
+  - the overall p99 passes --slo-ms
+
+Usage (from the repo root):
+
+    python benchmarks/load_test.py                                  # market_server, 2 workers
+    python benchmarks/load_test.py --target app --workers 4 --threads 8
+    python benchmarks/load_test.py --mix chart=100,trader=20 --steps 1,2,3,4 --duration 60
+    python benchmarks/load_test.py --url http://staging:5000        # drive a running server instead
+    python benchmarks/load_test.py --save                           # write benchmarks/baselines/load-<target>-<db>.json
+    python benchmarks/load_test.py --database-url postgresql://localhost/prismtrade_load --reset
+
+--target market_server runs the production entry point (aiohttp workers;
+--threads sets WSGI_THREADS). --target app runs Flask alone on gthread
+workers. Both serve the same synthetic candles, with
+--upstream-ms of simulated exchange latency on each upstream call.
+
+The load generator runs on one asyncio loop in this process. On a small
+machine it competes with the server for CPU. For server numbers you can trust,
+run the server elsewhere and point --url at it. With --url, the server must
+already have the benchmark users (bench0..N), as seeded by hot_paths.py or by
+a local run.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from hot_paths import BASELINE_DIR, ROOT, is_scratch_url, seed_database, synthetic_candles
+
+DEFAULT_MIX = 'chart=40,dashboard=10,trader=5'
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT']
+PASSWORD = 'bench-password'
+GROWTH_FLOOR = 0.10          # a step adding less throughput than this (relative) is saturated
+
+GUNICORN_CONFIG = '''
+preload_app = True
+
+
+def post_fork(server, worker):
+    from database import engine
+    engine.dispose(close=False)
+'''
+
+
+# ---- server side: stubbed market source ------------------------------------
+
+def _stub_bars(symbol: str, limit: int, since: int = None) -> list:
+    """Deterministic 1m bars ending at the current minute, the same in every worker."""
+    now = int(time.time() // 60 * 60_000)
+    start = since if since is not None else now - (limit - 1) * 60_000
+    n = max(1, min(limit, (now - start) // 60_000 + 1))
+    bars = synthetic_candles(n, seed=sum(map(ord, symbol)) + start // 60_000, start_ms=start)
+    return bars.tolist()
+
+
+def stubbed_app(target: str = 'market_server'):
+    """gunicorn app factory: `target`'s app with market_proxy/market_server upstream calls stubbed."""
+    import market_proxy
+    delay = float(os.environ.get('LOAD_TEST_UPSTREAM_MS', 50)) / 1000
+
+    def fetch_ohlcv(symbol, timeframe, limit, since=None):
+        time.sleep(delay)
+        return _stub_bars(symbol, limit, since)
+
+    market_proxy._fetch_ohlcv = fetch_ohlcv
+    market_proxy.fetch_last_price = lambda symbol: _stub_bars(symbol, 1)[-1][4]
+    if target == 'app':
+        from app import app
+        return app
+
+    import market_server
+
+    async def fetch_ohlcv_async(symbol, timeframe, limit, since=None):
+        await asyncio.sleep(delay)
+        return _stub_bars(symbol, limit, since)
+
+    market_server._fetch_ohlcv = fetch_ohlcv_async
+    return market_server.app
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(target: str, workers: int, threads: int, env: dict):
+    """Spawn gunicorn on a free port; returns (process, base url, config path) once it answers."""
+    import urllib.request
+    port = _free_port()
+    config = tempfile.NamedTemporaryFile('w', suffix='.py', delete=False)
+    config.write(GUNICORN_CONFIG)
+    config.close()
+    cmd = [sys.executable, '-m', 'gunicorn', f'load_test:stubbed_app("{target}")',
+           '--pythonpath', f'{ROOT},{os.path.join(ROOT, "benchmarks")}', '--chdir', ROOT,
+           '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--config', config.name,
+           '--timeout', '120', '--backlog', '2048']
+    if target == 'app':
+        cmd += ['--worker-class', 'gthread', '--threads', str(threads)]
+    else:
+        cmd += ['--worker-class', 'aiohttp.GunicornWebWorker']
+        env = dict(env, WSGI_THREADS=str(threads))
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 120
+    while True:
+        try:
+            with urllib.request.urlopen(f'{url}/api/health', timeout=5) as r:
+                r.read()
+            break
+        except OSError:
+            if proc.poll() is not None or time.time() > deadline:
+                proc.kill()
+                os.unlink(config.name)
+                raise RuntimeError(f'gunicorn did not come up: {" ".join(cmd)}')
+            time.sleep(0.1)
+    time.sleep(1)     # let the other workers finish booting
+    return proc, url, config.name
+
+
+# ---- load generator --------------------------------------------------------
+
+class Recorder:
+    """Latency and status per route, for requests completing inside the measurement window."""
+
+    def __init__(self):
+        self.window = None        # (start, end) on time.perf_counter()
+        self.samples = defaultdict(list)     # route -> [latency_s, ...]
+        self.errors = defaultdict(int)       # route -> count of errors
+        self.kinds = defaultdict(lambda: defaultdict(int))   # route -> status/exception -> count
+
+    def add(self, route: str, started: float, status):
+        done = time.perf_counter()
+        if self.window is None or not self.window[0] <= done < self.window[1]:
+            return
+        self.samples[route].append(done - started)
+        if not isinstance(status, int) or status >= 400:
+            self.errors[route] += 1
+            self.kinds[route][str(status)] += 1
+
+    def report(self) -> dict:
+        seconds = self.window[1] - self.window[0]
+        routes = {}
+        for route in sorted(self.samples):
+            routes[route] = _summary(self.samples[route], self.errors[route], seconds)
+            if self.kinds[route]:
+                routes[route]['errors'] = dict(self.kinds[route])
+        everything = [s for samples in self.samples.values() for s in samples]
+        total = _summary(everything, sum(self.errors.values()), seconds)
+        return {'total': total, 'routes': routes}
+
+
+def _summary(latencies: list, errors: int, seconds: float) -> dict:
+    if not latencies:
+        return {'requests': 0, 'rps': 0.0, 'error_rate': 0.0, 'p50_ms': 0.0, 'p90_ms': 0.0, 'p99_ms': 0.0}
+    ms = np.asarray(latencies) * 1000
+    return {
+        'requests': len(ms),
+        'rps': round(len(ms) / seconds, 1),
+        'error_rate': round(errors / len(ms), 4),
+        'p50_ms': round(float(np.percentile(ms, 50)), 1),
+        'p90_ms': round(float(np.percentile(ms, 90)), 1),
+        'p99_ms': round(float(np.percentile(ms, 99)), 1),
+    }
+
+
+class VirtualUser:
+    def __init__(self, http, url: str, token: str, recorder: Recorder, stop: asyncio.Event):
+        self.http = http
+        self.url = url
+        self.headers = {'Authorization': f'Bearer {token}'}
+        self.recorder = recorder
+        self.stop = stop
+        self.etags = {}
+
+    async def request(self, method: str, path: str, params: dict = None, body: dict = None, revalidate=False):
+        """One request, recorded under 'METHOD path'. Returns the decoded JSON body (None on 304/error)."""
+        import aiohttp
+        route = f'{method} {path}'
+        headers = dict(self.headers)
+        key = (path, tuple(sorted((params or {}).items())))
+        if revalidate and key in self.etags:
+            headers['If-None-Match'] = self.etags[key]
+        started = time.perf_counter()
+        try:
+            async with self.http.request(method, self.url + path, params=params, json=body,
+                                         headers=headers) as r:
+                data = await r.json(content_type=None) if r.status == 200 else await r.read()
+                if revalidate and r.headers.get('ETag'):
+                    self.etags[key] = r.headers['ETag']
+                self.recorder.add(route, started, r.status)
+                return data if r.status == 200 else None
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            self.recorder.add(route, started, type(e).__name__)
+            return None
+
+    async def think(self, seconds: float) -> bool:
+        """Sleep about `seconds` (±20%); False once the run is stopping."""
+        try:
+            await asyncio.wait_for(self.stop.wait(), seconds * random.uniform(0.8, 1.2))
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+
+async def chart(vu: VirtualUser):
+    symbol = random.choice(SYMBOLS)
+    candles = await vu.request('GET', '/api/market/candles', {'symbol': symbol, 'interval': '1m', 'limit': 500})
+    since = candles[-1][0] if candles else None
+    while await vu.think(3):
+        params = {'symbol': symbol, 'interval': '1m', 'limit': 500}
+        if since is not None:
+            params['since'] = since
+        candles = await vu.request('GET', '/api/market/candles', params)
+        if candles:
+            since = candles[-1][0]
+
+
+async def dashboard(vu: VirtualUser):
+    while True:
+        await vu.request('GET', '/api/strategies', revalidate=True)
+        await vu.request('GET', '/api/trading/history', {'limit': 50}, revalidate=True)
+        if not await vu.think(10):
+            return
+
+
+async def trader(vu: VirtualUser):
+    symbol = random.choice(SYMBOLS)
+    while True:
+        order = {'symbol': symbol, 'amount': 0.01, 'mode': 'paper', 'price': 30000.0}
+        await vu.request('POST', '/api/trading/buy', body=order)
+        if not await vu.think(5):
+            return
+        await vu.request('POST', '/api/trading/sell', body=dict(order, price=30010.0))
+        if not await vu.think(5):
+            return
+
+
+PROFILES = {'chart': chart, 'dashboard': dashboard, 'trader': trader}
+
+
+def parse_mix(text: str) -> dict:
+    mix = {}
+    for part in text.split(','):
+        name, _, count = part.partition('=')
+        if name not in PROFILES:
+            raise SystemExit(f"unknown profile {name!r}; choose from {', '.join(PROFILES)}")
+        mix[name] = int(count)
+    return mix
+
+
+async def run_step(url: str, mix: dict, tokens: list, duration: float, ramp: float) -> dict:
+    """Run `mix` virtual users for ramp + duration seconds; measure the last `duration`."""
+    import aiohttp
+    recorder = Recorder()
+    stop = asyncio.Event()
+    connector = aiohttp.TCPConnector(limit=0, force_close=False)
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as http:
+        users = [(profile, i) for profile, count in mix.items() for i in range(count)]
+        tasks = []
+        for n, (profile, _) in enumerate(users):
+            vu = VirtualUser(http, url, tokens[n % len(tokens)], recorder, stop)
+
+            async def start(vu=vu, profile=profile, delay=random.uniform(0, ramp)):
+                # Stagger arrivals over the ramp so the first poll isn't a thundering herd.
+                await asyncio.sleep(delay)
+                await PROFILES[profile](vu)
+            tasks.append(asyncio.ensure_future(start()))
+        await asyncio.sleep(ramp)
+        recorder.window = (time.perf_counter(), time.perf_counter() + duration)
+        await asyncio.sleep(duration)
+        stop.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    report = recorder.report()
+    report['users'] = dict(mix)
+    return report
+
+
+def is_saturated(step: dict, previous: dict, max_error: float, slo_ms: float) -> str:
+    """Why `step` counts as saturated, or '' if it doesn't."""
+    total = step['total']
+    if total['error_rate'] > max_error:
+        return f"error rate {total['error_rate']:.1%} > {max_error:.1%}"
+    if total['p99_ms'] > slo_ms:
+        return f"p99 {total['p99_ms']:.0f} ms > {slo_ms:.0f} ms"
+    if previous and previous['total']['rps']:
+        growth = total['rps'] / previous['total']['rps'] - 1
+        users = sum(step['users'].values()) / max(1, sum(previous['users'].values())) - 1
+        if users > 0 and growth < GROWTH_FLOOR * users:
+            return f"throughput +{growth:.0%} for +{users:.0%} users"
+    return ''
+
+
+def print_step(n: int, step: dict):
+    users = ', '.join(f'{k}={v}' for k, v in step['users'].items())
+    print(f"\nstep {n}: {sum(step['users'].values())} users ({users})")
+    print(f"  {'route':<28}{'req':>8}{'rps':>9}{'err%':>8}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}")
+    for route, r in list(step['routes'].items()) + [('total', step['total'])]:
+        print(f"  {route:<28}{r['requests']:>8}{r['rps']:>9.1f}{r['error_rate'] * 100:>7.2f}%"
+              f"{r['p50_ms']:>10.1f}{r['p90_ms']:>10.1f}{r['p99_ms']:>10.1f}")
+    if step.get('saturated'):
+        print(f"  ⚠️  saturated: {step['saturated']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--target', choices=['market_server', 'app'], default='market_server')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8, help='gthread threads (app) or WSGI_THREADS')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'virtual users per profile (default {DEFAULT_MIX})')
+    parser.add_argument('--steps', default='1,2,4,8', help='multipliers applied to --mix, in order')
+    parser.add_argument('--duration', type=float, default=30, help='measured seconds per step')
+    parser.add_argument('--ramp', type=float, default=5, help='unmeasured warm-up seconds per step')
+    parser.add_argument('--upstream-ms', type=float, default=50, help='simulated exchange latency')
+    parser.add_argument('--max-error', type=float, default=0.01)
+    parser.add_argument('--slo-ms', type=float, default=1000, help='p99 beyond this counts as saturated')
+    parser.add_argument('--url', help='drive an already running server instead of starting one')
+    parser.add_argument('--database-url', help='defaults to a scratch SQLite file (reset by the seed)')
+    parser.add_argument('--reset', action='store_true', help='allow the seed to drop the tables of --database-url')
+    parser.add_argument('--save', action='store_true', help='write the report to benchmarks/baselines')
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    steps = [float(s) for s in args.steps.split(',')]
+    most_users = int(max(steps) * sum(mix.values())) + 1
+
+    if args.database_url and not args.url and not args.reset and not is_scratch_url(args.database_url):
+        parser.error('seeding drops every table of --database-url; pass --reset if that is intended')
+
+    scratch = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    elif not args.url:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        os.environ['DATABASE_URL'] = f'sqlite:///{scratch.name}'
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    dialect = os.environ.get('DATABASE_URL', 'remote').split(':', 1)[0].split('+')[0]
+
+    from auth import create_access_token
+    if not args.url:
+        seed_database(most_users, 20 * most_users, PASSWORD, args.reset)
+    # seed_database numbers users from 1; user 1 also holds a tenth of the seeded trades.
+    tokens = [create_access_token({'sub': str(uid)}) for uid in range(1, most_users + 1)]
+
+    proc = config = None
+    env = dict(os.environ, METRICS_DIR=tempfile.mkdtemp(), TRACE_FILE='',
+               LOAD_TEST_UPSTREAM_MS=str(args.upstream_ms))
+    report = {'steps': []}
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+        else:
+            proc, url, config = start_server(args.target, args.workers, args.threads, env)
+            print(f"🚀 {args.target}: {args.workers} workers x {args.threads} threads at {url} ({dialect})")
+        previous = None
+        for n, factor in enumerate(steps, 1):
+            scaled = {name: max(1, round(count * factor)) for name, count in mix.items() if count}
+            step = asyncio.run(run_step(url, scaled, tokens, args.duration, args.ramp))
+            step['saturated'] = is_saturated(step, previous, args.max_error, args.slo_ms)
+            report['steps'].append(step)
+            print_step(n, step)
+            if step['saturated'] and previous and previous.get('saturated'):
+                break       # two saturated steps in a row: nothing more to learn
+            previous = step
+    finally:
+        if proc:
+            proc.terminate()
+            proc.wait(timeout=30)
+            os.unlink(config)
+        if scratch:
+            os.unlink(scratch.name)
+
+    healthy = [s for s in report['steps'] if not s['saturated']]
+    saturated = next((s for s in report['steps'] if s['saturated']), None)
+    report['capacity'] = {
+        'max_healthy_users': sum(healthy[-1]['users'].values()) if healthy else 0,
+        'max_healthy_rps': healthy[-1]['total']['rps'] if healthy else 0.0,
+        'saturated_at_users': sum(saturated['users'].values()) if saturated else None,
+        'saturated_because': saturated['saturated'] if saturated else None,
+    }
+    report['meta'] = {
+        'target': args.target, 'workers': args.workers, 'threads': args.threads, 'mix': mix,
+        'duration': args.duration, 'upstream_ms': args.upstream_ms, 'database': dialect,
+        'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+    }
+    capacity = report['capacity']
+    print(f"\n📈 healthy up to {capacity['max_healthy_users']} users / {capacity['max_healthy_rps']} rps; "
+          + (f"saturated at {capacity['saturated_at_users']} users ({capacity['saturated_because']})"
+             if saturated else "not saturated - add larger --steps"))
+
+    if args.save:
+        path = os.path.join(BASELINE_DIR, f'load-{args.target}-{dialect}.json')
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Report saved to {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""Startup-time benchmarks: how long until the app can serve.
+
+  import_app           fresh interpreter: `import app` (includes init_db)
+  first_health         fresh interpreter: import + first GET /api/health
+  first_login          fresh interpreter: import + first POST /api/auth/login (loads passlib/bcrypt)
+  gunicorn_ready       spawn gunicorn (4 workers), until the first 200 from /api/health
+
+The gunicorn paths run twice: with this repo's gunicorn.conf.py (preload plus
+warm in the master) and with an empty config (`-nopreload`). For each,
+total PSS across master and workers is reported, Linux only. That PSS is what
+copy-on-write sharing saves.
+
+Usage (from the repo root):
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --runs 10 --save   # write benchmarks/baselines/startup-<db>.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import numpy as np
+
+from hot_paths import BASELINE_DIR, ROOT, compare
+
+PROBE = r'''
+import json, os, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/api/health')
+t2 = time.perf_counter()
+client.post('/api/auth/login', json={'username': 'nobody', 'password': 'x'})
+t3 = time.perf_counter()
+print(json.dumps({'import_app': t1 - t0, 'first_health': t2 - t0, 'first_login': t3 - t0}))
+'''
+
+
+def _summary(samples) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {
+        'iterations': len(ms),
+        'p50_ms': round(float(np.percentile(ms, 50)), 1),
+        'p99_ms': round(float(np.percentile(ms, 99)), 1),
+        'mean_ms': round(float(ms.mean()), 1),
+    }
+
+
+def cold_imports(runs: int, env: dict) -> dict:
+    samples = {}
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, '-c', PROBE], cwd=ROOT, env=env,
+                             capture_output=True, text=True, check=True).stdout
+        for name, value in json.loads(out.strip().splitlines()[-1]).items():
+            samples.setdefault(name, []).append(value)
+    return {name: _summary(values) for name, values in samples.items()}
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _pss_mb(pids) -> float:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/smaps_rollup') as f:
+                for line in f:
+                    if line.startswith('Pss:'):
+                        total += int(line.split()[1])
+        except OSError:
+            return None
+    return round(total / 1024, 1)
+
+
+def gunicorn_boot(env: dict, config: str, workers: int = 4, timeout: float = 120) -> dict:
+    port = _free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', 'market_server:app', '--worker-class', 'aiohttp.GunicornWebWorker',
+           '--workers', str(workers), '--bind', f'127.0.0.1:{port}', '--config', config]
+    started = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    ready = None
+    try:
+        while ready is None and time.perf_counter() - started < timeout:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as r:
+                    r.read()
+                ready = time.perf_counter() - started
+            except OSError:
+                time.sleep(0.05)
+        if ready is None:
+            raise RuntimeError(f'gunicorn did not answer within {timeout}s')
+        # Let the remaining workers finish booting, then one request each so PSS reflects serving workers.
+        time.sleep(2)
+        for _ in range(workers * 2):
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=5) as r:
+                r.read()
+        pss = _pss_mb([proc.pid] + _worker_pids(proc.pid))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {'ready': ready, 'pss_mb': pss}
+
+
+def _worker_pids(master: int) -> list:
+    try:
+        with open(f'/proc/{master}/task/{master}/children') as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+
+def run(runs: int, env: dict) -> dict:
+    results = cold_imports(runs, env)
+    empty = tempfile.NamedTemporaryFile('w', suffix='.py', delete=False)
+    empty.close()
+    try:
+        for label, config in (('', os.path.join(ROOT, 'gunicorn.conf.py')), ('-nopreload', empty.name)):
+            boots = [gunicorn_boot(env, config) for _ in range(max(1, runs // 3))]
+            results[f'gunicorn_ready{label}'] = _summary([b['ready'] for b in boots])
+            results[f'gunicorn_ready{label}']['pss_mb'] = boots[-1]['pss_mb']
+    finally:
+        os.unlink(empty.name)
+    return {'results': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--database-url', help='defaults to a scratch SQLite file')
+    parser.add_argument('--save', action='store_true', help='overwrite the baseline for this db')
+    args = parser.parse_args()
+
+    scratch = None
+    env = dict(os.environ, METRICS_DIR=tempfile.mkdtemp(), TRACE_FILE='')
+    if args.database_url:
+        env['DATABASE_URL'] = args.database_url
+    else:
+        scratch = tempfile.NamedTemporaryFile(suffix='.db', delete=False)
+        env['DATABASE_URL'] = f'sqlite:///{scratch.name}'
+    dialect = env['DATABASE_URL'].split(':', 1)[0].split('+')[0]
+    try:
+        report = run(args.runs, env)
+    finally:
+        if scratch:
+            os.unlink(scratch.name)
+    report['meta'] = {'runs': args.runs, 'database': dialect, 'python': platform.python_version(),
+                      'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+    path = os.path.join(BASELINE_DIR, f'startup-{dialect}.json')
+    baseline = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            baseline = json.load(f)
+    compare(report, baseline)
+    for name, r in report['results'].items():
+        if r.get('pss_mb') is not None:
+            print(f"{name:<22}{'PSS MB':>12}{r['pss_mb']:>12.1f}")
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\n💾 Baseline saved to {os.path.relpath(path, ROOT)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""Wire formats for /api/market/candles.
+
+Clients choose a format with the Accept header or ?format=:
+
+  json      application/json (default). Array of [ms, o, h, l, c, v] rows,
+            encoded with orjson when it is installed.
+  columnar  application/vnd.prismtrade.candles. One typed array per field,
+            which the browser can wrap in Float64Array/Float32Array without
+            parsing:
+
+              offset 0   b'PTC1'
+              offset 4   uint32  n (candles)
+              offset 8   uint8   value width in bytes (4 = float32, 8 = float64)
+              offset 9   7 bytes padding (keeps every array aligned)
+              offset 16  float64[n] timestamps (ms)
+              then       open[n], high[n], low[n], close[n], volume[n] at the value width
+
+            All numbers are little-endian. Values are float32 unless ?precision=64.
+  arrow     application/vnd.apache.arrow.stream. Arrow IPC stream, only
+            offered when pyarrow is installed.
+"""
+import json
+import struct
+
+import numpy as np
+
+JSON_MIME = 'application/json'
+COLUMNAR_MIME = 'application/vnd.prismtrade.candles'
+ARROW_MIME = 'application/vnd.apache.arrow.stream'
+
+FORMATS = {'json': JSON_MIME, 'columnar': COLUMNAR_MIME, 'arrow': ARROW_MIME}
+FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+try:
+    import orjson
+except ImportError:      # optional: falls back to the stdlib encoder
+    orjson = None
+
+try:
+    import pyarrow
+except ImportError:      # optional: arrow is simply not offered
+    pyarrow = None
+
+
+def _matrix(candles) -> np.ndarray:
+    arr = np.asarray(candles, dtype=np.float64)
+    return arr.reshape(-1, 6)
+
+
+def encode_json(candles) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(candles)
+    return json.dumps(candles, separators=(',', ':')).encode()
+
+
+def encode_columnar(candles, precision: int = 32) -> bytes:
+    arr = _matrix(candles)
+    n = len(arr)
+    width = 8 if precision == 64 else 4
+    header = struct.pack('<4sIB7x', b'PTC1', n, width)
+    ts = np.ascontiguousarray(arr[:, 0], dtype='<f8').tobytes()
+    values = np.ascontiguousarray(arr[:, 1:].T, dtype='<f8' if width == 8 else '<f4').tobytes()
+    return header + ts + values
+
+
+def encode_arrow(candles) -> bytes:
+    arr = _matrix(candles)
+    table = pyarrow.table({
+        'timestamp': pyarrow.array(arr[:, 0].astype(np.int64), type=pyarrow.int64()),
+        **{name: arr[:, i] for i, name in enumerate(FIELDS[1:], start=1)},
+    })
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def negotiate(accept: str = None, fmt: str = None) -> str:
+    """Pick a MIME type from ?format= (wins) or the Accept header."""
+    if fmt:
+        mime = FORMATS.get(fmt)
+        if mime is None or (mime == ARROW_MIME and pyarrow is None):
+            raise ValueError(f"Unsupported format {fmt}")
+        return mime
+    if accept:
+        if COLUMNAR_MIME in accept:
+            return COLUMNAR_MIME
+        if ARROW_MIME in accept and pyarrow is not None:
+            return ARROW_MIME
+    return JSON_MIME
+
+
+def encode(candles, mime: str, precision: int = 32) -> bytes:
+    if mime == COLUMNAR_MIME:
+        return encode_columnar(candles, precision)
+    if mime == ARROW_MIME:
+        return encode_arrow(candles)
+    return encode_json(candles)
@@ -0,0 +1,152 @@
+"""Durable local candle store for backfilled history.
+
+Layout (freqtrade-style, under user_data/data unless CANDLE_STORE_DIR is set):
+
+    <exchange>/<SYMBOL>/<timeframe>/<YYYY-MM>.npy
+
+Each monthly partition is a float64 array of [ms, o, h, l, c, v] rows, sorted
+and unique by timestamp. Writes merge with what is already there (new rows
+win) and replace the file atomically, so a killed backfill never leaves a torn
+partition. Reads memory-map the partitions, so loading years of 1m bars costs
+little more than the concatenation.
+"""
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from resampler import timeframe_ms
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CANDLE_STORE_DIR = os.environ.get('CANDLE_STORE_DIR', os.path.join(BASE_DIR, 'user_data', 'data'))
+
+def _month(ms: float) -> str:
+    return datetime.fromtimestamp(ms / 1000, tz=timezone.utc).strftime('%Y-%m')
+
+
+def _month_start_ms(month: str) -> int:
+    return int(datetime.strptime(month, '%Y-%m').replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _symbol_dir(symbol: str) -> str:
+    return symbol.replace('/', '').replace(':', '_').upper()
+
+
+class CandleStore:
+    """`width` is the number of float64 columns per row, timestamp first (6 for OHLCV)."""
+
+    def __init__(self, root: str = CANDLE_STORE_DIR, width: int = 6):
+        self.root = root
+        self.width = width
+
+    def path(self, exchange: str, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, exchange, _symbol_dir(symbol), timeframe)
+
+    def partitions(self, exchange: str, symbol: str, timeframe: str) -> list:
+        try:
+            names = os.listdir(self.path(exchange, symbol, timeframe))
+        except OSError:
+            return []
+        return sorted(n[:-4] for n in names if n.endswith('.npy'))
+
+    def _read_partition(self, directory: str, month: str) -> np.ndarray:
+        try:
+            return np.load(os.path.join(directory, f'{month}.npy'), mmap_mode='r')
+        except (OSError, ValueError):
+            return np.empty((0, self.width))
+
+    def write(self, exchange: str, symbol: str, timeframe: str, bars) -> int:
+        """Merge bars into their monthly partitions. Returns the number of rows written."""
+        bars = np.asarray(bars, dtype=np.float64).reshape(-1, self.width)
+        if not len(bars):
+            return 0
+        directory = self.path(exchange, symbol, timeframe)
+        os.makedirs(directory, exist_ok=True)
+        months = bars[:, 0].astype('datetime64[ms]').astype('datetime64[M]')
+        for value in np.unique(months):
+            month = str(value)
+            merged = np.concatenate([bars[months == value], self._read_partition(directory, month)])
+            # np.unique keeps the first occurrence, i.e. the newly written row.
+            _, first = np.unique(merged[:, 0], return_index=True)
+            path = os.path.join(directory, f'{month}.npy')
+            tmp = f'{path}.{os.getpid()}.tmp.npy'
+            np.save(tmp, np.ascontiguousarray(merged[first]))
+            os.replace(tmp, path)
+        return len(bars)
+
+    def read(self, exchange: str, symbol: str, timeframe: str, start: int = None, end: int = None) -> np.ndarray:
+        """Rows with start <= ms < end (either bound optional), oldest first."""
+        directory = self.path(exchange, symbol, timeframe)
+        chunks = []
+        for month in self.partitions(exchange, symbol, timeframe):
+            if end is not None and _month_start_ms(month) >= end:
+                break
+            if start is not None and month < _month(start):
+                continue
+            chunks.append(self._read_partition(directory, month))
+        if not chunks:
+            return np.empty((0, self.width))
+        bars = np.concatenate(chunks)
+        lo = 0 if start is None else np.searchsorted(bars[:, 0], start, side='left')
+        hi = len(bars) if end is None else np.searchsorted(bars[:, 0], end, side='left')
+        return bars[lo:hi]
+
+    def tail(self, exchange: str, symbol: str, timeframe: str, limit: int) -> np.ndarray:
+        """The newest `limit` rows (fewer only if fewer are stored), reading only the partitions they
+        can fall in. The window starts `limit` bars back and doubles while gaps leave it short."""
+        months = self.partitions(exchange, symbol, timeframe)
+        newest = self._read_partition(self.path(exchange, symbol, timeframe), months[-1]) if months else None
+        if newest is None or not len(newest):
+            return np.empty((0, self.width))
+        step, _ = timeframe_ms(timeframe)
+        oldest = _month_start_ms(months[0])
+        span = max(limit - 1, 1)
+        while True:
+            start = int(newest[-1, 0]) - span * step
+            bars = self.read(exchange, symbol, timeframe, start=start)
+            if len(bars) >= limit or start <= oldest:
+                return bars[-limit:]
+            span *= 2
+
+    def first(self, exchange: str, symbol: str, timeframe: str):
+        """The oldest stored timestamp, or None if nothing is stored."""
+        directory = self.path(exchange, symbol, timeframe)
+        for month in self.partitions(exchange, symbol, timeframe):
+            rows = self._read_partition(directory, month)
+            if len(rows):
+                return float(rows[0, 0])
+        return None
+
+    def count(self, exchange: str, symbol: str, timeframe: str, end: int = None) -> int:
+        """Number of rows with ms < end. Only the partition holding `end` is read; the rest are counted
+        from their headers."""
+        directory = self.path(exchange, symbol, timeframe)
+        rows = 0
+        for month in self.partitions(exchange, symbol, timeframe):
+            if end is not None and _month_start_ms(month) >= end:
+                break
+            bars = self._read_partition(directory, month)
+            if end is not None and month == _month(end):
+                rows += int(np.searchsorted(bars[:, 0], end, side='left'))
+                break
+            rows += len(bars)
+        return rows
+
+    def exchanges(self, symbol: str, timeframe: str) -> list:
+        """Exchanges that hold `symbol` at `timeframe`."""
+        try:
+            names = sorted(os.listdir(self.root))
+        except OSError:
+            return []
+        return [exid for exid in names if self.partitions(exid, symbol, timeframe)]
+
+    def gaps(self, exchange: str, symbol: str, timeframe: str, start: int, end: int) -> list:
+        """[(from_ms, to_ms), ...] ranges inside [start, end) with no bars."""
+        step, _ = timeframe_ms(timeframe)
+        ts = self.read(exchange, symbol, timeframe, start, end)[:, 0]
+        edges = np.concatenate([[start - step], ts, [end]])
+        holes = np.flatnonzero(np.diff(edges) > step)
+        return [(int(edges[i] + step), int(edges[i + 1])) for i in holes]
+
+
+shared = CandleStore()
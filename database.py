@@ -1,6 +1,8 @@
 ﻿from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, scoped_session
 from models import Base
+import metrics
+import tracing
 import os
 
 DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///trading.db')
@@ -8,6 +10,7 @@ DATABASE_URL = os.environ.get('DATABASE_URL', 'sqlite:///trading.db')
 engine = create_engine(DATABASE_URL, echo=False, pool_pre_ping=True, pool_recycle=3600)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 db_session = scoped_session(SessionLocal)
+metrics.instrument_engine(engine)
 
 def init_db():
     Base.metadata.create_all(bind=engine)
@@ -22,9 +25,14 @@ def get_db():
 
 class DBSession:
     def __enter__(self):
-        self.db = SessionLocal()
+        self.db = SessionLocal()    # first: if this raises, no span is left open
+        self._span = tracing.span('db.session')
+        self._span.__enter__()
         return self.db
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if exc_type is not None:
-            self.db.rollback()
-        self.db.close()
+        try:
+            if exc_type is not None:
+                self.db.rollback()
+            self.db.close()
+        finally:
+            self._span.__exit__(exc_type, exc_val, exc_tb)
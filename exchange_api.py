@@ -2,6 +2,7 @@
 from typing import Optional, Dict, List
 from datetime import datetime, timedelta
 import pandas as pd
+import metrics
 
 class ExchangeAPI:
     """Unified exchange API wrapper using CCXT"""
@@ -30,7 +31,8 @@ class ExchangeAPI:
     def get_ticker(self, symbol: str) -> Dict:
         """Get current price and 24h stats for a symbol"""
         try:
-            ticker = self.exchange.fetch_ticker(symbol)
+            with metrics.upstream_call(self.exchange_name, 'fetch_ticker'):
+                ticker = self.exchange.fetch_ticker(symbol)
             return {
                 'symbol': symbol,
                 'last_price': ticker['last'],
@@ -50,7 +52,8 @@ class ExchangeAPI:
                    limit: int = 100) -> pd.DataFrame:
         """Get historical OHLCV data"""
         try:
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
+            with metrics.upstream_call(self.exchange_name, 'fetch_ohlcv'):
+                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=limit)
             df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
             return df
@@ -60,7 +63,8 @@ class ExchangeAPI:
     def get_orderbook(self, symbol: str, limit: int = 20) -> Dict:
         """Get current orderbook"""
         try:
-            orderbook = self.exchange.fetch_order_book(symbol, limit)
+            with metrics.upstream_call(self.exchange_name, 'fetch_order_book'):
+                orderbook = self.exchange.fetch_order_book(symbol, limit)
             return {
                 'symbol': symbol,
                 'bids': orderbook['bids'][:limit],
@@ -73,7 +77,8 @@ class ExchangeAPI:
     def get_balance(self) -> Dict:
         """Get account balance (requires API keys)"""
         try:
-            balance = self.exchange.fetch_balance()
+            with metrics.upstream_call(self.exchange_name, 'fetch_balance'):
+                balance = self.exchange.fetch_balance()
             return {
                 'total': balance['total'],
                 'free': balance['free'],
@@ -85,7 +90,8 @@ class ExchangeAPI:
     def get_markets(self) -> List[str]:
         """Get all available trading pairs"""
         try:
-            markets = self.exchange.load_markets()
+            with metrics.upstream_call(self.exchange_name, 'load_markets'):
+                markets = self.exchange.load_markets()
             return sorted(list(markets.keys()))
         except Exception as e:
             raise Exception(f"Error fetching markets: {str(e)}")
@@ -94,13 +100,14 @@ class ExchangeAPI:
                      amount: float, price: Optional[float] = None) -> Dict:
         """Create order (requires API keys)"""
         try:
-            order = self.exchange.create_order(
-                symbol=symbol,
-                type=order_type,
-                side=side,
-                amount=amount,
-                price=price
-            )
+            with metrics.upstream_call(self.exchange_name, 'create_order'):
+                order = self.exchange.create_order(
+                    symbol=symbol,
+                    type=order_type,
+                    side=side,
+                    amount=amount,
+                    price=price
+                )
             return {
                 'id': order['id'],
                 'symbol': order['symbol'],
@@ -117,7 +124,8 @@ class ExchangeAPI:
     def get_open_orders(self, symbol: Optional[str] = None) -> List[Dict]:
         """Get open orders (requires API keys)"""
         try:
-            orders = self.exchange.fetch_open_orders(symbol)
+            with metrics.upstream_call(self.exchange_name, 'fetch_open_orders'):
+                orders = self.exchange.fetch_open_orders(symbol)
             return [{
                 'id': o['id'],
                 'symbol': o['symbol'],
@@ -134,7 +142,8 @@ class ExchangeAPI:
     def cancel_order(self, order_id: str, symbol: str) -> Dict:
         """Cancel an order (requires API keys)"""
         try:
-            result = self.exchange.cancel_order(order_id, symbol)
+            with metrics.upstream_call(self.exchange_name, 'cancel_order'):
+                result = self.exchange.cancel_order(order_id, symbol)
             return {
                 'id': result['id'],
                 'status': result['status'],
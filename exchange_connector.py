@@ -1,7 +1,8 @@
-import ccxt
 from api_key_manager import key_manager
 from models import APIKey
 from database import DBSession
+import metrics
+import tracing
 
 class ExchangeConnector:
     def __init__(self, user_id, exchange_name='gemini'):
@@ -11,7 +12,9 @@ class ExchangeConnector:
         
     def connect(self):
         '''Connect to exchange using encrypted API keys'''
-        with DBSession() as db:
+        with tracing.span('exchange.connect', exchange=self.exchange_name), \
+                metrics.timer('prismtrade_exchange_connect_seconds', exchange=self.exchange_name), \
+                DBSession() as db:
             api_key = db.query(APIKey).filter(
                 APIKey.user_id == self.user_id,
                 APIKey.exchange == self.exchange_name,
@@ -25,7 +28,8 @@ class ExchangeConnector:
             key = key_manager.decrypt(api_key.encrypted_key)
             secret = key_manager.decrypt(api_key.encrypted_secret)
             
-            # Initialize exchange
+            # Initialize exchange (ccxt is imported on first use; it dominates app import time)
+            import ccxt
             exchange_class = getattr(ccxt, self.exchange_name)
             self.exchange = exchange_class({
                 'apiKey': key,
@@ -40,28 +44,33 @@ class ExchangeConnector:
         '''Get account balance'''
         if not self.exchange:
             self.connect()
-        return self.exchange.fetch_balance()
+        with metrics.upstream_call(self.exchange_name, 'fetch_balance'):
+            return self.exchange.fetch_balance()
     
     def create_market_buy(self, symbol, amount):
         '''Execute market buy order'''
         if not self.exchange:
             self.connect()
-        return self.exchange.create_market_buy_order(symbol, amount)
+        with metrics.upstream_call(self.exchange_name, 'create_market_buy_order'):
+            return self.exchange.create_market_buy_order(symbol, amount)
     
     def create_market_sell(self, symbol, amount):
         '''Execute market sell order'''
         if not self.exchange:
             self.connect()
-        return self.exchange.create_market_sell_order(symbol, amount)
+        with metrics.upstream_call(self.exchange_name, 'create_market_sell_order'):
+            return self.exchange.create_market_sell_order(symbol, amount)
     
     def get_ticker(self, symbol):
         '''Get current price for symbol'''
         if not self.exchange:
             self.connect()
-        return self.exchange.fetch_ticker(symbol)
+        with metrics.upstream_call(self.exchange_name, 'fetch_ticker'):
+            return self.exchange.fetch_ticker(symbol)
     
     def get_open_orders(self, symbol=None):
         '''Get all open orders'''
         if not self.exchange:
             self.connect()
-        return self.exchange.fetch_open_orders(symbol)
+        with metrics.upstream_call(self.exchange_name, 'fetch_open_orders'):
+            return self.exchange.fetch_open_orders(symbol)
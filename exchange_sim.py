@@ -0,0 +1,600 @@
+"""Deterministic local exchange simulator with the ccxt interface.
+
+install() swaps every ccxt exchange class, in both ccxt and
+ccxt.async_support, for a simulated one. ExchangeConnector,
+exchange_api.ExchangeAPI, market_proxy, market_server and backfill then run
+unchanged, with no network. Each exchange id is one simulated venue. Every
+instance the app creates for it shares the venue's clock, accounts, open
+orders and fault state, as connections to a real exchange would.
+
+Set EXCHANGE_SIM to turn it on for a whole process; app.py and backfill.py
+call install_from_env():
+
+    EXCHANGE_SIM=1 python app.py
+    EXCHANGE_SIM="seed=7,latency_ms=80,latency_p99_ms=400,rate_limit=10,error_rate=0.02" gunicorn ...
+    EXCHANGE_SIM_BINANCEUS="outage=0+600"     # per-venue overrides: binanceus down for 10 min
+
+Spec keys (comma-separated key=value; see DEFAULTS):
+
+  seed            fault draws and synthetic book sizes derive from it
+  latency_ms      median latency per call; latency_p99_ms gives the lognormal tail
+  rate_limit      calls/second per venue (1s burst); beyond it: ccxt.RateLimitExceeded
+  timeout_rate    fraction of calls that hang for the caller's timeout, then ccxt.RequestTimeout
+  error_rate      fraction of calls failing with ccxt.ExchangeNotAvailable (a 5xx)
+  outage=S+D      venue unreachable from S to S+D seconds after start; repeatable
+  start, speed    simulated clock: start time (ISO or ms, default now) and rate
+  replay=1        serve 1m history from candle_store where it has bars (with start in the past)
+  fee, spread_bps, balance_usd   account and book parameters
+
+Prices are synthetic but random-access: a sum of slow sinusoids plus hashed
+per-minute noise. Any bar at any time is therefore computed directly and is
+the same in every process. Market orders walk a synthetic order book. Limit
+orders rest until the simulated price crosses them.
+"""
+import asyncio
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import ccxt
+import numpy as np
+
+import resampler
+
+DEFAULTS = {
+    'seed': 0,
+    'latency_ms': 0.0,
+    'latency_p99_ms': None,      # None: constant latency
+    'rate_limit': 0.0,           # calls/second; 0 = unlimited
+    'timeout_rate': 0.0,
+    'error_rate': 0.0,
+    'outages': (),               # ((start_s, duration_s), ...)
+    'start': None,               # simulated time at install, ms; None = now
+    'speed': 1.0,
+    'replay': False,
+    'fee': 0.001,
+    'spread_bps': 2.0,
+    'balance_usd': 100_000.0,
+}
+SYMBOLS = ['BTC/USDT', 'ETH/USDT', 'SOL/USDT', 'BTC/USD', 'ETH/USD', 'SOL/USD', 'BTC/USDC', 'ETH/USDC']
+BASE_PRICES = {'BTC': 30000.0, 'ETH': 2000.0, 'SOL': 100.0}
+BOOK_LEVELS = 50
+
+# Slow swings (period in minutes, amplitude in log-price) under per-minute noise.
+_WAVES = ((90, 0.004), (1440, 0.015), (10080, 0.04), (43200, 0.08))
+_NOISE = 0.0008
+
+_venues = {}
+_venues_lock = threading.Lock()
+_config = dict(DEFAULTS)
+_overrides = {}      # exchange id -> config overrides
+
+
+def _hash(*parts) -> int:
+    return zlib.crc32('|'.join(map(str, parts)).encode())
+
+
+def _unit(x: np.ndarray, salt: int) -> np.ndarray:
+    """Deterministic pseudo-random values in [0, 1) for integer inputs."""
+    v = np.sin(x * 12.9898 + salt % 1000 * 78.233) * 43758.5453
+    return v - np.floor(v)
+
+
+def parse_spec(spec: str) -> dict:
+    """'seed=7,latency_ms=80,outage=30+10' -> config overrides. '1' (or empty) means defaults."""
+    config = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        key, sep, value = part.partition('=')
+        if not sep:
+            if key in ('1', 'true', 'on'):
+                continue
+            raise ValueError(f"EXCHANGE_SIM: expected key=value, got {part!r}")
+        if key == 'outage':
+            start, _, duration = value.partition('+')
+            config['outages'] = tuple(config.get('outages', ())) + ((float(start), float(duration or 60)),)
+        elif key == 'start':
+            config['start'] = int(value) if value.isdigit() else _iso_ms(value)
+        elif key == 'replay':
+            config['replay'] = value.lower() in ('1', 'true', 'on')
+        elif key in DEFAULTS:
+            config[key] = type(DEFAULTS[key] if DEFAULTS[key] is not None else 0.0)(value)
+        else:
+            raise ValueError(f"EXCHANGE_SIM: unknown key {key!r}")
+    return config
+
+
+def _iso_ms(value: str) -> int:
+    from datetime import datetime, timezone
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+def _market(symbol: str) -> dict:
+    base, quote = symbol.split('/')
+    return {
+        'id': f'{base}{quote}', 'symbol': symbol, 'base': base, 'quote': quote,
+        'baseId': base, 'quoteId': quote, 'type': 'spot', 'spot': True, 'active': True,
+        'precision': {'amount': 1e-6, 'price': 0.01},
+        'limits': {'amount': {'min': 1e-5, 'max': None}, 'cost': {'min': 1.0, 'max': None}},
+        'taker': DEFAULTS['fee'], 'maker': DEFAULTS['fee'], 'info': {},
+    }
+
+
+class Venue:
+    """One simulated exchange: clock, prices, accounts, open orders and faults."""
+
+    def __init__(self, exid: str, config: dict):
+        self.id = exid
+        self.config = config
+        self.salt = _hash(config['seed'], exid)
+        self.rng = np.random.default_rng(self.salt)
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.start_ms = config['start'] if config['start'] is not None else int(time.time() * 1000)
+        self.tokens = config['rate_limit']
+        self.refilled = self.started
+        self.markets = {s: dict(_market(s), taker=config['fee'], maker=config['fee']) for s in SYMBOLS}
+        self.accounts = {}       # api key -> {currency: [free, used]}
+        self.orders = {}         # order id -> ccxt-shaped order
+        self.next_order = 1
+
+    # ---- clock and faults -------------------------------------------------
+
+    def now_ms(self) -> int:
+        return int(self.start_ms + (time.monotonic() - self.started) * 1000 * self.config['speed'])
+
+    def fault(self, timeout_ms: float):
+        """(delay_s, exception or None) for the next call, drawn from the venue's seeded RNG."""
+        c = self.config
+        with self.lock:
+            if c['latency_p99_ms'] and c['latency_ms']:
+                sigma = math.log(c['latency_p99_ms'] / c['latency_ms']) / 2.326
+                delay = c['latency_ms'] * math.exp(sigma * self.rng.standard_normal()) / 1000
+            else:
+                delay = c['latency_ms'] / 1000
+            draw = self.rng.random()
+            elapsed = time.monotonic() - self.started
+            if any(start <= elapsed < start + duration for start, duration in c['outages']):
+                return delay, ccxt.ExchangeNotAvailable(f'{self.id} 503 Service Unavailable (simulated outage)')
+            if c['rate_limit']:
+                now = time.monotonic()
+                self.tokens = min(c['rate_limit'], self.tokens + (now - self.refilled) * c['rate_limit'])
+                self.refilled = now
+                if self.tokens < 1:
+                    return delay, ccxt.RateLimitExceeded(f'{self.id} 429 Too Many Requests (simulated)')
+                self.tokens -= 1
+            if draw < c['timeout_rate'] or delay * 1000 >= timeout_ms:
+                return timeout_ms / 1000, ccxt.RequestTimeout(f'{self.id} request timed out after {timeout_ms}ms')
+            if draw < c['timeout_rate'] + c['error_rate']:
+                return delay, ccxt.ExchangeNotAvailable(f'{self.id} 502 Bad Gateway (simulated)')
+        return delay, None
+
+    # ---- prices -----------------------------------------------------------
+
+    def market(self, symbol: str) -> dict:
+        market = self.markets.get(symbol)
+        if market is None:
+            raise ccxt.BadSymbol(f'{self.id} does not have market symbol {symbol}')
+        return market
+
+    def prices(self, symbol: str, ms) -> np.ndarray:
+        """Synthetic mid price at each time in `ms`."""
+        base = self.market(symbol)['base']
+        minutes = np.asarray(ms, dtype=np.float64) / 60_000
+        salt = _hash(symbol)
+        log_price = sum(amp * np.sin(2 * np.pi * minutes / period + salt % period)
+                        for period, amp in _WAVES)
+        log_price = log_price + _NOISE * (2 * _unit(np.floor(minutes), salt) - 1)
+        return BASE_PRICES.get(base, 10.0) * np.exp(log_price)
+
+    def _replayed(self, symbol: str, start: int, end: int):
+        """Stored 1m bars in [start, end) for replay, or None."""
+        if not self.config['replay']:
+            return None
+        from candle_store import shared as store
+        sources = [self.id] + [e for e in store.exchanges(symbol, '1m') if e != self.id]
+        for exid in sources:
+            bars = store.read(exid, symbol, '1m', start, end)
+            if len(bars):
+                return np.array(bars)
+        return None
+
+    def ohlcv(self, symbol: str, timeframe: str, since: int = None, limit: int = None) -> list:
+        step, offset = resampler.timeframe_ms(timeframe)
+        now = self.now_ms()
+        limit = min(limit or 500, 5000)
+        last = (now - offset) // step * step + offset
+        first = last - (limit - 1) * step if since is None else (since - offset + step - 1) // step * step + offset
+        opens = np.arange(first, min(first + limit * step, last + 1), step, dtype=np.int64)
+        if not len(opens):
+            return []
+        replay = self._replayed(symbol, int(opens[0]), int(min(opens[-1] + step, now + 1)))
+        if replay is not None:
+            bars = resampler.resample(replay, timeframe)
+            return [[int(b[0])] + [float(x) for x in b[1:]] for b in bars[:limit]]
+        closes_at = np.minimum(opens + step - 60_000, now)
+        o, c = self.prices(symbol, opens), self.prices(symbol, closes_at)
+        salt = _hash(symbol, timeframe)
+        wick = _NOISE * np.sqrt(step / 60_000) * (0.5 + _unit(opens // step, salt))
+        minutes = np.maximum((np.minimum(opens + step, now) - opens) / 60_000, 0)
+        volume = minutes * (2.0 + 8.0 * _unit(opens // step, salt + 1)) * 1000 / self.prices(symbol, opens)
+        return [[int(t), float(a), float(max(a, b) * (1 + w)), float(min(a, b) * (1 - w)), float(b), float(v)]
+                for t, a, b, w, v in zip(opens, o, c, wick, volume)]
+
+    def mid(self, symbol: str) -> float:
+        now = self.now_ms()
+        replay = self._replayed(symbol, now - 60_000, now + 1)
+        if replay is not None:
+            return float(replay[-1][4])
+        return float(self.prices(symbol, [now])[0])
+
+    def order_book(self, symbol: str, limit: int = None) -> dict:
+        mid = self.mid(symbol)
+        now = self.now_ms()
+        depth = min(limit or BOOK_LEVELS, BOOK_LEVELS)
+        half = mid * self.config['spread_bps'] / 20_000
+        levels = np.arange(depth)
+        sizes = 0.05 + 2.0 * _unit(levels + now // 1000, _hash(symbol, 'book', self.config['seed']))
+        sizes = sizes * 30000 / mid          # roughly constant notional per level
+        tick = mid * 0.0001
+        return {
+            'symbol': symbol,
+            'bids': [[float(mid - half - i * tick), float(s)] for i, s in zip(levels, sizes)],
+            'asks': [[float(mid + half + i * tick), float(s)] for i, s in zip(levels, sizes[::-1])],
+            'timestamp': now, 'datetime': None, 'nonce': None,
+        }
+
+    def trades(self, symbol: str, since: int = None, limit: int = None) -> list:
+        """Public trades: 0-3 a second at hashed times, priced off the synthetic mid ± half the spread."""
+        now = self.now_ms()
+        limit = min(limit or 500, 1000)
+        start = now - 60_000 if since is None else max(int(since), now - 3_600_000)
+        salt = _hash(symbol, 'trades', self.config['seed'])
+        seconds = np.arange(start // 1000, now // 1000 + 1, dtype=np.int64)
+        counts = (4 * _unit(seconds, salt)).astype(np.int64)
+        second = np.repeat(seconds, counts)
+        nth = np.arange(len(second)) - np.repeat(np.cumsum(counts) - counts, counts)
+        key = second * 4 + nth
+        ms = second * 1000 + (1000 * _unit(key, salt + 1)).astype(np.int64)
+        order = np.argsort(ms, kind='stable')
+        ms, key = ms[order], key[order]
+        keep = (ms >= start) & (ms <= now)
+        ms, key = ms[keep], key[keep]
+        window = slice(None, limit) if since is not None else slice(-limit, None)
+        ms, key = ms[window], key[window]
+        u = _unit(ms, salt + 2)
+        price = self.prices(symbol, ms) * (1 + (2 * u - 1) * self.config['spread_bps'] / 20_000)
+        amount = (0.01 + 0.5 * _unit(ms, salt + 3)) * 1000 / price
+        return [{'id': str(k), 'timestamp': int(t), 'datetime': ccxt.Exchange.iso8601(int(t)), 'symbol': symbol,
+                 'order': None, 'type': None, 'side': 'buy' if v >= 0.5 else 'sell', 'takerOrMaker': 'taker',
+                 'price': float(p), 'amount': float(a), 'cost': float(p * a), 'fee': None, 'info': {}}
+                for k, t, p, a, v in zip(key, ms, price, amount, u)]
+
+    def ticker(self, symbol: str) -> dict:
+        now = self.now_ms()
+        book = self.order_book(symbol, 1)
+        day = self.ohlcv(symbol, '1h', since=now - 86_400_000, limit=25)
+        last = self.mid(symbol)
+        open_ = day[0][1] if day else last
+        return {
+            'symbol': symbol, 'timestamp': now, 'datetime': ccxt.Exchange.iso8601(now),
+            'high': max(b[2] for b in day) if day else last, 'low': min(b[3] for b in day) if day else last,
+            'bid': book['bids'][0][0], 'bidVolume': book['bids'][0][1],
+            'ask': book['asks'][0][0], 'askVolume': book['asks'][0][1],
+            'vwap': None, 'open': open_, 'close': last, 'last': last, 'previousClose': None,
+            'change': last - open_, 'percentage': (last / open_ - 1) * 100, 'average': (last + open_) / 2,
+            'baseVolume': sum(b[5] for b in day), 'quoteVolume': sum(b[5] * b[4] for b in day), 'info': {},
+        }
+
+    # ---- accounts and orders ---------------------------------------------
+
+    def _account(self, key) -> dict:
+        if key not in self.accounts:
+            usd = self.config['balance_usd']
+            self.accounts[key] = {'USDT': [usd, 0.0], 'USD': [usd, 0.0], 'USDC': [usd, 0.0]}
+        return self.accounts[key]
+
+    def balance(self, key) -> dict:
+        with self.lock:
+            self._match()
+            account = self._account(key)
+            result = {'info': {}, 'free': {}, 'used': {}, 'total': {}, 'timestamp': self.now_ms()}
+            for currency, (free, used) in account.items():
+                result[currency] = {'free': free, 'used': used, 'total': free + used}
+                result['free'][currency], result['used'][currency] = free, used
+                result['total'][currency] = free + used
+            return result
+
+    def create_order(self, key, symbol: str, type_: str, side: str, amount: float, price: float = None) -> dict:
+        market = self.market(symbol)
+        if side not in ('buy', 'sell'):
+            raise ccxt.InvalidOrder(f'{self.id} invalid side {side}')
+        if type_ == 'limit' and not price:
+            raise ccxt.InvalidOrder(f'{self.id} limit orders need a price')
+        if amount < market['limits']['amount']['min']:
+            raise ccxt.InvalidOrder(f"{self.id} amount {amount} below minimum {market['limits']['amount']['min']}")
+        book = self.order_book(symbol)
+        levels = book['asks'] if side == 'buy' else book['bids']
+        # A market order fills at the walked price, so reserve that (plus fee), not the top of the book.
+        fill = _walk(levels, amount) if type_ == 'market' else price
+        with self.lock:
+            account = self._account(key)
+            pay, pay_amount = (market['quote'], amount * fill * (1 + self.config['fee'])) \
+                if side == 'buy' else (market['base'], amount)
+            account.setdefault(pay, [0.0, 0.0])
+            if account[pay][0] < pay_amount:
+                raise ccxt.InsufficientFunds(f'{self.id} insufficient {pay}: need {pay_amount:.8f}')
+            now = self.now_ms()
+            order = {
+                'id': str(self.next_order), 'clientOrderId': None, 'timestamp': now,
+                'datetime': ccxt.Exchange.iso8601(now), 'lastTradeTimestamp': None, 'symbol': symbol,
+                'type': type_, 'side': side, 'price': price, 'amount': amount, 'filled': 0.0,
+                'remaining': amount, 'cost': 0.0, 'average': None, 'status': 'open',
+                'fee': None, 'trades': [], 'info': {}, '_key': key, '_reserved': pay_amount,
+            }
+            self.next_order += 1
+            account[pay][0] -= pay_amount
+            account[pay][1] += pay_amount
+            self.orders[order['id']] = order
+            if type_ == 'market':
+                self._fill(order, fill)
+            else:
+                top = levels[0][0]
+                if (side == 'buy' and top <= price) or (side == 'sell' and top >= price):
+                    self._fill(order, price)
+            return _public(order)
+
+    def _fill(self, order: dict, price: float):
+        market = self.markets[order['symbol']]
+        account = self._account(order['_key'])
+        amount = order['amount']
+        fee = amount * price * self.config['fee']
+        pay = market['quote'] if order['side'] == 'buy' else market['base']
+        account[pay][1] -= order['_reserved']
+        if order['side'] == 'buy':
+            account[pay][0] += order['_reserved'] - (amount * price + fee)
+            account.setdefault(market['base'], [0.0, 0.0])[0] += amount
+        else:
+            account.setdefault(market['quote'], [0.0, 0.0])[0] += amount * price - fee
+        now = self.now_ms()
+        order.update(filled=amount, remaining=0.0, cost=amount * price, average=price, status='closed',
+                     lastTradeTimestamp=now, fee={'cost': fee, 'currency': market['quote'], 'rate': self.config['fee']})
+
+    def _match(self):
+        """Fill resting limit orders the price has crossed (called under the lock)."""
+        resting = [o for o in self.orders.values() if o['status'] == 'open']
+        for order in resting:
+            mid = self.mid(order['symbol'])
+            if (order['side'] == 'buy' and mid <= order['price']) or (order['side'] == 'sell' and mid >= order['price']):
+                self._fill(order, order['price'])
+
+    def fetch_order(self, key, order_id: str) -> dict:
+        with self.lock:
+            self._match()
+            order = self.orders.get(str(order_id))
+            if order is None or order['_key'] != key:
+                raise ccxt.OrderNotFound(f'{self.id} order {order_id} not found')
+            return _public(order)
+
+    def open_orders(self, key, symbol: str = None) -> list:
+        with self.lock:
+            self._match()
+            return [_public(o) for o in self.orders.values()
+                    if o['_key'] == key and o['status'] == 'open' and (symbol is None or o['symbol'] == symbol)]
+
+    def cancel_order(self, key, order_id: str) -> dict:
+        with self.lock:
+            self._match()
+            order = self.orders.get(str(order_id))
+            if order is None or order['_key'] != key or order['status'] != 'open':
+                raise ccxt.OrderNotFound(f'{self.id} order {order_id} not open')
+            market = self.markets[order['symbol']]
+            pay = market['quote'] if order['side'] == 'buy' else market['base']
+            account = self._account(key)
+            account[pay][0] += order['_reserved']
+            account[pay][1] -= order['_reserved']
+            order['status'] = 'canceled'
+            return _public(order)
+
+
+def _walk(levels: list, amount: float) -> float:
+    """Average fill price for `amount` taken from book levels (the last level absorbs any rest)."""
+    remaining, cost = amount, 0.0
+    for price, size in levels:
+        take = min(remaining, size)
+        cost += take * price
+        remaining -= take
+        if remaining <= 0:
+            break
+    cost += remaining * levels[-1][0]
+    return cost / amount
+
+
+def _public(order: dict) -> dict:
+    return {k: v for k, v in order.items() if not k.startswith('_')}
+
+
+def venue(exid: str) -> Venue:
+    with _venues_lock:
+        if exid not in _venues:
+            _venues[exid] = Venue(exid, dict(_config, **_overrides.get(exid, {})))
+        return _venues[exid]
+
+
+class SimExchange:
+    """The ccxt Exchange surface this app uses, backed by a shared Venue."""
+
+    id = 'sim'
+    rateLimit = 50
+    timeframes = {tf: tf for tf in ('1m', '5m', '15m', '30m', '1h', '4h', '1d', '1w')}
+    has = {'fetchOHLCV': True, 'fetchTicker': True, 'fetchTrades': True, 'fetchOrderBook': True, 'createOrder': True,
+           'fetchOpenOrders': True, 'cancelOrder': True, 'fetchBalance': True}
+
+    def __init__(self, config: dict = None):
+        config = config or {}
+        self.venue = venue(self.id)
+        self.name = f'{self.id} (simulated)'
+        self.apiKey = config.get('apiKey')
+        self.secret = config.get('secret')
+        self.timeout = config.get('timeout', 10000)
+        self.enableRateLimit = config.get('enableRateLimit', True)
+        self.options = config.get('options', {})
+        self.markets = None
+        self.currencies = None
+        self.session = _Session()
+
+    def _call(self, fn, *args):
+        delay, error = self.venue.fault(self.timeout)
+        if delay:
+            time.sleep(delay)
+        if error is not None:
+            raise error
+        return fn(*args)
+
+    # ---- ccxt API ---------------------------------------------------------
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies
+        return markets
+
+    def _markets(self):
+        markets = {s: dict(m) for s, m in self.venue.markets.items()}
+        currencies = {c: {'id': c, 'code': c, 'precision': 1e-8}
+                      for m in markets.values() for c in (m['base'], m['quote'])}
+        self.set_markets(markets, currencies)
+        return markets
+
+    def load_markets(self, reload=False, params={}):
+        if self.markets and not reload:
+            return self._result(self.markets)
+        return self._call(self._markets)
+
+    @property
+    def symbols(self):
+        return sorted(self.markets or self.venue.markets)
+
+    def market(self, symbol):
+        return self.venue.market(symbol)
+
+    def fetch_ticker(self, symbol, params={}):
+        return self._call(self.venue.ticker, symbol)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params={}):
+        return self._call(self.venue.ohlcv, symbol, timeframe, since, limit)
+
+    def fetch_trades(self, symbol, since=None, limit=None, params={}):
+        return self._call(self.venue.trades, symbol, since, limit)
+
+    def fetch_order_book(self, symbol, limit=None, params={}):
+        return self._call(self.venue.order_book, symbol, limit)
+
+    def fetch_balance(self, params={}):
+        return self._call(self.venue.balance, self.apiKey)
+
+    def create_order(self, symbol, type, side, amount, price=None, params={}):
+        return self._call(self.venue.create_order, self.apiKey, symbol, type, side, float(amount),
+                          float(price) if price is not None else None)
+
+    def create_market_buy_order(self, symbol, amount, params={}):
+        return self.create_order(symbol, 'market', 'buy', amount)
+
+    def create_market_sell_order(self, symbol, amount, params={}):
+        return self.create_order(symbol, 'market', 'sell', amount)
+
+    def create_limit_buy_order(self, symbol, amount, price, params={}):
+        return self.create_order(symbol, 'limit', 'buy', amount, price)
+
+    def create_limit_sell_order(self, symbol, amount, price, params={}):
+        return self.create_order(symbol, 'limit', 'sell', amount, price)
+
+    def fetch_order(self, id, symbol=None, params={}):
+        return self._call(self.venue.fetch_order, self.apiKey, id)
+
+    def fetch_open_orders(self, symbol=None, since=None, limit=None, params={}):
+        return self._call(self.venue.open_orders, self.apiKey, symbol)
+
+    def cancel_order(self, id, symbol=None, params={}):
+        return self._call(self.venue.cancel_order, self.apiKey, id)
+
+    def milliseconds(self):
+        return self.venue.now_ms()
+
+    def _result(self, value):
+        return value
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncSimExchange(SimExchange):
+    """ccxt.async_support flavour: the same methods, returning coroutines."""
+
+    async def _call(self, fn, *args):
+        delay, error = self.venue.fault(self.timeout)
+        if delay:
+            await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return fn(*args)
+
+    async def _result(self, value):
+        return value
+
+    async def close(self):
+        self.session.close()
+
+
+class _Session:
+    def close(self):
+        pass
+
+
+def reset():
+    """Forget every venue (clocks, accounts, orders, fault state)."""
+    with _venues_lock:
+        _venues.clear()
+
+
+def install(config: dict = None, overrides: dict = None):
+    """Replace every ccxt exchange class with a simulated venue. Returns the effective config.
+
+    overrides maps exchange id -> config keys for that venue only.
+    """
+    import ccxt.async_support as ccxt_async
+    _config.clear()
+    _config.update(DEFAULTS, **(config or {}))
+    _overrides.clear()
+    _overrides.update(overrides or {})
+    reset()
+    for exid in ccxt.exchanges:
+        setattr(ccxt, exid, type(exid, (SimExchange,), {'id': exid}))
+        setattr(ccxt_async, exid, type(exid, (AsyncSimExchange,), {'id': exid}))
+
+    # The simulated markets must not overwrite (or be read from) the real snapshot.
+    import symbol_index
+    directory = os.path.join(tempfile.gettempdir(), f"prismtrade_markets_sim_{_config['seed']}")
+    symbol_index.shared = symbol_index.SymbolIndex(directory=directory)
+    for name in ('market_proxy', 'market_server'):
+        module = sys.modules.get(name)
+        if module is not None:
+            module._ex_cache.clear()
+            getattr(module, '_resolved', {}).clear()
+    return dict(_config)
+
+
+def install_from_env() -> bool:
+    """install() when EXCHANGE_SIM is set; EXCHANGE_SIM_<ID> adds per-venue overrides."""
+    spec = os.environ.get('EXCHANGE_SIM')
+    if not spec or spec == '0':
+        return False
+    overrides = {key[len('EXCHANGE_SIM_'):].lower(): parse_spec(value)
+                 for key, value in os.environ.items() if key.startswith('EXCHANGE_SIM_')}
+    install(parse_spec(spec), overrides)
+    return True
@@ -0,0 +1,249 @@
+"""Precomputed indicator columns stored next to the candle store.
+
+Layout (under user_data/features unless FEATURE_STORE_DIR is set):
+
+    <exchange>/<SYMBOL>/<timeframe>/<spec key>/<YYYY-MM>.npy
+    <exchange>/<SYMBOL>/<timeframe>/<spec key>/_feature.json
+
+The spec key is a hash of the IndicatorSpec. Partitions hold [ms, value] rows
+in the candle store's own format (a CandleStore two columns wide). Writes are
+therefore atomic and reads memory-map. _feature.json records the spec and the
+candle range the feature covers.
+
+update() brings a feature up to date with the stored candles:
+  - a new bar is computed over indicators.lookback(spec) bars of history
+    before it. Only that tail of candles is read (the covered range is checked
+    against partition headers) and only the new rows are written,
+  - if nothing is stored yet, the indicator has no known lookback, or the
+    candles the feature already covers have changed (a backfill filled a gap
+    or reached further back), the feature is recomputed over all candles.
+
+attach() is what strategies call. It fills {column: spec} on a frame from
+stored rows matched by timestamp. Only bars past the end of the store, such
+as live bars not yet backfilled, are computed, using the same lookback tail.
+
+Disk use is bounded by FEATURE_STORE_MAX_MB. Writes update an in-memory size
+index. Once a write takes it over the limit, the store is rescanned and features
+are evicted least recently read first until it fits. An evicted feature is
+recomputed the next time it is needed.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+import candle_store
+import metrics
+from candle_store import CandleStore
+from indicators import IndicatorRegistry, lookback
+from resampler import timeframe_ms
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FEATURE_STORE_DIR = os.environ.get('FEATURE_STORE_DIR', os.path.join(BASE_DIR, 'user_data', 'features'))
+FEATURE_STORE_MAX_MB = float(os.environ.get('FEATURE_STORE_MAX_MB', 2048))
+
+_META = '_feature.json'
+_OHLCV = ['open', 'high', 'low', 'close', 'volume']
+
+
+def spec_key(s) -> str:
+    return hashlib.sha1(repr(s).encode()).hexdigest()[:16]
+
+
+def _compute(s, frame: pd.DataFrame) -> np.ndarray:
+    return IndicatorRegistry().compute(None, frame, [s])[s]
+
+
+def _dir_size(directory: str) -> int:
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(directory) if entry.is_file())
+    except OSError:
+        return 0
+
+
+def _candle_frame(rows: np.ndarray) -> pd.DataFrame:
+    frame = pd.DataFrame(np.asarray(rows[:, 1:]), columns=_OHLCV)
+    frame['timestamp'] = rows[:, 0]
+    return frame
+
+
+def _to_ms(df: pd.DataFrame) -> np.ndarray:
+    column = df['date'] if 'date' in df.columns else df['timestamp']
+    if pd.api.types.is_numeric_dtype(column):
+        return column.to_numpy(dtype=np.float64)
+    return pd.DatetimeIndex(pd.to_datetime(column, utc=True)).as_unit('ms').asi8.astype(np.float64)
+
+
+class FeatureStore:
+    def __init__(self, root: str = FEATURE_STORE_DIR, candles: CandleStore = None,
+                 max_bytes: float = FEATURE_STORE_MAX_MB * 2 ** 20):
+        self.root = root
+        self.candles = candles or candle_store.shared
+        self.max_bytes = max_bytes
+        self._store = CandleStore(root, width=2)
+        self._lock = threading.Lock()
+        self._sizes = None          # {feature directory: bytes}, filled by the first scan
+
+    @staticmethod
+    def _timeframe(timeframe: str, s) -> str:
+        return os.path.join(timeframe, spec_key(s))
+
+    def path(self, exchange: str, symbol: str, timeframe: str, s) -> str:
+        return self._store.path(exchange, symbol, self._timeframe(timeframe, s))
+
+    def _meta(self, directory: str) -> dict:
+        try:
+            with open(os.path.join(directory, _META)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def read(self, exchange: str, symbol: str, timeframe: str, s, start: int = None, end: int = None) -> np.ndarray:
+        """Stored [ms, value] rows with start <= ms < end, oldest first."""
+        try:
+            os.utime(os.path.join(self.path(exchange, symbol, timeframe, s), _META))    # eviction order
+        except OSError:
+            pass
+        return self._store.read(exchange, symbol, self._timeframe(timeframe, s), start, end)
+
+    # ---- writes ----------------------------------------------------------
+
+    def update(self, exchange: str, symbol: str, timeframe: str, specs) -> int:
+        """Bring each spec's stored feature up to date with the candle store. Returns rows written."""
+        written, touched = 0, set()
+        with self._lock:
+            for s in specs:
+                rows = self._update(exchange, symbol, timeframe, s)
+                if rows:
+                    written += rows
+                    touched.add(self.path(exchange, symbol, timeframe, s))
+            if written:
+                sizes = self._sizes if self._sizes is not None else self._scan()[1]
+                for directory in touched:
+                    sizes[directory] = _dir_size(directory)
+                if sum(sizes.values()) > self.max_bytes:
+                    self._evict(touched)
+        return written
+
+    def _tail(self, exchange: str, symbol: str, timeframe: str, meta: dict, bars: int) -> tuple:
+        """Candles from `bars` rows before meta['last'] onwards, and the index of the first new one."""
+        step, _ = timeframe_ms(timeframe)
+        span = max(bars, 1)
+        while True:
+            start = meta['last'] - span * step
+            candles = self.candles.read(exchange, symbol, timeframe, start=start)
+            covered = int(np.searchsorted(candles[:, 0], meta['last'], side='right'))
+            if covered >= bars or start <= meta['first']:      # enough history, or all of it
+                return candles, covered
+            span *= 2                                           # gaps: widen until `bars` rows fit
+
+    def _update(self, exchange: str, symbol: str, timeframe: str, s) -> int:
+        directory = self.path(exchange, symbol, timeframe, s)
+        meta, bars = self._meta(directory), lookback(s)
+        if (meta and bars is not None
+                and self.candles.first(exchange, symbol, timeframe) == meta['first']
+                and self.candles.count(exchange, symbol, timeframe, meta['last'] + 1) == meta['rows']):
+            candles, covered = self._tail(exchange, symbol, timeframe, meta, bars)
+            if covered == len(candles):
+                return 0
+            lo = max(0, covered - bars)
+            values = _compute(s, _candle_frame(candles[lo:]))[covered - lo:]
+            rows = np.column_stack([candles[covered:, 0], values])
+            total = meta['rows'] + len(rows)
+            metrics.cache_hit('feature_store')
+        else:
+            candles = self.candles.read(exchange, symbol, timeframe)
+            if not len(candles):
+                return 0
+            shutil.rmtree(directory, ignore_errors=True)
+            rows = np.column_stack([candles[:, 0], _compute(s, _candle_frame(candles))])
+            meta, total = {'first': float(candles[0, 0])}, len(candles)
+            metrics.cache_miss('feature_store')
+        self._store.write(exchange, symbol, self._timeframe(timeframe, s), rows)
+        meta = {'spec': repr(s), 'first': meta['first'], 'last': float(rows[-1, 0]), 'rows': total}
+        tmp = os.path.join(directory, f'{_META}.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(directory, _META))
+        return len(rows)
+
+    def _scan(self) -> tuple:
+        """Walk the store: ([(last read, bytes, directory), ...], {directory: bytes}). Refreshes the size index."""
+        features, sizes = [], {}
+        for directory, subdirs, files in os.walk(self.root):
+            if _META not in files:
+                continue
+            subdirs[:] = []
+            try:
+                size = sum(os.path.getsize(os.path.join(directory, f)) for f in files)
+                used = os.path.getmtime(os.path.join(directory, _META))
+            except OSError:
+                continue
+            features.append((used, size, directory))
+            sizes[directory] = size
+        self._sizes = sizes
+        return features, sizes
+
+    def evict(self, keep=()):
+        """Delete the least recently read features until the store fits in max_bytes."""
+        with self._lock:
+            self._evict(keep)
+
+    def _evict(self, keep):
+        features, sizes = self._scan()
+        total = sum(sizes.values())
+        for used, size, directory in sorted(features):
+            if total <= self.max_bytes:
+                break
+            if directory in keep:
+                continue
+            shutil.rmtree(directory, ignore_errors=True)
+            metrics.inc('prismtrade_feature_evictions_total')
+            del sizes[directory]
+            total -= size
+
+    # ---- reads for strategies --------------------------------------------
+
+    def attach(self, df: pd.DataFrame, exchange: str, symbol: str, timeframe: str, columns: dict) -> pd.DataFrame:
+        """Add {column_name: spec} to df (in place) from stored features and return it.
+
+        df's bars ('date' or 'timestamp' column) are matched to stored rows. Bars after the
+        last stored one are computed over a lookback tail of df. If df has bars the store
+        lacks anywhere else, that column is computed over df in full.
+        """
+        if not len(df):
+            for column in columns:
+                df[column] = np.empty(0)
+            return df
+        ms = _to_ms(df)
+        self.update(exchange, symbol, timeframe, set(columns.values()))
+        for column, s in columns.items():
+            stored = self.read(exchange, symbol, timeframe, s, ms[0], ms[-1] + 1)
+            if len(stored) == len(ms) and stored[0, 0] == ms[0] and stored[-1, 0] == ms[-1]:
+                df[column] = np.array(stored[:, 1])      # df is a contiguous run of stored bars
+                metrics.cache_hit('feature_store')
+                continue
+            at = np.minimum(np.searchsorted(stored[:, 0], ms), max(len(stored) - 1, 0))
+            matched = stored[at, 0] == ms if len(stored) else np.zeros(len(ms), dtype=bool)
+            values = np.full(len(ms), np.nan)
+            values[matched] = stored[at[matched], 1]
+            missing = np.flatnonzero(~matched)
+            if len(missing):
+                metrics.cache_miss('feature_store')
+                first, bars = int(missing[0]), lookback(s)
+                if bars is not None and len(missing) == len(ms) - first:
+                    lo = max(0, first - bars)
+                    values[first:] = _compute(s, df.iloc[lo:])[first - lo:]
+                else:
+                    values = _compute(s, df)
+            else:
+                metrics.cache_hit('feature_store')
+            df[column] = values
+        return df
+
+
+shared = FeatureStore()
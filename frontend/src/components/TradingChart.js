@@ -7,8 +7,31 @@ import { createChart, CrosshairMode } from 'lightweight-charts';
  * Data comes from OUR backend (/api/market/candles), which fetches public OHLCV
  * server-side from Binance.US. This avoids the browser CORS / US geo-block you get
  * calling api.binance.com directly. History loads once, then we poll for updates.
+ *
+ * History is requested in the compact columnar format (one typed array per field,
+ * see candle_codec.py) so the browser doesn't parse hundreds of float strings; polls
+ * ask only for bars since the last one we have.
  */
 const POLL_MS = 3000;
+const COLUMNAR_MIME = 'application/vnd.prismtrade.candles';
+
+// Decode the columnar body into [[ms, o, h, l, c, v], ...] rows.
+function decodeColumnar(buf) {
+  const view = new DataView(buf);
+  const n = view.getUint32(4, true);
+  const width = view.getUint8(8);
+  const Values = width === 8 ? Float64Array : Float32Array;
+  const ts = new Float64Array(buf, 16, n);
+  const cols = [];
+  let offset = 16 + 8 * n;
+  for (let f = 0; f < 5; f++) {
+    cols.push(new Values(buf, offset, n));
+    offset += width * n;
+  }
+  const rows = new Array(n);
+  for (let i = 0; i < n; i++) rows[i] = [ts[i], cols[0][i], cols[1][i], cols[2][i], cols[3][i], cols[4][i]];
+  return rows;
+}
 
 export default function TradingChart({ symbol = 'BTCUSDT', interval = '1m', onPrice }) {
   const containerRef = useRef(null);
@@ -53,21 +76,26 @@ export default function TradingChart({ symbol = 'BTCUSDT', interval = '1m', onPr
     let timer = null;
     setStatus('connecting');
 
-    const url = (limit) => `/api/market/candles?symbol=${symbol}&interval=${interval}&limit=${limit}`;
+    const url = (limit, since) =>
+      `/api/market/candles?symbol=${symbol}&interval=${interval}&limit=${limit}` + (since ? `&since=${since}` : '');
+    let lastTs = null;
     const toCandle = (k) => ({ time: k[0] / 1000, open: +k[1], high: +k[2], low: +k[3], close: +k[4] });
     const toVol = (k) => ({ time: k[0] / 1000, value: +k[5], color: +k[4] >= +k[1] ? 'rgba(0,255,65,0.3)' : 'rgba(255,68,68,0.3)' });
 
     async function loadHistory() {
       try {
-        const res = await fetch(url(500));
+        const res = await fetch(url(500), { headers: { Accept: `${COLUMNAR_MIME}, application/json;q=0.5` } });
         if (!res.ok) throw new Error(`HTTP ${res.status}`);
-        const raw = await res.json();
+        const raw = (res.headers.get('Content-Type') || '').startsWith(COLUMNAR_MIME)
+          ? decodeColumnar(await res.arrayBuffer())
+          : await res.json();
         if (cancelled || !Array.isArray(raw) || !raw.length) {
           if (!cancelled) setStatus('error');
           return;
         }
         candleSeriesRef.current?.setData(raw.map(toCandle));
         volumeSeriesRef.current?.setData(raw.map(toVol));
+        lastTs = raw[raw.length - 1][0];
         const c = +raw[raw.length - 1][4];
         setLast(c); onPrice?.(c); setStatus('live');
       } catch (e) {
@@ -77,11 +105,13 @@ export default function TradingChart({ symbol = 'BTCUSDT', interval = '1m', onPr
 
     async function poll() {
       try {
-        const res = await fetch(url(2));
+        // Delta poll: the still-forming bar plus anything newer.
+        const res = await fetch(lastTs ? url(10, lastTs) : url(2));
         if (!res.ok) return;
         const raw = await res.json();
         if (cancelled || !Array.isArray(raw) || !raw.length) return;
         raw.forEach(k => { candleSeriesRef.current?.update(toCandle(k)); volumeSeriesRef.current?.update(toVol(k)); });
+        lastTs = raw[raw.length - 1][0];
         const c = +raw[raw.length - 1][4];
         setLast(c); onPrice?.(c); setStatus('live');
       } catch (e) { /* transient; keep polling */ }
@@ -0,0 +1,21 @@
+"""gunicorn settings. gunicorn reads ./gunicorn.conf.py automatically, so these
+apply to the Procfile, railway and Dockerfile commands alike; see startup.py."""
+
+preload_app = True
+
+
+def when_ready(server):
+    import metrics
+    metrics.clear_snapshots()      # snapshots of a previous run's workers
+    import startup
+    report = startup.warm()
+    server.log.info("Warmed in %ss: markets %s, %d symbols resolved",
+                    report['seconds'], report['markets'], len(report['resolved']))
+
+
+def post_fork(server, worker):
+    import metrics
+    metrics.start_worker()
+    # Connections opened by init_db() in the master must not be shared with workers.
+    from database import engine
+    engine.dispose(close=False)
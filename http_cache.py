@@ -0,0 +1,86 @@
+"""HTTP caching for API reads: version-based ETags, 304s and compression.
+
+Read endpoints compute a cheap version for what they are about to return
+(e.g. the latest updated_at and a row count, or the last candle) and call
+
+    etag = http_cache.make_etag('strategies', user.id, version)
+    cached = http_cache.not_modified(etag)
+    if cached:
+        return cached
+    ...
+    return http_cache.tag(jsonify(body), etag), 200
+
+A matching If-None-Match gets a 304 before the body is queried or
+serialised. Responses are `Cache-Control: private, no-cache`, so browsers
+keep them and revalidate on every poll. Dashboard polling then mostly turns
+into 304s.
+
+Separately, enable_compression(app) gzip/brotli-encodes responses larger
+than COMPRESS_MIN_BYTES when the client accepts it. brotli is used only if
+the package is installed.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:      # optional: gzip only
+    brotli = None
+
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 5           # most of level 9's ratio at a fraction of the CPU
+BROTLI_QUALITY = 4
+COMPRESSIBLE = ('application/json', 'text/', 'application/javascript',
+                'application/vnd.prismtrade.candles', 'application/vnd.apache.arrow.stream')
+
+
+def make_etag(*parts) -> str:
+    """Stable opaque tag for the given version parts (scope, user id, version...)."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()[:20]
+
+
+def matches(if_none_match: str, etag: str) -> bool:
+    """Whether an If-None-Match header value matches `etag` (weak comparison; '*' matches any)."""
+    from werkzeug.http import parse_etags
+    return bool(if_none_match) and parse_etags(if_none_match).contains_weak(etag)
+
+
+def not_modified(etag: str):
+    """A 304 response if the request's If-None-Match matches `etag`, else None."""
+    from flask import Response, request
+    if request.if_none_match and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+        return tag(response, etag)
+    return None
+
+
+def tag(response, etag: str):
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _compress(response, accept_encoding: str):
+    if (response.direct_passthrough or response.status_code < 200 or response.status_code in (204, 304)
+            or 'Content-Encoding' in response.headers
+            or not (response.mimetype or '').startswith(COMPRESSIBLE)):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
+    if brotli is not None and 'br' in accept_encoding:
+        response.set_data(brotli.compress(data, quality=BROTLI_QUALITY))
+        response.headers['Content-Encoding'] = 'br'
+    elif 'gzip' in accept_encoding:
+        response.set_data(gzip.compress(data, compresslevel=GZIP_LEVEL))
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+
+def enable_compression(app):
+    from flask import request
+
+    @app.after_request
+    def _compress_response(response):
+        return _compress(response, request.headers.get('Accept-Encoding', ''))
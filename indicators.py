@@ -0,0 +1,185 @@
+"""Shared indicator registry.
+
+Strategies declare the indicators they need as IndicatorSpec(name, params,
+source) instead of computing them inline. The registry computes each unique
+spec once per series per new bar and hands every consumer the same read-only
+NumPy array, so running 100 strategies on BTC/USDT 15m costs one RSI(14),
+not 100.
+
+A spec's source is either an OHLCV column ('close', 'high', ...) or another
+IndicatorSpec, so indicators form a DAG, e.g. an EMA of an RSI:
+
+    rsi = spec('rsi', period=14)
+    rsi_signal = spec('ema', source=rsi, period=9)
+    arrays = shared.compute(('binanceus', 'BTC/USDT', '15m'), df, [rsi, rsi_signal])
+"""
+import os
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+import pandas as pd
+
+import metrics
+
+INDICATOR_SERIES_MAX = int(os.environ.get('INDICATOR_SERIES_MAX', 256))   # series kept per registry (LRU)
+_OHLCV = ('open', 'high', 'low', 'close', 'volume')
+
+IndicatorSpec = namedtuple('IndicatorSpec', ['name', 'params', 'source'])
+
+
+def spec(name: str, source='close', **params) -> IndicatorSpec:
+    """Hashable indicator declaration. Params are stored sorted so order doesn't matter."""
+    return IndicatorSpec(name, tuple(sorted(params.items())), source)
+
+
+# ---- indicator functions (values: float64 ndarray -> float64 ndarray) ------
+
+def sma(values: np.ndarray, period: int) -> np.ndarray:
+    return pd.Series(values).rolling(window=period).mean().to_numpy(copy=True)
+
+
+def ema(values: np.ndarray, period: int) -> np.ndarray:
+    """EMA seeded with the SMA of the first `period` values (same as TA-Lib)."""
+    out = np.full(len(values), np.nan)
+    if len(values) < period:
+        return out
+    seeded = np.concatenate(([values[:period].mean()], values[period:]))
+    out[period - 1:] = pd.Series(seeded).ewm(span=period, adjust=False).mean().to_numpy()
+    return out
+
+
+def rsi(values: np.ndarray, period: int = 14) -> np.ndarray:
+    """Wilder's RSI, seeded with the simple mean of the first `period` moves (same as TA-Lib)."""
+    out = np.full(len(values), np.nan)
+    if len(values) <= period:
+        return out
+    delta = np.diff(values)
+    gains = np.clip(delta, 0, None)
+    losses = np.clip(-delta, 0, None)
+    # Wilder smoothing is an EMA with alpha=1/period once seeded.
+    g = np.concatenate(([gains[:period].mean()], gains[period:]))
+    l = np.concatenate(([losses[:period].mean()], losses[period:]))
+    avg_gain = pd.Series(g).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+    avg_loss = pd.Series(l).ewm(alpha=1 / period, adjust=False).mean().to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        out[period:] = np.where(avg_loss == 0, 100.0, 100 - 100 / (1 + avg_gain / avg_loss))
+    return out
+
+
+INDICATORS = {
+    'sma': sma,
+    'ema': ema,
+    'rsi': rsi,
+}
+
+# Bars of history a new value needs to match a full recompute, as fn(**params).
+# EMA and Wilder smoothing never forget their seed; after these many bars its
+# weight is below 1e-8, which is below float noise in the output.
+LOOKBACK = {
+    'sma': lambda period: period,
+    'ema': lambda period: 10 * period,
+    'rsi': lambda period=14: 20 * period,
+}
+
+
+def register(name: str, fn, lookback=None):
+    """Add an indicator function: fn(values, **params) -> ndarray of the same length.
+
+    lookback(**params) -> bars of history needed per value lets the feature store append
+    new bars incrementally; without it, stored features are recomputed in full.
+    """
+    INDICATORS[name] = fn
+    if lookback is not None:
+        LOOKBACK[name] = lookback
+    else:
+        LOOKBACK.pop(name, None)
+
+
+def lookback(s: IndicatorSpec):
+    """Bars of history `s` needs per value, including its sources; None if unknown."""
+    fn = LOOKBACK.get(s.name)
+    if fn is None:
+        return None
+    bars = fn(**dict(s.params))
+    if isinstance(s.source, IndicatorSpec):
+        inner = lookback(s.source)
+        return None if inner is None else bars + inner
+    return bars
+
+
+# ---- registry --------------------------------------------------------------
+
+class IndicatorRegistry:
+    """Per-series cache of computed indicator arrays.
+
+    A series is identified by any hashable key. Use (exchange, pair, timeframe):
+    the same pair has different bars on different exchanges. Its cached arrays
+    are valid while the series has the same length, first and last timestamp and
+    last bar values. A new bar, or an update to the forming one, invalidates them
+    and each spec is recomputed once on the next request. At
+    most max_series series are kept, least recently used evicted first.
+    """
+
+    def __init__(self, max_series: int = INDICATOR_SERIES_MAX):
+        self.max_series = max_series
+        self._series = OrderedDict()     # series_key -> {'version': (...), 'arrays': {spec: ndarray}}
+        self._lock = threading.Lock()
+        self.computed = 0     # number of indicator evaluations, for benchmarks/metrics
+
+    @staticmethod
+    def _version(df: pd.DataFrame):
+        if not len(df):
+            return (0,)
+        ts_col = 'date' if 'date' in df.columns else 'timestamp'
+        last = tuple(float(df[c].iat[-1]) for c in _OHLCV if c in df.columns)    # the forming bar moves in place
+        return (len(df), df[ts_col].iat[0], df[ts_col].iat[-1], last)
+
+    def _resolve(self, s: IndicatorSpec, df: pd.DataFrame, arrays: dict) -> np.ndarray:
+        if s in arrays:
+            metrics.cache_hit('indicators')
+            return arrays[s]
+        metrics.cache_miss('indicators')
+        if isinstance(s.source, IndicatorSpec):
+            source = self._resolve(s.source, df, arrays)
+        else:
+            source = df[s.source].to_numpy(dtype=float)
+        if s.name not in INDICATORS:
+            raise Exception(f"Unknown indicator {s.name}")
+        values = INDICATORS[s.name](source, **dict(s.params))
+        values.setflags(write=False)
+        arrays[s] = values
+        self.computed += 1
+        return values
+
+    def compute(self, series_key, df: pd.DataFrame, specs) -> dict:
+        """Return {spec: read-only ndarray} for `specs` on this series."""
+        version = self._version(df)
+        with self._lock:
+            entry = self._series.get(series_key)
+            if entry is None or entry['version'] != version:
+                entry = {'version': version, 'arrays': {}}
+                self._series[series_key] = entry
+                if len(self._series) > self.max_series:
+                    self._series.popitem(last=False)
+            self._series.move_to_end(series_key)
+            return {s: self._resolve(s, df, entry['arrays']) for s in specs}
+
+    def apply(self, series_key, df: pd.DataFrame, columns: dict) -> pd.DataFrame:
+        """Add {column_name: spec} to df from the shared cache (in place) and return it."""
+        arrays = self.compute(series_key, df, columns.values())
+        for column, s in columns.items():
+            df[column] = arrays[s]
+        return df
+
+    def drop(self, series_key):
+        with self._lock:
+            self._series.pop(series_key, None)
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+
+# Singleton instance
+shared = IndicatorRegistry()
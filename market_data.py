@@ -1,78 +1,177 @@
-﻿import requests
+﻿import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import requests
+import numpy as np
 import pandas as pd
-from datetime import datetime, timedelta
+import metrics
+import resampler
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+CACHE_DIR = os.environ.get('MARKET_DATA_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'prismtrade_coingecko'))
+TIMEOUT = (3.05, 20)          # connect, read (seconds)
+COINS_TTL = 24 * 3600         # the coin list changes a few times a day at most
+CHART_TTL = 3600              # relative-window history: its newest points move
+RECENT_CHART_TTL = 60         # days <= 1 has 5-minute points
+MAX_PARALLEL = 4              # concurrent requests for multi-coin fetches (free tier is ~30/min)
+RETRY_AFTER_MAX = 10          # longest Retry-After a request thread will sleep for (seconds)
+
+class _CappedRetry(Retry):
+    """Retry that sleeps for at most RETRY_AFTER_MAX, whatever Retry-After the server sends."""
+
+    def get_retry_after(self, response):
+        seconds = super().get_retry_after(response)
+        return None if seconds is None else min(seconds, RETRY_AFTER_MAX)
+
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+
+def session() -> requests.Session:
+    """Process-wide keep-alive session: pooled connections, timeouts via _get, retries with backoff.
+
+    Retries cover connection errors, 429 (honouring Retry-After up to RETRY_AFTER_MAX) and 5xx on GETs.
+    """
+    global _session, _session_pid
+    if _session_pid != os.getpid():
+        with _session_lock:
+            if _session_pid != os.getpid():    # also after a fork: don't share the parent's sockets
+                retry = _CappedRetry(total=4, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                              allowed_methods=frozenset(['GET']), respect_retry_after_header=True)
+                s = requests.Session()
+                s.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=MAX_PARALLEL * 2, max_retries=retry))
+                s.headers['Accept-Encoding'] = 'gzip, deflate'
+                _session, _session_pid = s, os.getpid()
+    return _session
+
 
 class MarketDataProvider:
     """Alternative market data using CoinGecko (no API key needed)"""
     
-    def __init__(self):
+    def __init__(self, cache_dir: str = CACHE_DIR):
         self.base_url = "https://api.coingecko.com/api/v3"
+        self.cache_dir = cache_dir
+    
+    def _get(self, path, params=None, ttl=0):
+        """GET base_url + path as JSON. With ttl > 0 (ttl=None: forever) the response is cached on
+        disk; a stale entry is still returned if CoinGecko fails or rate-limits us."""
+        key = hashlib.sha1(json.dumps([path, sorted((params or {}).items())]).encode()).hexdigest()
+        cache_path = os.path.join(self.cache_dir, f'{key}.json')
+        cached = None
+        if ttl != 0:
+            try:
+                with open(cache_path) as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = None
+            if cached and (ttl is None or time.time() - cached['fetched_at'] < ttl):
+                metrics.cache_hit('coingecko')
+                return cached['data']
+            metrics.cache_miss('coingecko')
+        try:
+            with metrics.upstream_call('coingecko', path.strip('/').split('/')[0]):
+                r = session().get(f"{self.base_url}{path}", params=params, timeout=TIMEOUT)
+                r.raise_for_status()
+                data = r.json()
+        except requests.RequestException:
+            if cached:
+                return cached['data']
+            raise
+        if ttl != 0:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f'{cache_path}.{os.getpid()}.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'fetched_at': time.time(), 'data': data}, f)
+            os.replace(tmp, cache_path)
+        return data
     
     def get_ticker(self, coin='bitcoin', vs_currency='usd'):
         """Get current price"""
-        url = f"{self.base_url}/simple/price"
+        return self.get_tickers([coin], vs_currency)[coin]
+    
+    def get_tickers(self, coins, vs_currency='usd'):
+        """Current prices for many coins in one request: {coin: ticker}"""
         params = {
-            'ids': coin,
+            'ids': ','.join(coins),
             'vs_currencies': vs_currency,
             'include_24hr_change': 'true',
             'include_24hr_vol': 'true',
             'include_last_updated_at': 'true'
         }
-        r = requests.get(url, params=params)
-        data = r.json()[coin]
+        data = self._get('/simple/price', params)
         
-        return {
+        return {coin: {
             'symbol': f'{coin.upper()}/{vs_currency.upper()}',
-            'last_price': data[vs_currency],
-            'change_24h': data.get(f'{vs_currency}_24h_change', 0),
-            'volume_24h': data.get(f'{vs_currency}_24h_vol', 0),
-            'timestamp': data.get('last_updated_at', int(datetime.now().timestamp()))
-        }
+            'last_price': data[coin][vs_currency],
+            'change_24h': data[coin].get(f'{vs_currency}_24h_change', 0),
+            'volume_24h': data[coin].get(f'{vs_currency}_24h_vol', 0),
+            'timestamp': data[coin].get('last_updated_at', int(datetime.now().timestamp()))
+        } for coin in coins if coin in data}
     
     def get_ohlcv(self, coin='bitcoin', vs_currency='usd', days=7):
         """Get historical OHLCV data"""
-        url = f"{self.base_url}/coins/{coin}/market_chart"
         params = {
             'vs_currency': vs_currency,
             'days': days
         }
-        r = requests.get(url, params=params)
-        data = r.json()
-        
+        ttl = RECENT_CHART_TTL if float(days) <= 1 else CHART_TTL
+        return self._to_ohlcv(self._get(f"/coins/{coin}/market_chart", params, ttl=ttl))
+    
+    def get_ohlcv_range(self, coin='bitcoin', start=None, end=None, vs_currency='usd'):
+        """Historical OHLCV between two datetimes (end defaults to now, start to 7 days before
+        end, as in get_ohlcv). A window that ended over a day ago can no longer change, so it
+        is cached on disk for good."""
+        end = end or datetime.now(timezone.utc)
+        start = start or end - timedelta(days=7)
+        params = {
+            'vs_currency': vs_currency,
+            'from': int(start.timestamp()),
+            'to': int(end.timestamp())
+        }
+        # Compare epoch seconds: end may be naive (local time) or tz-aware.
+        immutable = end.timestamp() < (datetime.now(timezone.utc) - timedelta(days=1)).timestamp()
+        return self._to_ohlcv(self._get(f"/coins/{coin}/market_chart/range", params,
+                                        ttl=None if immutable else CHART_TTL))
+    
+    def get_ohlcv_many(self, coins, vs_currency='usd', days=7):
+        """get_ohlcv for several coins concurrently (MAX_PARALLEL at a time): {coin: DataFrame}"""
+        with ThreadPoolExecutor(min(MAX_PARALLEL, max(1, len(coins)))) as pool:
+            frames = pool.map(lambda c: self.get_ohlcv(c, vs_currency, days), coins)
+            return dict(zip(coins, frames))
+    
+    @staticmethod
+    def _to_ohlcv(data):
         # Debug: Check what we got
         if 'prices' not in data:
             raise Exception(f"API Error: {data}")
         
-        # Convert to DataFrame
-        df = pd.DataFrame({
-            'timestamp': [pd.Timestamp(x[0], unit='ms') for x in data['prices']],
-            'close': [x[1] for x in data['prices']]
-        })
-        
-        if 'total_volumes' in data:
-            df['volume'] = [x[1] for x in data['total_volumes']]
-        
-        # Create OHLCV by resampling to hourly candles
-        df.set_index('timestamp', inplace=True)
-        
-        ohlcv = pd.DataFrame()
-        ohlcv['open'] = df['close'].resample('1h').first()
-        ohlcv['high'] = df['close'].resample('1h').max()
-        ohlcv['low'] = df['close'].resample('1h').min()
-        ohlcv['close'] = df['close'].resample('1h').last()
-        if 'volume' in df.columns:
-            ohlcv['volume'] = df['volume'].resample('1h').sum()
+        # Price points -> hourly OHLCV in one resampling pass
+        prices = np.asarray(data['prices'], dtype=np.float64).reshape(-1, 2)
+        has_volume = 'total_volumes' in data
+        volume = np.asarray(data['total_volumes'], dtype=np.float64).reshape(-1, 2)[:, 1] if has_volume \
+            else np.zeros(len(prices))
+        price = prices[:, 1]
+        bars = resampler.resample(np.column_stack([prices[:, 0], price, price, price, price, volume]), '1h')
         
+        columns = ['open', 'high', 'low', 'close', 'volume'] if has_volume else ['open', 'high', 'low', 'close']
+        ohlcv = pd.DataFrame(bars[:, 1:1 + len(columns)], columns=columns)
+        ohlcv.insert(0, 'timestamp', pd.to_datetime(bars[:, 0].astype(np.int64), unit='ms'))
         ohlcv.dropna(inplace=True)
-        ohlcv.reset_index(inplace=True)
+        ohlcv.reset_index(drop=True, inplace=True)
         
         return ohlcv
     
-    def get_supported_coins(self):
-        """Get list of supported coins"""
-        url = f"{self.base_url}/coins/list"
-        r = requests.get(url)
-        return r.json()[:100]
+    def get_supported_coins(self, limit=100):
+        """Get list of supported coins (the full list is fetched once a day, then served from disk)"""
+        return self._get('/coins/list', ttl=COINS_TTL)[:limit]
 
 # Quick test function
 if __name__ == "__main__":
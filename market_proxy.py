@@ -6,14 +6,19 @@ same-origin.
 
 Self-healing source selection: we try several public exchanges in order and cache
 whichever one actually works from this server, so we don't depend on any single
-provider being reachable from a given region.
+provider being reachable from a given region. Which exchange lists which symbol
+comes from the persisted symbol_index, so resolving is a dict lookup and a cold
+process can initialise its exchanges without calling load_markets().
 """
-import ccxt
+import metrics
+import resampler
+import symbol_index
+import tracing
 
 # Tried in order. Binance.US / Kraken / Coinbase are all reachable from US servers
 # and need no API key for public market data.
 _CANDIDATES = ['binanceus', 'kraken', 'coinbase']
-_QUOTES = ('USDT', 'USDC', 'USD', 'BTC', 'ETH', 'BNB')
+_REFRESH_TIMEOUT_MS = 5000   # per exchange, so a dead one can't stall a rebuild
 
 _ex_cache = {}        # exchange_id -> ccxt instance
 _resolved = {}        # input symbol -> (exchange_id, ccxt_symbol)
@@ -21,50 +26,87 @@ _resolved = {}        # input symbol -> (exchange_id, ccxt_symbol)
 
 def _exchange(exid):
     if exid not in _ex_cache:
-        _ex_cache[exid] = getattr(ccxt, exid)({'enableRateLimit': True})
+        import ccxt      # imported on first use; it dominates worker import time
+        ex = getattr(ccxt, exid)({'enableRateLimit': True})
+        snap = symbol_index.shared.snapshot(exid)
+        if snap:
+            ex.set_markets(*snap)
+        _ex_cache[exid] = ex
     return _ex_cache[exid]
 
 
-def _base(symbol: str) -> str:
-    if '/' in symbol:
-        return symbol.split('/')[0]
-    for q in _QUOTES:
-        if symbol.endswith(q):
-            return symbol[:-len(q)]
-    return symbol
+def _fetch_markets(exid):
+    """symbol_index loader: fresh markets from a throwaway instance, pushed into the live one."""
+    import ccxt
+    ex = getattr(ccxt, exid)({'enableRateLimit': True, 'timeout': _REFRESH_TIMEOUT_MS})
+    try:
+        with metrics.upstream_call(exid, 'load_markets'):
+            markets = ex.load_markets()
+    finally:
+        ex.session.close()
+    if exid in _ex_cache:
+        _ex_cache[exid].set_markets(markets, ex.currencies)
+    return markets, ex.currencies
+
+
+def symbols(block: bool = False) -> symbol_index.SymbolIndex:
+    """The shared index: from disk, else built now; rebuilt in the background once stale."""
+    return symbol_index.shared.ensure(_fetch_markets, _CANDIDATES, block=block)
 
 
 def _resolve(symbol: str):
     """Find a reachable (exchange, symbol) for the requested pair. Cached after first hit."""
     if symbol in _resolved:
+        metrics.cache_hit('market_resolve')
         return _resolved[symbol]
-    base = _base(symbol)
-    for exid in _CANDIDATES:
-        try:
-            ex = _exchange(exid)
-            markets = ex.load_markets()
-            for sym in (f"{base}/USDT", f"{base}/USD", f"{base}/USDC"):
-                if sym in markets:
-                    _resolved[symbol] = (exid, sym)
-                    return _resolved[symbol]
-        except Exception:
-            continue  # try next exchange
-    return (None, None)
+    metrics.cache_miss('market_resolve')
+    with tracing.span('market_proxy.resolve', symbol=symbol):
+        market = symbols().resolve(symbol)
+    if market is None:
+        return (None, None)
+    _resolved[symbol] = (market.exchange, market.symbol)
+    return _resolved[symbol]
 
 
-def fetch_candles(symbol: str, timeframe: str = '1m', limit: int = 500):
-    """Returns a list of [ms, open, high, low, close, volume]."""
+def _fetch_ohlcv(symbol: str, timeframe: str, limit: int, since: int = None):
     exid, sym = _resolve(symbol)
     if not exid:
         raise Exception(f"no reachable market data source for {symbol}")
-    return _exchange(exid).fetch_ohlcv(sym, timeframe, limit=limit)
+    with metrics.upstream_call(exid, 'fetch_ohlcv'):
+        return _exchange(exid).fetch_ohlcv(sym, timeframe, since=since, limit=limit)
+
+
+def fetch_candles(symbol: str, timeframe: str = '1m', limit: int = 500, since: int = None):
+    """Returns a list of [ms, open, high, low, close, volume], from `since` (ms) when given.
+
+    Served by the resampler: every timeframe of a symbol comes from its one 1m feed.
+    Timeframes it can't build ('1M') go to the exchange as they are.
+    """
+    if not resampler.buildable(timeframe):
+        return _fetch_ohlcv(symbol, timeframe, limit, since)
+    series = resampler.series(symbol)
+    with series.lock:
+        req = series.next_fetch(timeframe, limit)
+        (metrics.cache_hit if req is None else metrics.cache_miss)('candles')
+        while req is not None:
+            try:
+                rows = _fetch_ohlcv(symbol, req.timeframe, req.limit, req.since)
+            except Exception:
+                if req.kind == 'base' and not series.base:
+                    raise
+                rows = None       # serve what we hold; the next poll retries
+            series.apply(req, rows)
+            req = series.next_fetch(timeframe, limit)
+        return series.select(timeframe, limit, since)
 
 
 def fetch_last_price(symbol: str):
-    exid, sym = _resolve(symbol)
-    if not exid:
-        return None
-    try:
-        return float(_exchange(exid).fetch_ticker(sym)['last'])
-    except Exception:
-        return None
+    with tracing.span('market_proxy.fetch_last_price', symbol=symbol):
+        exid, sym = _resolve(symbol)
+        if not exid:
+            return None
+        try:
+            with metrics.upstream_call(exid, 'fetch_ticker'):
+                return float(_exchange(exid).fetch_ticker(sym)['last'])
+        except Exception:
+            return None
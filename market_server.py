@@ -0,0 +1,538 @@
+"""Async serving tier: market data on asyncio, everything else on Flask.
+
+Market routes spend nearly all their time waiting on exchange HTTP. On sync
+gunicorn workers each wait pins a whole worker. Here those routes run on
+aiohttp with ccxt.async_support instead, so one worker can hold thousands of
+upstream waits. Every other path (auth, trading, strategies, the React
+build) is passed to the Flask app on a bounded thread pool, so those routes
+keep their latency while the exchange is slow.
+
+    gunicorn market_server:app --worker-class aiohttp.GunicornWebWorker --workers 4
+
+Async routes:
+  GET /api/market/candles   same contract as the Flask route (formats, since, ETag)
+  GET /api/market/ticker    last/bid/ask/24h change for a symbol
+  GET /api/market/stream    Server-Sent Events: one `candle` event per new or updated bar
+
+Both candle routes also serve bars built from the public trade stream
+(trade_bars): sub-minute intervals ('1s', '5s'), tick/volume/dollar bars
+('tick:100', 'vol:5', 'dollar:1000000'), and any time interval with
+source=trades. One trade poller per symbol feeds every such interval. It
+polls fetch_trades every TRADE_POLL_SECONDS, at once again when a poll came
+back full, and runs while a stream is open or for TRADE_IDLE_SECONDS after
+the last candles request. When it stops, the symbol's tape is reset, so the
+next request starts from fresh trades rather than serve bars gone stale.
+
+Identical concurrent upstream requests are coalesced into one exchange call,
+and every stream client for a (symbol, interval) shares one poller. Symbols
+resolve through market_proxy's symbol index.
+"""
+import asyncio
+import contextvars
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote_to_bytes
+
+from aiohttp import web
+
+import candle_codec
+import http_cache
+import market_proxy
+import metrics
+import quotas
+import resampler
+import symbol_index
+import trade_bars
+import tracing
+
+WSGI_THREADS = int(os.environ.get('WSGI_THREADS', 16))
+STREAM_POLL_SECONDS = float(os.environ.get('STREAM_POLL_SECONDS', 2))
+STREAM_HEARTBEAT_SECONDS = 15
+STREAM_QUEUE_SIZE = 100      # a subscriber this far behind is disconnected
+TRADE_POLL_SECONDS = float(os.environ.get('TRADE_POLL_SECONDS', 1))
+TRADE_IDLE_SECONDS = 60
+TRADE_FETCH_LIMIT = 1000
+
+_ex_cache = {}      # exchange_id -> ccxt.async_support instance (one event loop per worker)
+_inflight = {}      # request key -> Task shared by identical concurrent requests
+_feeds = {}         # (symbol, timeframe) -> _Feed; (symbol, interval, 'trades') -> _TradeFeed
+_trade_pollers = {}     # symbol -> _TradePoller
+
+
+# ---- async market data -----------------------------------------------------
+
+def _exchange(exid):
+    if exid not in _ex_cache:
+        import ccxt.async_support as ccxt_async
+        ex = getattr(ccxt_async, exid)({'enableRateLimit': True})
+        # Markets from the gunicorn master (startup.warm) or the on-disk snapshot: no load_markets().
+        warm = market_proxy._ex_cache.get(exid)
+        snap = (warm.markets, warm.currencies) if warm is not None and warm.markets \
+            else symbol_index.shared.snapshot(exid)
+        if snap:
+            ex.set_markets(*snap)
+        _ex_cache[exid] = ex
+    return _ex_cache[exid]
+
+
+async def _coalesced(key, factory):
+    """Run factory() once for all concurrent callers with the same key."""
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(factory())
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    else:
+        metrics.cache_hit('market_coalesced')
+    # shield: a client disconnecting must not cancel the fetch other clients are awaiting
+    return await asyncio.shield(task)
+
+
+async def resolve(symbol: str):
+    """market_proxy._resolve without blocking the loop: the index is only rebuilt
+    synchronously when there is no snapshot at all, and then on a thread."""
+    if symbol in market_proxy._resolved:
+        metrics.cache_hit('market_resolve')
+        return market_proxy._resolved[symbol]
+    if not symbol_index.shared.markets:
+        await asyncio.get_running_loop().run_in_executor(None, market_proxy.symbols)
+    return market_proxy._resolve(symbol)
+
+
+async def _fetch_ohlcv(symbol: str, timeframe: str, limit: int, since: int = None):
+    exid, sym = await resolve(symbol)
+    if not exid:
+        raise Exception(f"no reachable market data source for {symbol}")
+
+    async def fetch():
+        with metrics.upstream_call(exid, 'fetch_ohlcv'):
+            return await _exchange(exid).fetch_ohlcv(sym, timeframe, since=since, limit=limit)
+
+    return await _coalesced(('ohlcv', exid, sym, timeframe, since, limit), fetch)
+
+
+async def _locked(series, fn, *args):
+    """fn(*args) under series.lock, which WSGI threads (market_proxy, the backtester) also take.
+    When a thread holds it, the wait happens on an executor thread, not on the loop."""
+    if not series.lock.acquire(blocking=False):
+        acquired = asyncio.get_running_loop().run_in_executor(None, series.lock.acquire)
+        try:
+            await asyncio.shield(acquired)
+        except asyncio.CancelledError:
+            acquired.add_done_callback(lambda _: series.lock.release())
+            raise
+    try:
+        return fn(*args)
+    finally:
+        series.lock.release()
+
+
+def _advance(series, req, rows, timeframe: str, limit: int):
+    if req is not None:
+        series.apply(req, rows)
+    return series.next_fetch(timeframe, limit)
+
+
+async def fetch_candles(symbol: str, timeframe: str = '1m', limit: int = 500, since: int = None):
+    """market_proxy.fetch_candles on the loop: all timeframes from the symbol's one 1m feed."""
+    if not resampler.buildable(timeframe):
+        return await _fetch_ohlcv(symbol, timeframe, limit, since)
+    series = resampler.series(symbol)
+    req = await _locked(series, _advance, series, None, None, timeframe, limit)
+    (metrics.cache_hit if req is None else metrics.cache_miss)('candles')
+    while req is not None:
+        try:
+            rows = await _fetch_ohlcv(symbol, req.timeframe, req.limit, req.since)
+        except Exception:
+            if req.kind == 'base' and not series.base:
+                raise
+            rows = None
+        # Concurrent handlers may apply the same coalesced rows twice; update() and seed() are idempotent.
+        req = await _locked(series, _advance, series, req, rows, timeframe, limit)
+    return await _locked(series, series.select, timeframe, limit, since)
+
+
+async def fetch_ticker(symbol: str):
+    exid, sym = await resolve(symbol)
+    if not exid:
+        raise Exception(f"no reachable market data source for {symbol}")
+
+    async def fetch():
+        with metrics.upstream_call(exid, 'fetch_ticker'):
+            return await _exchange(exid).fetch_ticker(sym)
+
+    return await _coalesced(('ticker', exid, sym), fetch)
+
+
+async def fetch_trades(symbol: str, since: int = None):
+    """Public trades from `since` (ms), at most TRADE_FETCH_LIMIT of them."""
+    exid, sym = await resolve(symbol)
+    if not exid:
+        raise Exception(f"no reachable market data source for {symbol}")
+
+    async def fetch():
+        with metrics.upstream_call(exid, 'fetch_trades'):
+            return await _exchange(exid).fetch_trades(sym, since=since, limit=TRADE_FETCH_LIMIT)
+
+    return await _coalesced(('trades', exid, sym, since), fetch)
+
+
+async def trade_candles(symbol: str, interval: str, limit: int = 500, since: int = None):
+    """Bars of `interval` built from trades. Starts the symbol's trade poller if it isn't running."""
+    trade_bars.parse_interval(interval)
+    tape = trade_bars.tape(symbol)
+    if tape.cursor() is None:
+        tape.ingest(await fetch_trades(symbol))
+    _trade_poller(symbol).ensure()
+    return tape.select(interval, limit, since)
+
+
+# ---- streaming -------------------------------------------------------------
+
+class _Feed:
+    """One upstream poller per (symbol, timeframe), fanned out to subscriber queues."""
+
+    def __init__(self, symbol: str, timeframe: str):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.queues = set()
+        self.last = None
+        self.task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        if self.last is not None:
+            queue.put_nowait(self.last)
+        self.queues.add(queue)
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+        return queue
+
+    def unsubscribe(self, queue):
+        self.queues.discard(queue)
+
+    async def _run(self):
+        while self.queues:
+            try:
+                bars = await fetch_candles(self.symbol, self.timeframe, limit=2)
+            except Exception:
+                await asyncio.sleep(STREAM_POLL_SECONDS * 5)
+                continue
+            for bar in bars:
+                if self.last is None or bar[0] > self.last[0] or (bar[0] == self.last[0] and bar != self.last):
+                    self.last = bar
+                    self._publish(bar)
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+        _feeds.pop((self.symbol, self.timeframe), None)
+
+    def _publish(self, bar):
+        for queue in list(self.queues):
+            try:
+                queue.put_nowait(bar)
+            except asyncio.QueueFull:
+                self.queues.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)    # tells the handler to close the slow client
+
+
+class _TradeFeed(_Feed):
+    """Stream of one trade-built interval. It has no poller of its own: the symbol's
+    _TradePoller publishes to it."""
+
+    async def _run(self):
+        trade_bars.tape(self.symbol).builder(self.timeframe)
+        _trade_poller(self.symbol).ensure()
+
+
+class _TradePoller:
+    """Feeds one symbol's trades into its TradeTape and publishes the bars that changed."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.used_at = 0.0
+        self.task = None
+
+    def ensure(self):
+        self.used_at = time.monotonic()
+        if self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._run())
+
+    def _wanted(self) -> bool:
+        return time.monotonic() - self.used_at < TRADE_IDLE_SECONDS or any(
+            f.queues for key, f in _feeds.items() if len(key) == 3 and key[0] == self.symbol)
+
+    async def _run(self):
+        tape = trade_bars.tape(self.symbol)
+        while self._wanted():
+            since = tape.cursor()
+            try:
+                trades = await fetch_trades(self.symbol, since=since)
+            except Exception:
+                await asyncio.sleep(TRADE_POLL_SECONDS * 5)
+                continue
+            changed = tape.ingest(trades, since)
+            for interval, bars in changed.items():
+                feed = _feeds.get((self.symbol, interval, 'trades'))
+                if feed is not None and feed.queues:
+                    for bar in bars[-(STREAM_QUEUE_SIZE // 2):]:
+                        bar[0] = int(bar[0])
+                        feed.last = bar
+                        feed._publish(bar)
+            # A full page may have more behind it: fetch the rest now, unless the cursor is stuck.
+            if len(trades) < TRADE_FETCH_LIMIT or tape.cursor() == since:
+                await asyncio.sleep(TRADE_POLL_SECONDS)
+        for key in [k for k, f in _feeds.items() if len(k) == 3 and k[0] == self.symbol and not f.queues]:
+            del _feeds[key]
+        _trade_pollers.pop(self.symbol, None)
+        with tape.lock:
+            tape.reset()
+
+
+def _trade_poller(symbol: str) -> _TradePoller:
+    if symbol not in _trade_pollers:
+        _trade_pollers[symbol] = _TradePoller(symbol)
+    return _trade_pollers[symbol]
+
+
+def _trade_feed(symbol: str, interval: str) -> _TradeFeed:
+    key = (symbol, interval, 'trades')
+    if key not in _feeds:
+        _feeds[key] = _TradeFeed(symbol, interval)
+    return _feeds[key]
+
+
+def _feed(symbol: str, timeframe: str) -> _Feed:
+    key = (symbol, timeframe)
+    if key not in _feeds:
+        _feeds[key] = _Feed(symbol, timeframe)
+    return _feeds[key]
+
+
+# ---- handlers --------------------------------------------------------------
+
+def _instrumented(endpoint: str):
+    """Root trace span, request latency metric and quota charge, as Flask routes get from the app hooks."""
+    def decorator(handler):
+        async def wrapper(request):
+            started = time.perf_counter()
+            token = tracing.start_trace(f'{request.method} {request.path}',
+                                        request_id=request.headers.get('X-Request-ID'))
+            status = 500
+            try:
+                refused = await quotas.charge_async(request, endpoint)
+                if refused is not None:
+                    response = web.json_response(refused, status=429,
+                                                 headers={'Retry-After': str(refused['retry_after'])})
+                else:
+                    response = await handler(request)
+                status = response.status
+                response.headers['X-Request-ID'] = tracing.current_request_id()
+                return response
+            finally:
+                tracing.finish_trace(token, endpoint=endpoint, status=status)
+                metrics.observe('prismtrade_http_request_duration_seconds', time.perf_counter() - started,
+                                endpoint=endpoint, method=request.method, status=status)
+        return wrapper
+    return decorator
+
+
+def _error(message: str, status: int):
+    return web.json_response({'error': message}, status=status)
+
+
+def _int_arg(request, name, default=None):
+    try:
+        return int(request.query[name])
+    except (KeyError, ValueError):
+        return default
+
+
+@_instrumented('market_candles')
+async def market_candles(request):
+    try:
+        mime = candle_codec.negotiate(request.headers.get('Accept'), request.query.get('format'))
+    except ValueError as e:
+        return _error(str(e), 406)
+    try:
+        symbol = request.query.get('symbol', 'BTCUSDT')
+        interval = request.query.get('interval', '1m')
+        limit = int(request.query.get('limit', 500))
+        since = _int_arg(request, 'since')
+        from_trades = request.query.get('source') == 'trades' or trade_bars.is_trade_interval(interval)
+        if from_trades:
+            candles = await trade_candles(symbol, interval, limit, since=since)
+        else:
+            candles = await fetch_candles(symbol, interval, limit, since=since)
+        if since is not None:
+            candles = [c for c in candles if c[0] >= since]
+        precision = _int_arg(request, 'precision', 32)
+
+        etag = http_cache.make_etag('candles', symbol, interval, from_trades, limit, since, mime, precision,
+                                    len(candles), candles[0][0] if candles else None,
+                                    list(candles[-1]) if candles else None)
+        headers = {'ETag': f'W/"{etag}"', 'Cache-Control': 'private, no-cache', 'Vary': 'Accept, Accept-Encoding'}
+        if http_cache.matches(request.headers.get('If-None-Match'), etag):
+            return web.Response(status=304, headers=headers)
+
+        body = candle_codec.encode(candles, mime, precision=precision)
+        response = web.Response(body=body, content_type=mime, headers=headers)
+        if len(body) >= http_cache.COMPRESS_MIN_BYTES:
+            response.enable_compression()
+        return response
+    except Exception as e:
+        return _error(str(e), 502)
+
+
+@_instrumented('market_ticker')
+async def market_ticker(request):
+    try:
+        symbol = request.query.get('symbol', 'BTCUSDT')
+        ticker = await fetch_ticker(symbol)
+        return web.json_response({
+            'symbol': symbol,
+            'last': ticker.get('last'),
+            'bid': ticker.get('bid'),
+            'ask': ticker.get('ask'),
+            'change_pct': ticker.get('percentage'),
+            'volume': ticker.get('baseVolume'),
+            'timestamp': ticker.get('timestamp'),
+        })
+    except Exception as e:
+        return _error(str(e), 502)
+
+
+async def market_stream(request):
+    refused = await quotas.charge_async(request, 'market_stream')
+    if refused is not None:
+        return web.json_response(refused, status=429, headers={'Retry-After': str(refused['retry_after'])})
+    symbol = request.query.get('symbol', 'BTCUSDT')
+    interval = request.query.get('interval', '1m')
+    response = web.StreamResponse(headers={
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no',     # don't let a reverse proxy buffer the stream
+    })
+    from_trades = request.query.get('source') == 'trades' or trade_bars.is_trade_interval(interval)
+    if from_trades:
+        try:
+            trade_bars.parse_interval(interval)
+        except ValueError as e:
+            return _error(str(e), 400)
+    await response.prepare(request)
+    feed = _trade_feed(symbol, interval) if from_trades else _feed(symbol, interval)
+    queue = feed.subscribe()
+    metrics.inc('prismtrade_market_streams_total', interval=interval)
+    try:
+        while True:
+            try:
+                bar = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await response.write(b': keepalive\n\n')
+                continue
+            if bar is None:
+                break
+            await response.write(f'event: candle\ndata: {json.dumps(bar)}\n\n'.encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        feed.unsubscribe(queue)
+    return response
+
+
+# ---- Flask fallback --------------------------------------------------------
+
+def _environ(request, body: bytes) -> dict:
+    host, _, port = (request.host or 'localhost').partition(':')
+    environ = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': '',
+        'PATH_INFO': unquote_to_bytes(request.raw_path.split('?', 1)[0]).decode('latin-1'),
+        'QUERY_STRING': request.query_string,
+        'SERVER_NAME': host,
+        'SERVER_PORT': port or ('443' if request.scheme == 'https' else '80'),
+        'SERVER_PROTOCOL': f'HTTP/{request.version.major}.{request.version.minor}',
+        'REMOTE_ADDR': request.remote or '',
+        'CONTENT_TYPE': request.headers.get('Content-Type', ''),
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': request.scheme,
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in request.headers.items():
+        key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in ('HTTP_CONTENT_TYPE', 'HTTP_CONTENT_LENGTH'):
+            continue
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _call_wsgi(wsgi_app, environ: dict):
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+        return lambda data: chunks.append(data)
+
+    chunks = []
+    result = wsgi_app(environ, start_response)
+    try:
+        chunks.extend(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return started['status'], started['headers'], b''.join(chunks)
+
+
+def wsgi_fallback(wsgi_app, executor):
+    async def handler(request):
+        body = await request.read()
+        environ = _environ(request, body)
+        # A fresh context per call so the Flask request's trace never leaks between pool threads.
+        status, headers, payload = await asyncio.get_running_loop().run_in_executor(
+            executor, contextvars.Context().run, _call_wsgi, wsgi_app, environ)
+        response = web.Response(status=status, body=payload)
+        for name, value in headers:
+            if name.lower() not in ('content-length', 'transfer-encoding', 'connection'):
+                response.headers.add(name, value)
+        return response
+    return handler
+
+
+# ---- app -------------------------------------------------------------------
+
+async def _close_exchanges(app):
+    for ex in list(_ex_cache.values()):
+        await ex.close()
+    _ex_cache.clear()
+    app['wsgi_executor'].shutdown(wait=False)
+
+
+def create_app(wsgi_app=None) -> web.Application:
+    """aiohttp app serving the async market routes, with wsgi_app (Flask) behind everything else."""
+    if wsgi_app is None:
+        from app import app as wsgi_app
+    executor = ThreadPoolExecutor(max_workers=WSGI_THREADS, thread_name_prefix='wsgi')
+    application = web.Application(client_max_size=16 * 1024 * 1024)
+    application.router.add_get('/api/market/candles', market_candles)
+    application.router.add_get('/api/market/ticker', market_ticker)
+    application.router.add_get('/api/market/stream', market_stream)
+    application.router.add_route('*', '/{path:.*}', wsgi_fallback(wsgi_app, executor))
+    application['wsgi_executor'] = executor
+    application.on_cleanup.append(_close_exchanges)
+    return application
+
+
+app = create_app()
+
+if __name__ == '__main__':
+    web.run_app(app, port=int(os.environ.get('PORT', 5000)))
@@ -0,0 +1,331 @@
+"""Lightweight in-process metrics with a Prometheus-text /metrics endpoint.
+
+Counters and histograms live in plain dicts guarded by one lock, so recording
+costs a dict lookup and a bisect. Each gunicorn worker writes a snapshot of
+its metrics to METRICS_DIR/<pid>-<start>.json every FLUSH_INTERVAL seconds
+(from a daemon thread started in gunicorn's post_fork, see start_worker()).
+/metrics merges the snapshots of live workers, so any worker can answer a
+scrape with totals for the whole server. Processes that aren't gunicorn
+workers (scripts, walk-forward pools) record but never write snapshots.
+
+The master clears METRICS_DIR when it starts (clear_snapshots(), from
+when_ready). The snapshot of a worker that has exited is deleted at the next
+scrape, so its counts leave the totals. Prometheus reads a drop in a counter
+as a reset, which rate() and increase() handle.
+
+What gets recorded:
+  - HTTP latency per Flask endpoint/method/status (instrument_app)
+  - DB query count/time, in total and per request (instrument_engine)
+  - upstream exchange calls: latency + errors per exchange/method (upstream_call)
+  - cache hits/misses per cache name (cache_hit / cache_miss)
+"""
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import tracing
+
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'prismtrade_metrics'))
+FLUSH_INTERVAL = 5   # seconds between snapshot writes
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+HELP = {
+    'prismtrade_http_request_duration_seconds': 'Flask request latency by endpoint',
+    'prismtrade_upstream_call_duration_seconds': 'Exchange API call latency by exchange/method',
+    'prismtrade_upstream_errors_total': 'Exchange API calls that raised, by exchange/method',
+    'prismtrade_exchange_connect_seconds': 'ExchangeConnector.connect() time (DB lookup + key decryption)',
+    'prismtrade_db_query_duration_seconds': 'SQL statement execution time',
+    'prismtrade_db_queries_per_request': 'SQL statements executed per HTTP request',
+    'prismtrade_db_time_per_request_seconds': 'SQL time spent per HTTP request',
+    'prismtrade_cache_hits_total': 'Cache hits by cache name',
+    'prismtrade_cache_misses_total': 'Cache misses by cache name',
+    'prismtrade_cache_hit_ratio': 'hits / (hits + misses) by cache name',
+    'prismtrade_market_streams_total': 'Market SSE streams opened, by interval',
+    'prismtrade_risk_rejections_total': 'Orders blocked by a pre-trade risk rule, by rule',
+    'prismtrade_quota_rejections_total': 'Requests refused by quotas (429) or the fair gate (503), by route class/role',
+    'prismtrade_feature_evictions_total': 'Stored indicator features deleted to keep the feature store under its size limit',
+}
+
+_lock = threading.Lock()
+_counters = {}     # (name, labels) -> float
+_histograms = {}   # (name, labels) -> {'buckets': tuple, 'counts': [...], 'sum': float, 'count': int}
+_snapshot_path = None      # set in gunicorn workers by start_worker()
+_request = threading.local()   # per-request DB accumulators
+
+
+# ---- recording -------------------------------------------------------------
+
+def _labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _after_fork():
+    """In a forked child: drop the parent's counts and its lock, which another parent thread
+    may have held at the moment of the fork."""
+    global _lock, _snapshot_path
+    _lock = threading.Lock()
+    _counters.clear()
+    _histograms.clear()
+    _snapshot_path = None
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def start_worker():
+    """Publish this process's metrics to METRICS_DIR (gunicorn post_fork)."""
+    global _snapshot_path
+    _after_fork()
+    _snapshot_path = os.path.join(METRICS_DIR, f'{os.getpid()}-{time.time_ns()}.json')
+    threading.Thread(target=_flush_loop, name='metrics-flush', daemon=True).start()
+
+
+def clear_snapshots():
+    """Delete every snapshot in METRICS_DIR (the gunicorn master, before workers start)."""
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+    key = (name, _labels(labels))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = {'buckets': buckets, 'counts': [0] * (len(buckets) + 1), 'sum': 0.0, 'count': 0}
+        h['counts'][bisect.bisect_left(h['buckets'], value)] += 1
+        h['sum'] += value
+        h['count'] += 1
+
+
+def cache_hit(cache: str):
+    inc('prismtrade_cache_hits_total', cache=cache)
+
+
+def cache_miss(cache: str):
+    inc('prismtrade_cache_misses_total', cache=cache)
+
+
+@contextmanager
+def timer(name: str, **labels):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+@contextmanager
+def upstream_call(exchange: str, method: str):
+    """Time an exchange API call and count it as an error if it raises.
+
+    Also opens a tracing span, so every exchange call shows up in request traces.
+    """
+    started = time.perf_counter()
+    try:
+        with tracing.span(f'upstream.{method}', exchange=exchange):
+            yield
+    except Exception:
+        inc('prismtrade_upstream_errors_total', exchange=exchange, method=method)
+        raise
+    finally:
+        observe('prismtrade_upstream_call_duration_seconds', time.perf_counter() - started,
+                exchange=exchange, method=method)
+
+
+# ---- integration -----------------------------------------------------------
+
+def instrument_engine(engine):
+    """Count and time every SQL statement on a SQLAlchemy engine."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        observe('prismtrade_db_query_duration_seconds', elapsed)
+        if getattr(_request, 'active', False):
+            _request.queries += 1
+            _request.db_time += elapsed
+
+
+def instrument_app(app):
+    """Record per-endpoint latency and per-request DB usage, and serve GET /metrics."""
+    from flask import Response, request
+
+    @app.before_request
+    def _start():
+        _request.active = True
+        _request.started = time.perf_counter()
+        _request.queries = 0
+        _request.db_time = 0.0
+
+    @app.after_request
+    def _finish(response):
+        if getattr(_request, 'active', False):
+            _request.active = False
+            endpoint = request.endpoint or 'unmatched'
+            observe('prismtrade_http_request_duration_seconds', time.perf_counter() - _request.started,
+                    endpoint=endpoint, method=request.method, status=response.status_code)
+            observe('prismtrade_db_queries_per_request', _request.queries, buckets=COUNT_BUCKETS, endpoint=endpoint)
+            observe('prismtrade_db_time_per_request_seconds', _request.db_time, endpoint=endpoint)
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        token = os.environ.get('METRICS_TOKEN')
+        if token and request.headers.get('Authorization') != f'Bearer {token}':
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+
+# ---- multi-worker snapshots -----------------------------------------------
+
+def _snapshot() -> dict:
+    with _lock:
+        return {
+            'counters': [[name, list(labels), value] for (name, labels), value in _counters.items()],
+            'histograms': [[name, list(labels), h['buckets'], list(h['counts']), h['sum'], h['count']]
+                           for (name, labels), h in _histograms.items()],
+        }
+
+
+def flush():
+    """Write this worker's snapshot atomically."""
+    path = _snapshot_path
+    if path is None:
+        return
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass      # exists, owned by someone else
+    return True
+
+
+def _live_snapshots() -> list:
+    """Every live worker's snapshot; those of exited workers are deleted."""
+    snapshots = []
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            pid = int(os.path.basename(path).split('-')[0])
+            stale = time.time() - os.path.getmtime(path) > 6 * FLUSH_INTERVAL   # the pid was reused
+        except (OSError, ValueError):
+            continue
+        if stale or not _alive(pid):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue    # a worker is mid-write or exited during the read
+    return snapshots
+
+
+def collect() -> tuple:
+    """Merge the snapshots of every live worker into (counters, histograms)."""
+    if _snapshot_path is None:
+        snapshots = [_snapshot()]       # not a gunicorn worker: this process only
+    else:
+        flush()
+        snapshots = _live_snapshots()
+    counters, histograms = {}, {}
+    for snap in snapshots:
+        for name, labels, value in snap['counters']:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, buckets, counts, total, count in snap['histograms']:
+            key = (name, tuple(map(tuple, labels)))
+            h = histograms.setdefault(key, {'buckets': tuple(buckets), 'counts': [0] * len(counts), 'sum': 0.0, 'count': 0})
+            h['counts'] = [a + b for a, b in zip(h['counts'], counts)]
+            h['sum'] += total
+            h['count'] += count
+    return counters, histograms
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _fmt_labels(labels, extra=()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in items) + '}'
+
+
+def render() -> str:
+    """Prometheus text exposition format."""
+    counters, histograms = collect()
+
+    # Derived hit ratio per cache.
+    hits = {labels: v for (name, labels), v in counters.items() if name == 'prismtrade_cache_hits_total'}
+    misses = {labels: v for (name, labels), v in counters.items() if name == 'prismtrade_cache_misses_total'}
+    gauges = {('prismtrade_cache_hit_ratio', labels): hits.get(labels, 0) / (hits.get(labels, 0) + misses.get(labels, 0))
+              for labels in set(hits) | set(misses)}
+
+    lines = []
+    typed = set()
+
+    def header(name, kind):
+        if name not in typed:
+            typed.add(name)
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for (name, labels), value in sorted(counters.items()):
+        header(name, 'counter')
+        lines.append(f'{name}{_fmt_labels(labels)} {value}')
+    for (name, labels), value in sorted(gauges.items()):
+        header(name, 'gauge')
+        lines.append(f'{name}{_fmt_labels(labels)} {value}')
+    for (name, labels), h in sorted(histograms.items()):
+        header(name, 'histogram')
+        cumulative = 0
+        for bound, count in zip(list(h['buckets']) + ['+Inf'], h['counts']):
+            cumulative += count
+            lines.append(f'{name}_bucket{_fmt_labels(labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{name}_sum{_fmt_labels(labels)} {h["sum"]}')
+        lines.append(f'{name}_count{_fmt_labels(labels)} {h["count"]}')
+    return '\n'.join(lines) + '\n'
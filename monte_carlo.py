@@ -0,0 +1,135 @@
+"""Monte Carlo robustness analysis for backtest results.
+
+A backtest gives one path. This resamples it into thousands:
+  - trade resampling: draw trade P&Ls from BacktestEngine.closed_trades with
+    replacement ('bootstrap') or reorder them ('shuffle'),
+  - block bootstrap: rebuild equity paths from blocks of consecutive bar
+    returns taken from the equity curve, preserving short-range autocorrelation.
+
+Each batch of paths is one (paths x steps) matrix: cumsum/cumprod for the
+equity, running max for drawdown, and row-wise mean/std for Sharpe. Batching
+only bounds memory; there is no per-path Python loop.
+
+Drawdown and Sharpe follow get_stats(): drawdown in percent (negative) and
+Sharpe annualized with sqrt(periods_per_year), default 252.
+
+Ruin is absorbing: once a path's equity reaches zero it stays there, with
+zero returns, instead of going negative and flipping the sign of later
+returns. probability_of_ruin is the share of paths that got there.
+"""
+import numpy as np
+
+PERCENTILES = (5, 25, 50, 75, 95)
+BATCH_SIZE = 2500     # paths per matrix; 2500 x 1000 float64 is ~20MB
+
+
+def _absorb_ruin(equity: np.ndarray) -> np.ndarray:
+    """Zero each row of an equity matrix from its first non-positive value on (in place)."""
+    equity[np.maximum.accumulate(equity <= 0, axis=1)] = 0.0
+    return equity
+
+
+def _path_metrics(equity: np.ndarray, periods_per_year: int) -> tuple:
+    """Final capital, max drawdown % and Sharpe for each row of an equity matrix."""
+    running_max = np.maximum.accumulate(equity, axis=1)
+    max_dd = ((equity - running_max) / running_max * 100).min(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        prev = equity[:, :-1]
+        returns = np.where(prev > 0, np.diff(equity, axis=1) / prev, 0.0)     # ruined: flat
+        std = returns.std(axis=1, ddof=1) if returns.shape[1] > 1 else np.zeros(len(equity))
+        sharpe = np.where(std > 0, returns.mean(axis=1) / std * np.sqrt(periods_per_year), 0.0)
+    return equity[:, -1], max_dd, sharpe
+
+
+def _summarize(final: np.ndarray, max_dd: np.ndarray, sharpe: np.ndarray, initial_capital: float) -> dict:
+    def dist(values):
+        return {
+            'mean': float(values.mean()),
+            'std': float(values.std()),
+            'percentiles': {f'p{p}': float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+        }
+    return {
+        'simulations': int(len(final)),
+        'final_capital': dist(final),
+        'max_drawdown_pct': dist(max_dd),
+        'sharpe_ratio': dist(sharpe),
+        'probability_of_loss': float((final < initial_capital).mean()),
+        'probability_of_ruin': float((final <= 0).mean()),
+    }
+
+
+def _batches(n_sims: int):
+    for start in range(0, n_sims, BATCH_SIZE):
+        yield min(BATCH_SIZE, n_sims - start)
+
+
+def simulate_trades(pnls, initial_capital: float, n_sims: int = 10000, method: str = 'bootstrap',
+                    periods_per_year: int = 252, seed: int = None) -> dict:
+    """Resample a trade P&L sequence into n_sims equity paths.
+
+    method='bootstrap' draws trades with replacement (final capital varies);
+    method='shuffle' permutes the same trades (final capital is fixed unless the path is
+    ruined on the way, path risk varies).
+    """
+    pnls = np.asarray(pnls, dtype=float)
+    if len(pnls) == 0:
+        raise ValueError("No trades to simulate")
+    if method not in ('bootstrap', 'shuffle'):
+        raise ValueError(f"Unknown method {method}")
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in _batches(n_sims):
+        if method == 'bootstrap':
+            sampled = pnls[rng.integers(0, len(pnls), size=(size, len(pnls)))]
+        else:
+            sampled = rng.permuted(np.broadcast_to(pnls, (size, len(pnls))), axis=1)
+        equity = np.empty((size, len(pnls) + 1))
+        equity[:, 0] = initial_capital
+        np.cumsum(sampled, axis=1, out=equity[:, 1:])
+        equity[:, 1:] += initial_capital
+        _absorb_ruin(equity)
+        results.append(_path_metrics(equity, periods_per_year))
+    final, max_dd, sharpe = (np.concatenate(x) for x in zip(*results))
+    return _summarize(final, max_dd, sharpe, initial_capital)
+
+
+def simulate_returns(equity_curve, n_sims: int = 10000, block_size: int = 20,
+                     periods_per_year: int = 252, seed: int = None) -> dict:
+    """Circular block bootstrap of bar returns from an equity curve."""
+    equity_curve = np.asarray(equity_curve, dtype=float)
+    returns = np.diff(equity_curve) / equity_curve[:-1]
+    n = len(returns)
+    if n == 0:
+        raise ValueError("Equity curve too short to bootstrap")
+    block_size = max(1, min(block_size, n))
+    n_blocks = -(-n // block_size)
+    offsets = np.arange(block_size)
+    initial_capital = equity_curve[0]
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in _batches(n_sims):
+        starts = rng.integers(0, n, size=(size, n_blocks, 1))
+        idx = ((starts + offsets) % n).reshape(size, -1)[:, :n]
+        equity = np.empty((size, n + 1))
+        equity[:, 0] = initial_capital
+        np.cumprod(1 + returns[idx], axis=1, out=equity[:, 1:])
+        equity[:, 1:] *= initial_capital
+        _absorb_ruin(equity)
+        results.append(_path_metrics(equity, periods_per_year))
+    final, max_dd, sharpe = (np.concatenate(x) for x in zip(*results))
+    return _summarize(final, max_dd, sharpe, initial_capital)
+
+
+def run_monte_carlo(engine, n_sims: int = 10000, block_size: int = 20, seed: int = None) -> dict:
+    """Both analyses for a finished BacktestEngine, as a JSON-ready dict.
+
+    The trade analyses are left out when the backtest closed no trades.
+    """
+    pnls = [t.pnl for t in engine.closed_trades]
+    result = {}
+    if pnls:
+        result['trade_bootstrap'] = simulate_trades(pnls, engine.initial_capital, n_sims, 'bootstrap', seed=seed)
+        result['trade_shuffle'] = simulate_trades(pnls, engine.initial_capital, n_sims, 'shuffle', seed=seed)
+    if len(engine.equity_curve) > 1:
+        result['return_bootstrap'] = simulate_returns(engine.equity_curve, n_sims, block_size, seed=seed)
+    return result
@@ -0,0 +1,170 @@
+"""Multi-symbol portfolio backtest with shared capital.
+
+    frames = {'BTC/USDT': btc_df, 'ETH/USDT': eth_df, ...}     # timestamp/open/high/low/close/volume
+    result = run_portfolio_backtest(frames, strategy_kwargs={'fast_period': 10, 'slow_period': 30},
+                                    max_positions=5)
+    result.print_report()
+    result.per_symbol()
+
+How it works:
+  - Every symbol's bars are aligned onto the union of their timestamps as one
+    (bars x symbols) close matrix. A bar a symbol has no candle for is NaN,
+    and a held position is marked at its last close.
+  - Signals come from `strategy` (simple_ma_crossover_strategy by default:
+    position == 2 enters, -2 exits). Each symbol runs on its own frame in a
+    process pool.
+  - Only bars with a signal are walked, in time order. On each of them,
+    exits fill first and free cash and slots. Entries then fill in `frames`
+    order while fewer than max_positions are open. All fills are at the close.
+    An entry stakes risk_pct of current equity, or equity / max_positions
+    without risk_pct, capped by the cash left. Equity there is one dot product
+    of held units with the bar's closes.
+  - Holdings and cash changes are recorded per fill. The equity curve for
+    every bar is then a single matrix expression, cash + (units * closes).sum(1),
+    over the whole run.
+
+Positions still open after the last bar are closed at each symbol's last close
+with reason 'end_of_data', after the last equity point, as replay_trades() does.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from backtesting import BacktestEngine, OrderSide, Trade, simple_ma_crossover_strategy
+
+
+def _signals(task) -> tuple:
+    """Worker: (entry rows, exit rows) of one symbol's frame."""
+    df, strategy, kwargs = task
+    position = strategy(df, **kwargs)['position'].to_numpy()
+    return np.flatnonzero(position == 2), np.flatnonzero(position == -2)
+
+
+def align(frames: dict) -> tuple:
+    """(timestamps, closes, rows): closes is a (bars x symbols) matrix, NaN where a symbol has no bar;
+    rows[i] maps frame i's rows onto the common index."""
+    index = pd.Index(pd.concat([df['timestamp'] for df in frames.values()]).unique()).sort_values()
+    closes = np.full((len(index), len(frames)), np.nan)
+    rows = []
+    for col, df in enumerate(frames.values()):
+        at = index.get_indexer(df['timestamp'])
+        closes[at, col] = df['close'].to_numpy(dtype=float)
+        rows.append(at)
+    return index, closes, rows
+
+
+def _forward_fill(matrix: np.ndarray) -> np.ndarray:
+    """Each NaN replaced by the last value above it (leading NaNs stay)."""
+    last = np.where(~np.isnan(matrix), np.arange(len(matrix))[:, None], 0)
+    np.maximum.accumulate(last, axis=0, out=last)
+    return matrix[last, np.arange(matrix.shape[1])]
+
+
+class PortfolioBacktest(BacktestEngine):
+    """A finished portfolio run: BacktestEngine stats over the combined equity, plus the aligned matrices."""
+
+    def __init__(self, symbols: list, initial_capital: float, fee_pct: float, max_positions: int):
+        super().__init__(initial_capital=initial_capital, fee_pct=fee_pct, max_positions=max_positions)
+        self.symbols = symbols
+        self.holdings = None      # (bars x symbols) units held after each bar's fills
+        self.marks = None         # (bars x symbols) forward-filled closes
+
+    def per_symbol(self) -> dict:
+        """{symbol: {'trades', 'pnl', 'win_rate'}} over closed trades."""
+        out = {}
+        for t in self.closed_trades:
+            s = out.setdefault(t.symbol, {'trades': 0, 'pnl': 0.0, 'wins': 0})
+            s['trades'] += 1
+            s['pnl'] += t.pnl
+            s['wins'] += t.pnl > 0
+        return {sym: {'trades': s['trades'], 'pnl': s['pnl'], 'win_rate': s['wins'] / s['trades'] * 100}
+                for sym, s in out.items()}
+
+
+def run_portfolio_backtest(frames: dict, strategy=simple_ma_crossover_strategy, strategy_kwargs: dict = None,
+                           initial_capital: float = 10000, fee_pct: float = 0.001, max_positions: int = 5,
+                           risk_pct: float = None, workers: int = None) -> PortfolioBacktest:
+    """Backtest `strategy` on every frame with one shared cash balance and at most max_positions open.
+
+    `strategy` must be a module-level function (it is sent to worker processes) that takes a
+    frame plus strategy_kwargs and returns it with a 'position' column.
+    """
+    if not frames:
+        raise ValueError("no symbols to backtest")
+    symbols = list(frames)
+    timestamps, closes, rows = align(frames)
+    marks = _forward_fill(closes)
+    n_bars, n_symbols = closes.shape
+
+    tasks = [(df.reset_index(drop=True), strategy, strategy_kwargs or {}) for df in frames.values()]
+    workers = min(workers or os.cpu_count() or 1, n_symbols)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            signals = list(pool.map(_signals, tasks))
+    else:
+        signals = [_signals(t) for t in tasks]
+
+    # Event matrix on the common index: +1 entry, -1 exit.
+    events = np.zeros((n_bars, n_symbols), dtype=np.int8)
+    for col, (entries, exits) in enumerate(signals):
+        events[rows[col][entries], col] = 1
+        events[rows[col][exits], col] = -1
+
+    result = PortfolioBacktest(symbols, initial_capital, fee_pct, max_positions)
+    units = np.zeros(n_symbols)
+    unit_changes = np.zeros((n_bars, n_symbols))
+    cash_changes = np.zeros(n_bars)
+    cash = float(initial_capital)
+    open_trades = {}       # column -> Trade
+    ts = list(timestamps)
+
+    for bar in np.flatnonzero(events.any(axis=1)):
+        row, prices = events[bar], closes[bar]
+        for col in np.flatnonzero(row == -1):
+            trade = open_trades.pop(col, None)
+            if trade is None:
+                continue
+            trade.close(ts[bar], float(prices[col]), fee_pct)
+            trade.exit_reason = 'exit_signal'
+            proceeds = trade.exit_price * trade.size * (1 - fee_pct)
+            cash += proceeds
+            cash_changes[bar] += proceeds
+            unit_changes[bar, col] -= trade.size
+            units[col] = 0.0
+            result.closed_trades.append(trade)
+        entries = [col for col in np.flatnonzero(row == 1) if col not in open_trades]
+        if not entries or len(open_trades) >= max_positions:
+            continue
+        equity = cash + np.nansum(units * marks[bar])
+        for col in entries:
+            if len(open_trades) >= max_positions:
+                break
+            price = float(prices[col])
+            stake = min(equity * risk_pct / 100 if risk_pct else equity / max_positions, cash / (1 + fee_pct))
+            if stake <= 0 or not np.isfinite(price):
+                break
+            size = stake / price
+            cost = stake * (1 + fee_pct)
+            cash -= cost
+            cash_changes[bar] -= cost
+            unit_changes[bar, col] += size
+            units[col] = size
+            open_trades[col] = Trade(entry_time=ts[bar], entry_price=price, exit_time=None, exit_price=None,
+                                     side=OrderSide.BUY, size=size, symbol=symbols[col])
+
+    result.holdings = np.cumsum(unit_changes, axis=0)
+    result.marks = marks
+    equity = initial_capital + np.cumsum(cash_changes) + np.nansum(result.holdings * marks, axis=1)
+    result.equity_curve = equity.tolist()
+    result.timestamps = ts
+
+    for col, trade in sorted(open_trades.items()):
+        trade.close(ts[-1], float(marks[-1, col]), fee_pct)
+        trade.exit_reason = 'end_of_data'
+        cash += trade.exit_price * trade.size * (1 - fee_pct)
+        result.closed_trades.append(trade)
+    result.positions = []
+    result.capital = cash
+    return result
@@ -0,0 +1,352 @@
+"""Per-user, per-route request quotas shared by every gunicorn worker, plus a fair gate.
+
+Each request is charged one token from the bucket for (caller, route class).
+The caller is the user id from the bearer token, or the client IP for
+anonymous calls. The client IP is the connection's peer address or, behind
+TRUSTED_PROXY_HOPS reverse proxies, the X-Forwarded-For entry the outermost
+trusted proxy appended (TRUSTED_PROXY_HOPS defaults to 0: no header is
+trusted unless the deployment says how many proxies it has). Entries the
+client wrote itself are never used, and app.py applies ProxyFix with the
+same count. Rates and bursts come from
+LIMITS by route class and UserRole. The QUOTAS env var (JSON, same shape)
+overrides them:
+
+    QUOTAS='{"exchange": {"free": [1, 20]}, "order": {"premium": null}}'    # null = unlimited
+
+A request over its quota gets 429 with Retry-After before the view runs: no
+DB query, no exchange call.
+
+Buckets live in a memory-mapped table in QUOTA_FILE, so every worker on the
+host charges the same buckets. Each slot holds (key hash, tokens, last
+update). Slots are grouped in 8s and each group is guarded by an fcntl record
+lock, so a charge is two syscalls and a few struct reads. A full group
+evicts its stalest bucket, which is as good as full again anyway. Where
+fcntl doesn't exist (Windows dev boxes) the table is per process.
+
+Exchange-bound routes (EXCHANGE_ROUTES) also pass through a FairGate. At
+most GATE_SLOTS of them run at once per worker. The rest queue per user and
+are admitted round-robin across users, so one client's backlog can't delay
+everyone else's. Each user may queue at most GATE_QUEUE_PER_USER requests;
+beyond that, or after GATE_WAIT_SECONDS, the request is refused with
+Retry-After. Waiters hold a WSGI thread, so at most GATE_QUEUE_TOTAL wait
+across all users, well under WSGI_THREADS - GATE_SLOTS; past that a request
+gets 503 at once and the other routes keep their threads.
+
+market_server's native aiohttp routes (candles, ticker, stream) never reach
+Flask; they call charge_async() themselves.
+
+QUOTAS_DISABLED=1 turns the whole layer off (benchmarks/hot_paths.py does,
+to time handlers rather than the quota).
+"""
+import hashlib
+import json
+import math
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+
+import metrics
+
+try:
+    import fcntl
+except ImportError:      # Windows: buckets are per process
+    fcntl = None
+
+QUOTA_FILE = os.environ.get('QUOTA_FILE', os.path.join(tempfile.gettempdir(), 'prismtrade_quotas.bin'))
+QUOTA_SLOTS = 1 << 16
+GATE_SLOTS = int(os.environ.get('QUOTA_GATE_SLOTS', 4))
+GATE_QUEUE_PER_USER = 2
+GATE_QUEUE_TOTAL = int(os.environ.get('QUOTA_GATE_QUEUE',
+                                      max(0, int(os.environ.get('WSGI_THREADS', 16)) - GATE_SLOTS) // 2))
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', 0))    # 1 behind Railway or Traefik
+GATE_WAIT_SECONDS = 10.0
+ROLE_TTL = 60            # seconds a user's role is cached per worker
+
+# route class -> role -> (tokens per second, burst) or None for unlimited
+LIMITS = {
+    'exchange': {'anonymous': (0.2, 5), 'free': (0.5, 10), 'premium': (2, 30), 'admin': None},
+    'order': {'anonymous': (0.2, 5), 'free': (0.5, 10), 'premium': (2, 20), 'admin': None},
+    'auth': {'anonymous': (0.2, 10), 'free': (0.2, 10), 'premium': (0.2, 10), 'admin': (0.2, 10)},
+    'market': {'anonymous': (2, 30), 'free': (5, 60), 'premium': (10, 120), 'admin': None},
+    'default': {'anonymous': (5, 50), 'free': (10, 50), 'premium': (30, 150), 'admin': None},
+}
+ROUTES = {
+    'trading_get_ticker': 'exchange', 'trading_get_balance': 'exchange', 'get_positions': 'exchange',
+    'test_connection': 'exchange',
+    'trading_execute_buy': 'order', 'trading_execute_sell': 'order', 'close_position': 'order',
+    'trading_execute_basket': 'order',
+    'login': 'auth', 'register': 'auth',
+    'market_candles': 'market', 'market_ticker': 'market', 'market_stream': 'market',
+}
+EXCHANGE_ROUTES = {'exchange', 'order'}
+EXEMPT = {'serve', 'static', 'health', 'metrics'}
+
+_SLOT = struct.Struct('<Qdd8x')     # key hash, tokens, updated (epoch s)
+_GROUP = 8
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, retry_after: float, reason: str = 'quota'):
+        super().__init__(f"{reason}: retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def _limits() -> dict:
+    limits = {cls: dict(roles) for cls, roles in LIMITS.items()}
+    for cls, roles in json.loads(os.environ.get('QUOTAS') or '{}').items():
+        limits.setdefault(cls, {}).update({role: tuple(v) if v else None for role, v in roles.items()})
+    return limits
+
+
+class BucketTable:
+    """Token buckets in a shared memory-mapped file; take() is safe across threads and processes."""
+
+    def __init__(self, path: str = QUOTA_FILE, slots: int = QUOTA_SLOTS):
+        self.path = path
+        self.slots = slots
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            size = self.slots * _SLOT.size
+            if fcntl is None:
+                self.fd, self.map = None, mmap.mmap(-1, size)
+            else:
+                os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                if os.fstat(self.fd).st_size < size:
+                    os.ftruncate(self.fd, size)
+                self.map = mmap.mmap(self.fd, size)
+            self._pid = os.getpid()
+
+    def take(self, key: str, rate: float, burst: float, cost: float = 1.0, now: float = None) -> float:
+        """Charge `cost` tokens. Returns 0.0 if allowed, else the seconds until it would be."""
+        self._open()
+        h = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), 'little') | 1
+        start = (h % (self.slots // _GROUP)) * _GROUP * _SLOT.size
+        now = time.time() if now is None else now
+        with self._lock:
+            if self.fd is not None:
+                fcntl.lockf(self.fd, fcntl.LOCK_EX, _GROUP * _SLOT.size, start)
+            try:
+                slot, stalest, tokens, updated = None, None, burst, now
+                for offset in range(start, start + _GROUP * _SLOT.size, _SLOT.size):
+                    key_hash, t, u = _SLOT.unpack_from(self.map, offset)
+                    if key_hash == h:
+                        slot, tokens, updated = offset, t, u
+                        break
+                    if slot is None and key_hash == 0:
+                        slot = offset
+                    if stalest is None or u < stalest[1]:
+                        stalest = (offset, u)
+                if slot is None:
+                    slot = stalest[0]
+                tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+                wait = 0.0
+                if tokens >= cost:
+                    tokens -= cost
+                else:
+                    wait = (cost - tokens) / rate
+                _SLOT.pack_into(self.map, slot, h, tokens, now)
+                return wait
+            finally:
+                if self.fd is not None:
+                    fcntl.lockf(self.fd, fcntl.LOCK_UN, _GROUP * _SLOT.size, start)
+
+
+class FairGate:
+    """At most `slots` concurrent holders; waiters are admitted round-robin by user."""
+
+    def __init__(self, slots: int = GATE_SLOTS, per_user: int = GATE_QUEUE_PER_USER,
+                 wait_seconds: float = GATE_WAIT_SECONDS, total: int = GATE_QUEUE_TOTAL):
+        self.free = slots
+        self.per_user = per_user
+        self.total = total
+        self.queued = 0
+        self.wait_seconds = wait_seconds
+        self.queues = OrderedDict()      # user -> deque of waiting tickets, next user to serve first
+        self.granted = set()
+        self.cond = threading.Condition()
+
+    def acquire(self, user):
+        with self.cond:
+            if self.free and not self.queues:
+                self.free -= 1
+                return
+            queue = self.queues.get(user)
+            if queue is not None and len(queue) >= self.per_user:
+                raise QuotaExceeded(1.0, 'queue_full')
+            if self.queued >= self.total:
+                raise QuotaExceeded(1.0, 'busy')
+            ticket = object()
+            self.queues.setdefault(user, deque()).append(ticket)
+            self.queued += 1
+            deadline = time.monotonic() + self.wait_seconds
+            try:
+                while ticket not in self.granted:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._drop(user, ticket)
+                        raise QuotaExceeded(1.0, 'busy')
+                    self.cond.wait(remaining)
+                self.granted.discard(ticket)
+            finally:
+                self.queued -= 1
+
+    def release(self):
+        with self.cond:
+            self.free += 1
+            self._dispatch()
+
+    def _drop(self, user, ticket):
+        queue = self.queues.get(user)
+        if queue is not None and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del self.queues[user]
+
+    def _dispatch(self):
+        while self.free and self.queues:
+            user, queue = next(iter(self.queues.items()))
+            self.granted.add(queue.popleft())
+            self.free -= 1
+            if queue:
+                self.queues.move_to_end(user)     # next turn goes to another user
+            else:
+                del self.queues[user]
+        self.cond.notify_all()
+
+    @property
+    def waiting(self) -> int:
+        with self.cond:
+            return sum(len(q) for q in self.queues.values())
+
+
+buckets = BucketTable()
+gate = FairGate()
+_roles = {}      # user id -> (role value, expires)
+
+
+def _role(user_id: int) -> str:
+    cached = _roles.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    from database import DBSession
+    from models import User
+    with DBSession() as db:
+        role = db.query(User.role).filter(User.id == user_id).scalar()
+    value = role.value if role is not None else 'free'
+    _roles[user_id] = (value, time.monotonic() + ROLE_TTL)
+    return value
+
+
+def client_ip(remote: str, forwarded_for: str = None, hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The client address as ProxyFix(x_for=hops) sees it: the hops-th X-Forwarded-For entry from
+    the right, which a trusted proxy appended, else the peer address."""
+    if hops and forwarded_for:
+        entries = [e.strip() for e in forwarded_for.split(',')]
+        if len(entries) >= hops and entries[-hops]:
+            return entries[-hops]
+    return remote or ''
+
+
+def caller(authorization: str, ip: str) -> tuple:
+    """(bucket identity, role): the bearer token's user, else the client IP."""
+    if (authorization or '').startswith('Bearer '):
+        from auth import get_user_from_token
+        data = get_user_from_token(authorization[7:])
+        if data:
+            return f"u{data['user_id']}", _role(data['user_id'])
+    return f"ip{ip}", 'anonymous'
+
+
+def _caller(request):
+    # remote_addr is already the trusted client address: app.py wraps the app in ProxyFix.
+    return caller(request.headers.get('Authorization', ''), request.remote_addr)
+
+
+def _cost(request, limit) -> float:
+    """Tokens a request costs: one per leg for baskets (capped at the burst), else one."""
+    if request.endpoint == 'trading_execute_basket':
+        orders = (request.get_json(silent=True) or {}).get('orders')
+        if isinstance(orders, list) and orders:
+            return float(min(len(orders), limit[1]))
+    return 1.0
+
+
+def _refuse(error: QuotaExceeded, route_class: str, role: str):
+    from flask import jsonify
+    metrics.inc('prismtrade_quota_rejections_total', route=route_class, role=role, reason=error.reason)
+    retry = max(1, math.ceil(error.retry_after))
+    response = jsonify({'error': 'Too many requests', 'reason': error.reason, 'retry_after': retry})
+    response.status_code = 429 if error.reason != 'busy' else 503
+    response.headers['Retry-After'] = str(retry)
+    return response
+
+
+_shared_limits = None
+
+
+async def charge_async(request, endpoint: str) -> dict:
+    """Charge an aiohttp request. Returns None if allowed, else the 429 body plus 'retry_after'
+    for the caller to send (the role lookup may hit the DB, so it runs on the default executor)."""
+    global _shared_limits
+    if os.environ.get('QUOTAS_DISABLED') == '1':
+        return None
+    if _shared_limits is None:
+        _shared_limits = _limits()
+    import asyncio
+    route_class = ROUTES.get(endpoint, 'default')
+    ip = client_ip(request.remote, request.headers.get('X-Forwarded-For'))
+    identity, role = await asyncio.get_running_loop().run_in_executor(
+        None, caller, request.headers.get('Authorization', ''), ip)
+    limit = _shared_limits.get(route_class, {}).get(role)
+    wait = buckets.take(f'{identity}:{route_class}', *limit) if limit is not None else 0.0
+    if not wait:
+        return None
+    metrics.inc('prismtrade_quota_rejections_total', route=route_class, role=role, reason='quota')
+    retry = max(1, math.ceil(wait))
+    return {'error': 'Too many requests', 'reason': 'quota', 'retry_after': retry}
+
+
+def instrument_app(app):
+    """Charge every request against its quota; gate exchange-bound routes fairly."""
+    from flask import g, request
+    if os.environ.get('QUOTAS_DISABLED') == '1':
+        return
+    limits = _limits()
+
+    @app.before_request
+    def _charge():
+        endpoint = request.endpoint
+        if endpoint is None or endpoint in EXEMPT or request.method == 'OPTIONS':
+            return None
+        route_class = ROUTES.get(endpoint, 'default')
+        caller, role = _caller(request)
+        limit = limits.get(route_class, {}).get(role)
+        if limit is not None:
+            wait = buckets.take(f'{caller}:{route_class}', *limit, cost=_cost(request, limit))
+            if wait:
+                return _refuse(QuotaExceeded(wait), route_class, role)
+        if route_class in EXCHANGE_ROUTES and role != 'admin':
+            try:
+                gate.acquire(caller)
+            except QuotaExceeded as e:
+                return _refuse(e, route_class, role)
+            g.quota_gated = True
+        return None
+
+    @app.teardown_request
+    def _release(exc):
+        if g.pop('quota_gated', False):
+            gate.release()
@@ -0,0 +1,224 @@
+"""Higher timeframes built locally from one 1m feed per symbol.
+
+For each symbol, the 1m series (the base) is kept in memory. The candle
+routes derive 5m/15m/1h/4h/1d, or any custom 'Nm'/'Nh'/'Nd'/'Nw' interval,
+from it instead of asking the exchange for each interval. Each new or updated
+1m bar is folded into the forming bar of every built timeframe in one pass.
+Switching timeframes or adding charts for the same symbol therefore costs no
+extra upstream polling. The one exception is a single seed fetch when a
+chart asks for more history than the 1m window covers. Timeframes this
+module can't build (calendar months, '1M') are not its business: check
+buildable() and pass those through to the exchange.
+
+A base poll asks for bars since the last one held, or for the latest window
+when the symbol has been idle longer than one poll can cover. If the rows
+that come back don't reach back to the last bar held (the exchange capped or
+ignored `since`), the base and every frame are reseeded from them rather
+than merged across a silent hole.
+
+Callers own the I/O, so the same store serves the sync (market_proxy) and
+async (market_server) paths:
+
+    series = resampler.series(symbol)
+    req = series.next_fetch(timeframe, limit)
+    while req is not None:
+        series.apply(req, fetch(symbol, req.timeframe, req.limit, req.since))
+        req = series.next_fetch(timeframe, limit)
+    return series.select(timeframe, limit, since)
+
+resample() is the vectorised one-shot version, for a whole array of bars.
+"""
+import re
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+BASE_TF = '1m'
+BASE_FETCH = 1000               # 1m bars requested when a symbol is first seen (most exchanges cap here)
+BASE_WINDOW_BARS = 7 * 1440     # 1m bars kept per symbol
+MAX_FRAME_BARS = 5000           # higher-timeframe bars kept per symbol/timeframe
+MAX_SYMBOLS = 200
+FRESH_SECONDS = 2.0             # the 1m feed is polled at most this often per symbol
+
+_UNITS = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 7 * 86_400_000}
+_WEEK_OFFSET_MS = 4 * 86_400_000    # exchange weeks open on Monday; the epoch was a Thursday
+
+Fetch = namedtuple('Fetch', ['kind', 'timeframe', 'limit', 'since'])
+
+
+def timeframe_ms(timeframe: str) -> tuple:
+    """'15m' -> (900000, 0); '1w' -> (604800000, Monday offset). Raises ValueError if unsupported."""
+    match = re.fullmatch(r'(\d+)([mhdw])', timeframe or '')
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Unsupported timeframe {timeframe}")
+    step = int(match.group(1)) * _UNITS[match.group(2)]
+    return step, (_WEEK_OFFSET_MS if match.group(2) == 'w' else 0)
+
+
+def buildable(timeframe: str) -> bool:
+    """Whether timeframe_ms() accepts `timeframe`, i.e. whether it can be built from 1m bars."""
+    try:
+        timeframe_ms(timeframe)
+    except ValueError:
+        return False
+    return True
+
+
+def resample(bars, timeframe: str) -> np.ndarray:
+    """[[ms, o, h, l, c, v], ...] (sorted, any finer timeframe) -> `timeframe` bars, in one pass.
+
+    Buckets with no input bars are omitted, as exchanges do.
+    """
+    step, offset = timeframe_ms(timeframe)
+    bars = np.asarray(bars, dtype=np.float64).reshape(-1, 6)
+    if not len(bars):
+        return bars
+    keys = (bars[:, 0].astype(np.int64) - offset) // step
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(bars)] - 1
+    out = np.empty((len(starts), 6))
+    out[:, 0] = keys[starts] * step + offset
+    out[:, 1] = bars[starts, 1]
+    out[:, 2] = np.maximum.reduceat(bars[:, 2], starts)
+    out[:, 3] = np.minimum.reduceat(bars[:, 3], starts)
+    out[:, 4] = bars[ends, 4]
+    out[:, 5] = np.add.reduceat(bars[:, 5], starts)
+    return out
+
+
+def _fold(bars: list, row: list, old, step: int, offset: int):
+    """Fold one 1m bar (new, or an update of `old`) into the forming bar of a higher frame."""
+    start = (int(row[0]) - offset) // step * step + offset
+    if bars and bars[-1][0] == start:
+        bar = bars[-1]
+        bar[2] = max(bar[2], row[2])
+        bar[3] = min(bar[3], row[3])
+        bar[4] = row[4]
+        bar[5] += row[5] - (old[5] if old is not None else 0.0)
+    elif not bars or start > bars[-1][0]:
+        bars.append([float(start), row[1], row[2], row[3], row[4], row[5]])
+
+
+class SymbolBars:
+    """The 1m base series of one symbol plus every higher timeframe built from it so far."""
+
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.base = []            # [[ms, o, h, l, c, v], ...] oldest first
+        self.frames = {}          # timeframe -> bars, kept current by update()
+        self.steps = {}           # timeframe -> (step_ms, offset_ms)
+        self.seeded = {}          # timeframe -> largest limit already seeded from upstream
+        self.polled_at = 0.0
+        self.lock = threading.Lock()
+
+    # ---- I/O protocol ----------------------------------------------------
+
+    def next_fetch(self, timeframe: str, limit: int, now: float = None):
+        """The next upstream request needed to answer (timeframe, limit), or None."""
+        now = time.time() if now is None else now
+        if not self.base and not self.polled_at:
+            return Fetch('base', BASE_TF, max(BASE_FETCH, limit if timeframe == BASE_TF else 0), None)
+        if now - self.polled_at >= FRESH_SECONDS:
+            since = int(self.base[-1][0]) if self.base else None
+            if since is not None and now * 1000 - since >= BASE_FETCH * _UNITS['m']:
+                since = None      # idle too long for one poll to catch up: take the latest window
+            return Fetch('base', BASE_TF, BASE_FETCH, since)
+        bars = self.base if timeframe == BASE_TF else self.frame(timeframe)
+        if len(bars) < limit and self.seeded.get(timeframe, 0) < limit:
+            return Fetch('seed', timeframe, limit, None)
+        return None
+
+    def apply(self, req: Fetch, rows):
+        """Record the result of next_fetch()'s request (rows=None if a seed fetch failed)."""
+        if req.kind == 'base':
+            self.polled_at = time.time()
+            if rows and self.base and rows[0][0] > self.base[-1][0]:
+                self.reset()      # the poll doesn't overlap what we hold: there is a gap between
+            self.update(rows or [])
+        else:
+            self.seeded[req.timeframe] = req.limit
+            if rows:
+                self.seed(req.timeframe, rows)
+
+    # ---- state -----------------------------------------------------------
+
+    def reset(self):
+        """Drop the base, every built frame and seed history; the next rows start afresh."""
+        self.base = []
+        self.frames = {}
+        self.seeded = {}
+
+    def update(self, rows):
+        """Merge 1m rows (oldest first) into the base and every built frame."""
+        for raw in rows:
+            row = [float(x) for x in raw[:6]]
+            old = None
+            if self.base:
+                last = self.base[-1]
+                if row[0] < last[0] or row == last:
+                    continue
+                if row[0] == last[0]:
+                    old = last
+                    self.base[-1] = row
+                else:
+                    self.base.append(row)
+            else:
+                self.base.append(row)
+            for timeframe, bars in self.frames.items():
+                _fold(bars, row, old, *self.steps[timeframe])
+        if len(self.base) > BASE_WINDOW_BARS:
+            del self.base[:-BASE_WINDOW_BARS]
+        for bars in self.frames.values():
+            if len(bars) > MAX_FRAME_BARS:
+                del bars[:-MAX_FRAME_BARS]
+
+    def frame(self, timeframe: str) -> list:
+        """Bars for `timeframe`, built from the base on first use."""
+        bars = self.frames.get(timeframe)
+        if bars is None:
+            step, offset = self.steps[timeframe] = timeframe_ms(timeframe)
+            bars = resample(self.base, timeframe).tolist()
+            # The first bucket is partial unless the base starts exactly on its boundary.
+            if bars and self.base and bars[0][0] < self.base[0][0]:
+                bars.pop(0)
+            self.frames[timeframe] = bars
+        return bars
+
+    def seed(self, timeframe: str, history):
+        """Prepend upstream bars older than anything held (exchange history beyond the 1m window)."""
+        bars = self.base if timeframe == BASE_TF else self.frame(timeframe)
+        first = bars[0][0] if bars else float('inf')
+        bars[:0] = [[float(x) for x in row[:6]] for row in history if row[0] < first]
+
+    def select(self, timeframe: str, limit: int, since: int = None) -> list:
+        bars = self.base if timeframe == BASE_TF else self.frame(timeframe)
+        if since is not None:
+            rows = [list(b) for b in bars if b[0] >= since][:limit]
+        else:
+            rows = [list(b) for b in bars[-limit:]]
+        for row in rows:
+            row[0] = int(row[0])
+        return rows
+
+
+_series = OrderedDict()     # symbol -> SymbolBars, least recently used first
+_series_lock = threading.Lock()
+
+
+def series(symbol: str) -> SymbolBars:
+    with _series_lock:
+        s = _series.get(symbol)
+        if s is None:
+            s = _series[symbol] = SymbolBars(symbol)
+            while len(_series) > MAX_SYMBOLS:
+                _series.popitem(last=False)
+        else:
+            _series.move_to_end(symbol)
+        return s
+
+
+def clear():
+    with _series_lock:
+        _series.clear()
@@ -0,0 +1,285 @@
+"""In-memory pre-trade risk checks, enforcing the limits stored on User.
+
+TradingEngine.execute_buy asks this module before any DB write or exchange
+order. The answer comes from counters held per (user, mode), so a check is a
+few dict lookups:
+
+  open_trades     open positions, checked against User.max_open_trades
+  exposure        per symbol: [gross, net] entry notional of open positions
+  realised_today  realised P&L since 00:00 UTC, checked against RISK_DAILY_LOSS_PCT
+  balance         the base for every percentage: paper_balance for PAPER orders; for LIVE
+                  orders the exchange's balance in the symbol's quote currency, fetched
+                  through live_balance() and cached per user for RISK_LIVE_BALANCE_SECONDS
+
+The rules, in order:
+
+  max_open_trades  an order that would open one position too many is rejected
+  daily_loss       once today's realised loss passes RISK_DAILY_LOSS_PCT of balance, new positions are rejected
+  risk_per_trade   the loss at the stop (stop_loss_pct, or RISK_DEFAULT_STOP_PCT if the
+                   order has no stop) may not exceed User.risk_per_trade % of balance
+  symbol_exposure  gross exposure in one symbol may not exceed RISK_MAX_SYMBOL_EXPOSURE_PCT
+                   of balance (0 disables this rule)
+
+A priced LIVE order with no known exchange balance is rejected (rule
+'balance') rather than let through with the percentage rules skipped.
+
+Counters update incrementally on each fill and close (on_open/on_close). They
+are rebuilt from the DB when first used, then every RISK_RESYNC_SECONDS. Each
+gunicorn worker holds its own copy, so a fill made in another worker shows up
+here within that window. Until then the limits are soft by at most the orders
+placed in that window.
+"""
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+import metrics
+
+RESYNC_SECONDS = float(os.environ.get('RISK_RESYNC_SECONDS', 5))
+DEFAULT_STOP_PCT = float(os.environ.get('RISK_DEFAULT_STOP_PCT', 10))
+DAILY_LOSS_PCT = float(os.environ.get('RISK_DAILY_LOSS_PCT', 10))
+MAX_SYMBOL_EXPOSURE_PCT = float(os.environ.get('RISK_MAX_SYMBOL_EXPOSURE_PCT', 0))
+LIVE_BALANCE_SECONDS = float(os.environ.get('RISK_LIVE_BALANCE_SECONDS', 30))
+
+
+class RiskRejected(Exception):
+    """An order blocked by a pre-trade rule. `rule` names the rule."""
+
+    def __init__(self, rule: str, message: str):
+        super().__init__(message)
+        self.rule = rule
+
+
+def _today() -> int:
+    return datetime.now(timezone.utc).date().toordinal()
+
+
+def _is_live(mode) -> bool:
+    return getattr(mode, 'value', mode) == 'live'
+
+
+class Book:
+    """Risk counters for one user in one trading mode."""
+
+    __slots__ = ('max_open_trades', 'risk_per_trade', 'balance', 'positions', 'exposure',
+                 'day', 'realised_today', 'synced_at')
+
+    def __init__(self):
+        self.max_open_trades = None
+        self.risk_per_trade = None
+        self.balance = 0.0
+        self.positions = {}                          # trade id -> (symbol, signed entry notional)
+        self.exposure = defaultdict(lambda: [0.0, 0.0])   # symbol -> [gross, net]
+        self.day = _today()
+        self.realised_today = 0.0
+        self.synced_at = 0.0
+
+    @property
+    def open_trades(self) -> int:
+        return len(self.positions)
+
+    def open(self, trade_id, symbol: str, side: str, notional: float):
+        signed = notional if side == 'buy' else -notional
+        self.positions[trade_id] = (symbol, signed)
+        exposure = self.exposure[symbol]
+        exposure[0] += notional
+        exposure[1] += signed
+
+    def close(self, trade_id, pnl: float):
+        position = self.positions.pop(trade_id, None)
+        if position is not None:
+            symbol, signed = position
+            exposure = self.exposure[symbol]
+            exposure[0] -= abs(signed)
+            exposure[1] -= signed
+            if exposure[0] <= 1e-9:
+                del self.exposure[symbol]
+        if self.day != _today():
+            self.day, self.realised_today = _today(), 0.0
+        self.realised_today += pnl or 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            'open_trades': self.open_trades, 'max_open_trades': self.max_open_trades,
+            'risk_per_trade': self.risk_per_trade, 'balance': self.balance,
+            'realised_today': self.realised_today if self.day == _today() else 0.0,
+            'exposure': {s: {'gross': g, 'net': n} for s, (g, n) in self.exposure.items()},
+        }
+
+
+class RiskEngine:
+    def __init__(self, resync_seconds: float = RESYNC_SECONDS):
+        self.resync_seconds = resync_seconds
+        self._books = {}      # (user id, TradingMode) -> Book
+        self._live_balances = {}      # (user id, exchange, quote currency) -> (balance, fetched at)
+        self._lock = threading.Lock()
+
+    # ---- state -----------------------------------------------------------
+
+    def load(self, user_ids=None):
+        """Rebuild books from the DB: every user, or just `user_ids`. Three queries either way."""
+        from database import DBSession
+        from models import Trade, TradeStatus, TradingMode, User
+        from sqlalchemy import func
+
+        midnight = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0, tzinfo=None)
+        with DBSession() as db:
+            users = db.query(User.id, User.max_open_trades, User.risk_per_trade,
+                             User.paper_balance, User.live_balance)
+            trades = db.query(Trade.id, Trade.user_id, Trade.trading_mode, Trade.trading_pair, Trade.side,
+                              Trade.entry_price, Trade.entry_amount).filter(Trade.status == TradeStatus.OPEN)
+            realised = db.query(Trade.user_id, Trade.trading_mode, func.sum(Trade.profit_loss)).filter(
+                Trade.status == TradeStatus.CLOSED, Trade.exit_time >= midnight)
+            if user_ids is not None:
+                users = users.filter(User.id.in_(user_ids))
+                trades = trades.filter(Trade.user_id.in_(user_ids))
+                realised = realised.filter(Trade.user_id.in_(user_ids))
+            users = users.all()
+            trades = trades.all()
+            realised = realised.group_by(Trade.user_id, Trade.trading_mode).all()
+
+        now = time.monotonic()
+        books = {}
+        for uid, max_open, risk_pct, paper, live in users:
+            for mode, balance in ((TradingMode.PAPER, paper), (TradingMode.LIVE, live)):
+                book = books[(uid, mode)] = Book()
+                book.max_open_trades, book.risk_per_trade = max_open, risk_pct
+                book.balance = balance or 0.0
+                book.synced_at = now
+        for trade_id, uid, mode, symbol, side, price, amount in trades:
+            if (uid, mode) in books:
+                books[(uid, mode)].open(trade_id, symbol, side, price * amount)
+        for uid, mode, pnl in realised:
+            if (uid, mode) in books:
+                books[(uid, mode)].realised_today = pnl or 0.0
+        with self._lock:
+            if user_ids is None:
+                self._books = books
+            else:
+                self._books.update(books)
+        return books
+
+    def book(self, user_id: int, mode) -> Book:
+        book = self._books.get((user_id, mode))
+        if book is None or time.monotonic() - book.synced_at > self.resync_seconds:
+            metrics.cache_miss('risk_book')
+            book = self.load([user_id]).get((user_id, mode)) or Book()
+        else:
+            metrics.cache_hit('risk_book')
+        return book
+
+    def live_balance(self, user_id: int, exchange: str, quote: str, fetch) -> float:
+        """The user's `exchange` balance in `quote`; `fetch()` is called at most every LIVE_BALANCE_SECONDS."""
+        key = (user_id, exchange, quote)
+        cached = self._live_balances.get(key)
+        if cached is not None and time.monotonic() - cached[1] <= LIVE_BALANCE_SECONDS:
+            metrics.cache_hit('risk_live_balance')
+            return cached[0]
+        metrics.cache_miss('risk_live_balance')
+        balance = float(fetch() or 0.0)
+        with self._lock:
+            self._live_balances[key] = (balance, time.monotonic())
+        return balance
+
+    # ---- checks ----------------------------------------------------------
+
+    def check(self, user_id: int, mode, symbol: str, amount: float, price: float = None,
+              stop_loss_pct: float = None, opening: int = 1, balance: float = None,
+              pending: float = 0.0) -> Book:
+        """Raise RiskRejected if a new position breaks a limit. Without `price`, only the
+        rules that don't need one (open trades, daily loss) are checked. `opening` is how many
+        positions the order adds (check_basket passes 0 and counts the basket as a whole).
+        `balance` is the base for LIVE orders (see live_balance()); `pending` is notional in
+        `symbol` not on the book yet, such as earlier legs of the same basket."""
+        book = self.book(user_id, mode)
+        if book.max_open_trades is not None and book.open_trades + opening > book.max_open_trades:
+            self._reject('max_open_trades', f"{book.open_trades} positions open, limit is {book.max_open_trades}")
+        if _is_live(mode):
+            if price is not None and not (balance and balance > 0):
+                self._reject('balance', f"no exchange balance known to size a LIVE {symbol} order against")
+        else:
+            balance = book.balance
+        if balance and balance > 0:
+            realised = book.realised_today if book.day == _today() else 0.0
+            if DAILY_LOSS_PCT and -realised >= balance * DAILY_LOSS_PCT / 100:
+                self._reject('daily_loss', f"realised loss today ${-realised:,.2f} reached "
+                                           f"{DAILY_LOSS_PCT:g}% of ${balance:,.2f}")
+            if price is not None:
+                notional = amount * price
+                at_risk = notional * (stop_loss_pct or DEFAULT_STOP_PCT) / 100
+                if book.risk_per_trade and at_risk > balance * book.risk_per_trade / 100:
+                    self._reject('risk_per_trade', f"${at_risk:,.2f} at risk exceeds {book.risk_per_trade:g}% "
+                                                   f"of ${balance:,.2f}")
+                gross = (book.exposure[symbol][0] if symbol in book.exposure else 0.0) + pending
+                if MAX_SYMBOL_EXPOSURE_PCT and gross + notional > balance * MAX_SYMBOL_EXPOSURE_PCT / 100:
+                    self._reject('symbol_exposure', f"{symbol} exposure ${gross + notional:,.2f} exceeds "
+                                                    f"{MAX_SYMBOL_EXPOSURE_PCT:g}% of ${balance:,.2f}")
+        return book
+
+    def check_basket(self, user_id: int, mode, buys: list, closes: int = 0, balances: dict = None) -> Book:
+        """check() every buy leg [(symbol, amount, price, stop_loss_pct), ...], then the position
+        count for the basket as a whole: positions it closes free slots for the ones it opens.
+        Legs in the same symbol count together towards its exposure. `balances` maps each
+        symbol to its LIVE balance base."""
+        pending = defaultdict(float)
+        for symbol, amount, price, stop_loss_pct in buys:
+            self.check(user_id, mode, symbol, amount, price, stop_loss_pct, opening=0,
+                       balance=(balances or {}).get(symbol), pending=pending[symbol])
+            pending[symbol] += amount * price
+        book = self.book(user_id, mode)
+        opening = len(buys) - closes
+        if book.max_open_trades is not None and opening > 0 and \
+                book.open_trades + opening > book.max_open_trades:
+            self._reject('max_open_trades', f"{book.open_trades} positions open + {opening} in the basket, "
+                                            f"limit is {book.max_open_trades}")
+        return book
+
+    @staticmethod
+    def _reject(rule: str, message: str):
+        metrics.inc('prismtrade_risk_rejections_total', rule=rule)
+        raise RiskRejected(rule, f"Risk check failed ({rule}): {message}")
+
+    # ---- updates ---------------------------------------------------------
+
+    def on_open(self, user_id: int, mode, trade_id, symbol: str, side: str, notional: float, cash: float = 0.0):
+        """A position was opened; `cash` is the balance change (negative for a paper buy)."""
+        book = self._books.get((user_id, mode))
+        if book is not None:
+            with self._lock:
+                book.open(trade_id, symbol, side, notional)
+                book.balance += cash
+        if _is_live(mode):
+            self._forget_live_balances(user_id)
+
+    def on_close(self, user_id: int, mode, trade_id, pnl: float, cash: float = 0.0):
+        book = self._books.get((user_id, mode))
+        if book is not None:
+            with self._lock:
+                book.close(trade_id, pnl)
+                book.balance += cash
+        if _is_live(mode):
+            self._forget_live_balances(user_id)
+
+    def _forget_live_balances(self, user_id: int):
+        """A LIVE fill moved the exchange balance; refetch it for the next order."""
+        with self._lock:
+            for key in [k for k in self._live_balances if k[0] == user_id]:
+                del self._live_balances[key]
+
+    def forget(self, user_id: int = None):
+        """Drop cached books (one user's, or all) so the next check reloads them."""
+        with self._lock:
+            if user_id is None:
+                self._books.clear()
+                self._live_balances.clear()
+            else:
+                for key in [k for k in self._books if k[0] == user_id]:
+                    del self._books[key]
+                for key in [k for k in self._live_balances if k[0] == user_id]:
+                    del self._live_balances[key]
+
+
+# Process-wide engine used by TradingEngine.
+shared = RiskEngine()
@@ -0,0 +1,58 @@
+"""Warm state for preforked gunicorn workers.
+
+gunicorn.conf.py turns on preload_app, so gunicorn imports the app once, in
+the master, and init_db() runs once there. when_ready() then calls warm(),
+which does the following before any worker forks:
+
+  - imports the modules that the app otherwise loads lazily on first use
+    (ccxt, ccxt.async_support, passlib/bcrypt)
+  - loads the symbol index snapshot (building it, in parallel, if there is none)
+    and initialises every candidate exchange from it
+  - resolves WARM_SYMBOLS into market_proxy's symbol table
+  - builds the pre-trade risk books for every user (risk_engine)
+  - freezes the GC so forked workers share these objects copy-on-write
+
+Every worker then starts with loaded markets and resolved symbols, and never
+runs its own load_markets().
+
+Without preload (python app.py, tests, scripts), nothing here runs and
+the heavy imports happen on first use.
+"""
+import gc
+import os
+import time
+
+WARM_SYMBOLS = [s for s in os.environ.get('WARM_SYMBOLS', 'BTCUSDT,ETHUSDT,SOLUSDT').split(',') if s]
+
+
+def import_heavy():
+    import ccxt                    # noqa: F401
+    import ccxt.async_support      # noqa: F401
+    import auth
+    import exchange_connector      # noqa: F401
+    import market_proxy            # noqa: F401
+    import trading_engine          # noqa: F401
+    auth.pwd_context()
+
+
+def warm_markets(symbols=None) -> dict:
+    """Load the symbol index and candidate exchanges, resolve `symbols`. Returns what was warmed."""
+    import market_proxy
+    index = market_proxy.symbols(block=True)     # no refresh thread may be running at fork
+    for exid in index.exchanges:
+        market_proxy._exchange(exid)
+    for symbol in symbols if symbols is not None else WARM_SYMBOLS:
+        market_proxy._resolve(symbol)
+    return {'markets': index.counts(), 'resolved': dict(market_proxy._resolved)}
+
+
+def warm() -> dict:
+    started = time.perf_counter()
+    import_heavy()
+    report = warm_markets()
+    import risk_engine
+    report['risk_books'] = len(risk_engine.shared.load())
+    gc.collect()
+    gc.freeze()
+    report['seconds'] = round(time.perf_counter() - started, 2)
+    return report
@@ -0,0 +1,299 @@
+"""In-process backtester for freqtrade-style IStrategy classes.
+
+Loads strategies straight from user_data/strategies and runs them on cached
+OHLCV arrays, so a backtest does not pay for the full freqtrade start-up and
+data reload on every run.
+
+Exits follow freqtrade's rules for a single long position per pair:
+  - entries/exits fill at the open of the candle after the signal,
+  - minimal_roi and stoploss are checked against each candle's high/low,
+  - if stoploss and ROI are both touched on one candle, stoploss wins
+    (we can't know the intrabar order, so we assume the worse one),
+  - a candle that gaps through a level fills at its open.
+
+These checks run over whole high/low arrays (backtesting.bracket_exits), so
+a backtest with stoploss/ROI costs about the same as a signal-only one.
+
+populate_indicators() output is memoized per (strategy, pair, timeframe,
+data range), so parameter tweaks to entry/exit logic re-use the indicators.
+"""
+import importlib.util
+import json
+import math
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import feature_store
+import metrics
+from backtesting import BacktestEngine, bracket_exits, chain_trades, replay_trades
+from indicators import shared, spec
+from resampler import timeframe_ms
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STRATEGY_DIR = os.path.join(BASE_DIR, 'user_data', 'strategies')
+CONFIG_PATH = os.path.join(BASE_DIR, 'user_data', 'config.json')
+
+OHLCV_TTL = 60               # seconds a fetched candle set stays fresh
+INDICATOR_CACHE_SIZE = 64    # populate_indicators() results kept (LRU)
+
+_ohlcv_cache = {}                    # (pair, timeframe, limit) -> (fetched_at, DataFrame)
+_indicator_cache = OrderedDict()     # (strategy, mtime, series, first, last, rows, last bar) -> DataFrame
+_module_cache = {}                   # path -> (mtime, {class_name: class})
+
+_TF_UNITS = {'s': 1 / 60, 'm': 1, 'h': 60, 'd': 1440, 'w': 10080}
+
+
+def timeframe_to_minutes(timeframe: str) -> float:
+    """'15m' -> 15, '4h' -> 240, '1d' -> 1440."""
+    return int(timeframe[:-1]) * _TF_UNITS[timeframe[-1]]
+
+
+def load_config() -> dict:
+    with open(CONFIG_PATH) as f:
+        return json.load(f)
+
+
+# ---- strategy loading ------------------------------------------------------
+
+def _load_module_classes(path: str) -> dict:
+    """Import a strategy file and return its IStrategy-like classes. Cached until the file changes."""
+    mtime = os.path.getmtime(path)
+    cached = _module_cache.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    name = f"user_strategy_{os.path.splitext(os.path.basename(path))[0]}"
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    classes = {
+        attr: obj for attr, obj in vars(module).items()
+        if isinstance(obj, type) and obj.__module__ == name
+        and hasattr(obj, 'populate_indicators') and hasattr(obj, 'populate_entry_trend')
+    }
+    _module_cache[path] = (mtime, classes)
+    return classes
+
+
+def _strategy_files():
+    for fname in sorted(os.listdir(STRATEGY_DIR)):
+        if fname.endswith('.py') and not fname.startswith('_'):
+            yield os.path.join(STRATEGY_DIR, fname)
+
+
+def list_strategies() -> list:
+    """Names of all strategy classes found in user_data/strategies."""
+    names = []
+    for path in _strategy_files():
+        names.extend(_load_module_classes(path))
+    return names
+
+
+def load_strategy(name: str, config: dict = None):
+    """Instantiate strategy class `name`. Returns (strategy, source_mtime)."""
+    for path in _strategy_files():
+        classes = _load_module_classes(path)
+        if name in classes:
+            strategy = classes[name](config if config is not None else load_config())
+            return strategy, _module_cache[path][0]
+    raise Exception(f"Strategy {name} not found in {STRATEGY_DIR}")
+
+
+# ---- data ------------------------------------------------------------------
+
+def candles_to_dataframe(candles) -> pd.DataFrame:
+    """[[ms, o, h, l, c, v], ...] -> freqtrade-style DataFrame with a 'date' column."""
+    df = pd.DataFrame(candles, columns=['date', 'open', 'high', 'low', 'close', 'volume'])
+    df['date'] = pd.to_datetime(df['date'], unit='ms', utc=True)
+    return df
+
+
+def _store_exchange(pair: str, timeframe: str):
+    """The exchange to read stored history from: the pair's priority exchange in the symbol
+    index (the one market_proxy serves live bars from), if the store holds the pair there."""
+    import candle_store
+    import market_proxy
+    stored = candle_store.shared.exchanges(pair, timeframe)
+    if not stored:
+        return None
+    try:
+        market = market_proxy.symbols().resolve(pair)
+    except Exception:
+        market = None
+    if market is not None:
+        return market.exchange if market.exchange in stored else None
+    # No index (offline): live bars can't be fetched either, so any stored copy will do.
+    return next((exid for exid in market_proxy._CANDIDATES if exid in stored), stored[0])
+
+
+def load_ohlcv(pair: str, timeframe: str, limit: int = 1000) -> pd.DataFrame:
+    """OHLCV from market_proxy, cached for OHLCV_TTL seconds.
+
+    History backfilled into the candle store (see backfill.py) is used when there is any,
+    topped up with the live bars since, so `limit` can reach back years. If the live bars
+    don't reach back to the end of the store, the store is backfilled up to them first.
+    """
+    key = (pair, timeframe, limit)
+    cached = _ohlcv_cache.get(key)
+    if cached and time.time() - cached[0] < OHLCV_TTL:
+        metrics.cache_hit('backtest_ohlcv')
+        return cached[1]
+    metrics.cache_miss('backtest_ohlcv')
+    import candle_store
+    import market_proxy
+    exchange = _store_exchange(pair, timeframe)
+    stored = candle_store.shared.tail(exchange, pair, timeframe, limit) if exchange else None
+    if stored is not None and len(stored):
+        try:
+            live = market_proxy.fetch_candles(pair, timeframe, min(limit, 1000))
+        except Exception:
+            live = []
+        step, _ = timeframe_ms(timeframe)
+        if live and live[0][0] > stored[-1, 0] + step:
+            import backfill
+            try:
+                backfill.backfill(pair, timeframe, since=int(stored[-1, 0]) + step, exchange=exchange,
+                                  log=lambda *_: None)
+            except Exception as e:
+                raise Exception(f"{pair} {timeframe}: stored history ends before the live bars and the "
+                                f"gap could not be backfilled: {e}")
+            stored = candle_store.shared.tail(exchange, pair, timeframe, limit)
+        newer = np.asarray([c for c in live if c[0] > stored[-1, 0]], dtype=np.float64).reshape(-1, 6)
+        candles = np.concatenate([stored, newer])[-limit:]
+    else:
+        candles = market_proxy.fetch_candles(pair, timeframe, limit)
+        exchange = market_proxy._resolve(pair)[0]      # the exchange fetch_candles served them from
+    df = candles_to_dataframe(candles)
+    df.attrs['series'] = (exchange, pair, timeframe)             # shared indicator registry key
+    if stored is not None and len(stored):
+        df.attrs['candle_store'] = (exchange, pair, timeframe)    # features can come from feature_store
+    _ohlcv_cache[key] = (time.time(), df)
+    return df
+
+
+def _indicators(strategy, mtime, pair: str, timeframe: str, df: pd.DataFrame) -> pd.DataFrame:
+    """Memoized populate_indicators(). Returns a copy, since entry/exit logic mutates the frame.
+
+    Columns the strategy declares in its `indicators` dict ({column: {'name': ..., **params}})
+    are filled first: from feature_store when the candles came from the candle store, else
+    from the shared registry, so strategies on the same series share them.
+    """
+    # The last bar's values are part of the key: a refetch can update the forming bar in place.
+    key = (type(strategy).__name__, mtime, df.attrs.get('series', (None, pair, timeframe)),
+           df['date'].iat[0], df['date'].iat[-1], len(df),
+           tuple(float(df[c].iat[-1]) for c in ('open', 'high', 'low', 'close', 'volume')))
+    if key in _indicator_cache:
+        metrics.cache_hit('backtest_indicators')
+        _indicator_cache.move_to_end(key)
+    else:
+        metrics.cache_miss('backtest_indicators')
+        frame = df.copy()
+        declared = getattr(strategy, 'indicators', None)
+        if declared:
+            columns = {col: spec(d['name'], **{k: v for k, v in d.items() if k != 'name'})
+                       for col, d in declared.items()}
+            series = frame.attrs.get('candle_store')
+            if series:
+                feature_store.shared.attach(frame, *series, columns)
+            else:
+                shared.apply(frame.attrs.get('series', (None, pair, timeframe)), frame, columns)
+        _indicator_cache[key] = strategy.populate_indicators(frame, {'pair': pair})
+        if len(_indicator_cache) > INDICATOR_CACHE_SIZE:
+            _indicator_cache.popitem(last=False)
+    return _indicator_cache[key].copy()
+
+
+def clear_caches():
+    _ohlcv_cache.clear()
+    _indicator_cache.clear()
+    _module_cache.clear()
+
+
+# ---- exit simulation -------------------------------------------------------
+
+def _roi_targets(minimal_roi: dict, entry_prices: np.ndarray, n_bars: int, tf_minutes: float) -> list:
+    """minimal_roi as bracket_exits() targets: one (first_offset, end_offset, prices) per table step.
+
+    A step keyed k minutes applies from the first bar offset d with d * tf_minutes >= k until
+    the next step takes over.
+    """
+    if not minimal_roi:
+        return []
+    table = sorted((float(k), float(v)) for k, v in minimal_roi.items())
+    firsts = [math.ceil(k / tf_minutes) for k, _ in table] + [n_bars]
+    return [(firsts[t], firsts[t + 1], entry_prices * (1 + roi))
+            for t, (_, roi) in enumerate(table) if firsts[t] < firsts[t + 1]]
+
+
+def simulate_exits(open_, high, low, close, enter, exit_, stoploss: float,
+                   minimal_roi: dict, tf_minutes: float) -> list:
+    """Walk entries to exits. Returns [(entry_idx, entry_price, exit_idx, exit_price, reason)].
+
+    Stoploss and ROI exits are resolved for every candidate entry at once by
+    bracket_exits(); the only Python loop left is chaining the trades taken.
+    """
+    n = len(close)
+    entry_bars = np.flatnonzero(enter[:-1]) + 1
+    exit_bars = np.flatnonzero(exit_[:-1]) + 1
+    entry_prices = open_[entry_bars]
+    k = np.searchsorted(exit_bars, entry_bars, side='right')
+    signal_bars = np.append(exit_bars, n)[k]
+    has_signal = signal_bars < n
+    bars = np.where(has_signal, signal_bars, n - 1)
+    prices = np.where(has_signal, open_[bars], close[n - 1])
+    reasons = np.where(has_signal, 'exit_signal', 'end_of_data').astype(object)
+
+    stops = entry_prices * (1 + stoploss) if stoploss is not None else None
+    hit_bars, hit_prices, hit_reasons = bracket_exits(
+        open_, high, low, entry_bars, entry_bars, signal_bars, stops,
+        _roi_targets(minimal_roi, entry_prices, n, tf_minutes), target_reason='roi')
+    hit = hit_bars >= 0
+    return chain_trades(entry_bars, entry_prices, np.where(hit, hit_bars, bars),
+                        np.where(hit, hit_prices, prices), np.where(hit, hit_reasons, reasons))
+
+
+# ---- runner ----------------------------------------------------------------
+
+def run_backtest(strategy_name: str, pair: str = 'BTC/USDT', timeframe: str = None,
+                 df: pd.DataFrame = None, limit: int = 1000, initial_capital: float = None,
+                 stake_amount: float = None, fee_pct: float = 0.001) -> BacktestEngine:
+    """Backtest a user_data strategy; returns a BacktestEngine holding trades and equity.
+
+    Defaults for capital and stake come from user_data/config.json
+    (dry_run_wallet / stake_amount).
+    """
+    config = load_config()
+    strategy, mtime = load_strategy(strategy_name, config)
+    timeframe = timeframe or getattr(strategy, 'timeframe', None) or getattr(strategy, 'TIMEFRAME', '1h')
+    if df is None:
+        df = load_ohlcv(pair, timeframe, limit)
+    initial_capital = initial_capital or config.get('dry_run_wallet', 10000)
+    stake_amount = stake_amount or config.get('stake_amount', initial_capital)
+
+    metadata = {'pair': pair}
+    frame = _indicators(strategy, mtime, pair, timeframe, df)
+    frame = strategy.populate_entry_trend(frame, metadata)
+    frame = strategy.populate_exit_trend(frame, metadata)
+
+    open_, high, low, close = (frame[c].to_numpy(dtype=float) for c in ('open', 'high', 'low', 'close'))
+    enter = frame.get('enter_long', pd.Series(0, index=frame.index)).fillna(0).to_numpy() == 1
+    exit_ = frame.get('exit_long', pd.Series(0, index=frame.index)).fillna(0).to_numpy() == 1
+    trades = simulate_exits(open_, high, low, close, enter, exit_,
+                            getattr(strategy, 'stoploss', None),
+                            getattr(strategy, 'minimal_roi', {}),
+                            timeframe_to_minutes(timeframe))
+
+    engine = BacktestEngine(initial_capital=initial_capital, fee_pct=fee_pct, max_positions=1)
+    return replay_trades(engine, frame['date'].tolist(), close, trades, stake=stake_amount)
+
+
+if __name__ == "__main__":
+    import sys
+    name = sys.argv[1] if len(sys.argv) > 1 else 'SimpleStrategy'
+    pair = sys.argv[2] if len(sys.argv) > 2 else 'BTC/USDT'
+    started = time.perf_counter()
+    run_backtest(name, pair).print_report()
+    print(f"⏱️  {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,249 @@
+"""Persistent market metadata and an O(1) symbol resolution index.
+
+A snapshot holds the raw load_markets() output of each market_proxy
+candidate exchange. It lives in SYMBOL_INDEX_DIR:
+
+  index.json     built_at + per-exchange market list: one row per spot market
+  <exchange>.json  raw ccxt markets/currencies, fed to exchange.set_markets()
+
+A cold process loads the snapshot, so it needs no network either to resolve
+symbols or to initialise its ccxt instances. Snapshots older than
+SYMBOL_INDEX_TTL are still served while a background thread rebuilds them.
+
+Every spot market is indexed under these aliases (uppercased):
+
+  BTC/USDT   ccxt symbol
+  BTCUSDT    compact
+  BTC-USDT, BTC_USDT
+  XBTUSDT    exchange-native id (only where it doesn't shadow another alias)
+
+Aliases are exact, so 'BTCUSD' resolves to BTC/USD and 'BTCUSDT' to
+BTC/USDT. When a pair is listed on several exchanges, the exchange that
+comes first in the candidate order wins. resolve() falls back to the same
+base against the other USD stablecoins only when there is no exact match.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+SYMBOL_INDEX_DIR = os.environ.get('SYMBOL_INDEX_DIR', os.path.join(tempfile.gettempdir(), 'prismtrade_markets'))
+SYMBOL_INDEX_TTL = float(os.environ.get('SYMBOL_INDEX_TTL', 6 * 3600))   # seconds
+RETRY_SECONDS = 60           # minimum gap between background rebuild attempts
+USD_QUOTES = ('USDT', 'USD', 'USDC')
+
+Market = namedtuple('Market', ['exchange', 'symbol', 'id', 'base', 'quote', 'precision', 'limits'])
+# One published build. Never mutated after _index() swaps it in, so a reader that takes
+# self._snapshot once sees markets and aliases from the same build.
+Snapshot = namedtuple('Snapshot', ['built_at', 'exchanges', 'markets', 'aliases'])
+
+
+def _split(key: str):
+    for sep in '/-_':
+        if sep in key:
+            base, _, quote = key.partition(sep)
+            return base, quote.split(':')[0]
+    for quote in sorted(USD_QUOTES, key=len, reverse=True):
+        if key.endswith(quote) and len(key) > len(quote):
+            return key[:-len(quote)], quote
+    return None, None
+
+
+def _write_json(path: str, data):
+    tmp = f'{path}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f, default=str)
+    os.replace(tmp, path)
+
+
+class SymbolIndex:
+    def __init__(self, directory: str = SYMBOL_INDEX_DIR, ttl: float = SYMBOL_INDEX_TTL):
+        self.directory = directory
+        self.ttl = ttl
+        self._snapshot = Snapshot(0.0, [], {}, {})
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._loaded = False
+        self._retry_at = 0.0
+
+    # ---- lookup ----------------------------------------------------------
+
+    @property
+    def built_at(self) -> float:
+        return self._snapshot.built_at
+
+    @property
+    def exchanges(self) -> list:
+        """Candidate order at build time."""
+        return self._snapshot.exchanges
+
+    @property
+    def markets(self) -> dict:
+        """(exchange, ccxt symbol) -> Market"""
+        return self._snapshot.markets
+
+    @property
+    def aliases(self) -> dict:
+        """alias -> {exchange: ccxt symbol}, best exchange first"""
+        return self._snapshot.aliases
+
+    def resolve(self, symbol: str, exchange: str = None, fallback: bool = True):
+        """Market for `symbol` (on `exchange`, if given), or None."""
+        snap = self._snapshot
+        key = symbol.strip().upper()
+        listings = snap.aliases.get(key)
+        if listings is None and fallback:
+            base, quote = _split(key)
+            if quote in USD_QUOTES:
+                for alt in USD_QUOTES:
+                    listings = snap.aliases.get(f'{base}{alt}')
+                    if listings and (exchange is None or exchange in listings):
+                        break
+        if not listings:
+            return None
+        if exchange is not None:
+            sym = listings.get(exchange)
+            return snap.markets[(exchange, sym)] if sym else None
+        exid, sym = next(iter(listings.items()))
+        return snap.markets[(exid, sym)]
+
+    def counts(self) -> dict:
+        snap = self._snapshot
+        counts = dict.fromkeys(snap.exchanges, 0)
+        for exid, _ in snap.markets:
+            counts[exid] = counts.get(exid, 0) + 1
+        return counts
+
+    @property
+    def stale(self) -> bool:
+        return time.time() - self.built_at > self.ttl
+
+    # ---- building --------------------------------------------------------
+
+    def _index(self, exchanges: list, markets: dict, built_at: float):
+        aliases = {}
+        ordered = sorted(markets.values(), key=lambda m: exchanges.index(m.exchange))
+        for m in ordered:
+            base, quote = m.base.upper(), m.quote.upper()
+            for alias in {m.symbol.upper(), f'{base}{quote}', f'{base}/{quote}', f'{base}-{quote}', f'{base}_{quote}'}:
+                aliases.setdefault(alias, {}).setdefault(m.exchange, m.symbol)
+        # Native ids second, so they can never shadow a canonical alias of another pair.
+        for m in ordered:
+            native = str(m.id).upper() if m.id else None
+            if native and (native not in aliases or m.exchange not in aliases[native]):
+                aliases.setdefault(native, {}).setdefault(m.exchange, m.symbol)
+        self._snapshot = Snapshot(built_at, exchanges, markets, aliases)
+
+    def build(self, exchanges: list, raw: dict):
+        """Index raw ccxt markets ({exchange: markets dict}); exchanges in priority order."""
+        markets = {}
+        for exid in exchanges:
+            for m in (raw.get(exid) or {}).values():
+                if m.get('spot') is False or m.get('active') is False or not m.get('base') or not m.get('quote'):
+                    continue
+                markets[(exid, m['symbol'])] = Market(exid, m['symbol'], m.get('id'), m['base'], m['quote'],
+                                                      m.get('precision') or {}, m.get('limits') or {})
+        self._index(list(exchanges), markets, time.time())
+
+    def refresh(self, loader, exchanges: list):
+        """Re-fetch every exchange in parallel with loader(exchange) -> (markets, currencies) and save.
+
+        An exchange that fails keeps its previous snapshot, so one outage doesn't empty the index.
+        """
+        def fetch(exid):
+            try:
+                return loader(exid)
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max(1, len(exchanges))) as pool:
+            fetched = dict(zip(exchanges, pool.map(fetch, exchanges)))
+        if all(result is None for result in fetched.values()):
+            return fetched     # nothing reachable: keep serving what we have, retry later
+        raw = {}
+        os.makedirs(self.directory, exist_ok=True)
+        for exid, result in fetched.items():
+            if result is not None:
+                markets, currencies = result
+                _write_json(self._path(exid), {'markets': markets, 'currencies': currencies})
+                raw[exid] = markets
+            else:
+                snap = self.snapshot(exid)
+                if snap:
+                    raw[exid] = snap[0]
+        self.build(exchanges, raw)
+        snap = self._snapshot
+        _write_json(self._path('index'), {
+            'built_at': snap.built_at,
+            'exchanges': snap.exchanges,
+            'markets': [list(m) for m in snap.markets.values()],
+        })
+        return fetched
+
+    # ---- persistence -----------------------------------------------------
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f'{name}.json')
+
+    def load(self) -> bool:
+        """Load index.json. False if there is none (or it is unreadable)."""
+        try:
+            with open(self._path('index')) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        markets = {(row[0], row[1]): Market(*row) for row in data['markets']}
+        self._index(data['exchanges'], markets, data['built_at'])
+        return True
+
+    def snapshot(self, exchange: str):
+        """(markets, currencies) saved for `exchange`, or None."""
+        try:
+            with open(self._path(exchange)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return data['markets'], data.get('currencies')
+
+    def ensure(self, loader=None, exchanges: list = None, block: bool = False):
+        """Load from disk on first use; build synchronously if there is nothing on disk and a
+        loader is given; rebuild a snapshot past its TTL in the background (or now, if `block`)."""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._loaded = self.load()
+                    if not self._loaded and loader is not None:
+                        self.refresh(loader, exchanges)
+                        self._loaded = True
+        if loader is not None and self.stale and not self._refreshing and time.time() >= self._retry_at:
+            if block:
+                self.refresh(loader, exchanges)
+            else:
+                self.refresh_async(loader, exchanges)
+        return self
+
+    def refresh_async(self, loader, exchanges: list):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+            self._retry_at = time.time() + RETRY_SECONDS
+
+        def run():
+            try:
+                # Another process may have refreshed the snapshot already.
+                if os.path.exists(self._path('index')) and \
+                        time.time() - os.path.getmtime(self._path('index')) < self.ttl and self.load():
+                    return
+                self.refresh(loader, exchanges)
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=run, name='symbol-index-refresh', daemon=True).start()
+
+
+# Process-wide index used by market_proxy, market_server and TradingEngine.
+shared = SymbolIndex()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from backtesting import bracket_exits, first_touch
+
+
+def _ohlc(n=3000, seed=5):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open_ = np.concatenate(([close[0]], close[:-1])) * np.exp(rng.normal(0, 0.002, n))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.005, n)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.005, n)))
+    return open_, high, low, close
+
+
+def _naive_first_touch(values, starts, ends, levels, above=False):
+    out = []
+    for lo, hi, level in zip(starts, ends, levels):
+        k = next((k for k in range(lo, min(hi, len(values)))
+                  if (values[k] >= level if above else values[k] <= level)), -1)
+        out.append(k)
+    return np.array(out)
+
+
+@pytest.mark.parametrize('above', [False, True])
+def test_first_touch_matches_a_naive_loop(above):
+    _, high, low, _ = _ohlc()
+    values = high if above else low
+    rng = np.random.default_rng(1)
+    starts = rng.integers(0, len(values), 2000)
+    ends = starts + rng.integers(0, 1500, 2000)           # some run past the end, some are empty
+    levels = values[starts] * (1 + rng.normal(0, 0.05, 2000))
+    levels[::17] = np.nan
+    np.testing.assert_array_equal(first_touch(values, starts, ends, levels, above=above),
+                                  _naive_first_touch(values, starts, ends, levels, above=above))
+
+
+def _naive_bracket(open_, high, low, entry, start, end, stop, targets):
+    for k in range(start, end):
+        if not np.isnan(stop) and low[k] <= stop:
+            return k, stop if k == entry else min(open_[k], stop), 'stop_loss'
+        for first_offset, end_offset, level in targets:
+            if entry + first_offset <= k < entry + end_offset and high[k] >= level:
+                return k, level if k == entry else max(open_[k], level), 'take_profit'
+    return -1, np.nan, None
+
+
+def test_bracket_exits_match_a_naive_loop():
+    open_, high, low, close = _ohlc()
+    rng = np.random.default_rng(2)
+    entries = np.sort(rng.choice(len(close) - 1, 300, replace=False))
+    starts, ends = entries + 1, np.minimum(entries + rng.integers(1, 400, len(entries)), len(close))
+    stops = close[entries] * 0.97
+    stops[::11] = np.nan
+    # A stepped target: 5% for the first 50 bars after entry, 2% after that.
+    targets = [(0, 50, close[entries] * 1.05), (50, len(close), close[entries] * 1.02)]
+    bars, prices, reasons = bracket_exits(open_, high, low, entries, starts, ends, stops, targets)
+    for i, entry in enumerate(entries):
+        expected = _naive_bracket(open_, high, low, entry, starts[i], ends[i], stops[i],
+                                  [(a, b, level[i]) for a, b, level in targets])
+        assert (bars[i], reasons[i]) == (expected[0], expected[2])
+        if expected[0] >= 0:
+            assert prices[i] == pytest.approx(expected[1])
+
+
+def test_a_bar_touching_both_levels_is_a_stop():
+    open_ = np.array([100.0, 100.0])
+    high = np.array([100.0, 120.0])
+    low = np.array([100.0, 80.0])
+    bars, prices, reasons = bracket_exits(open_, high, low, [0], [1], [2], [90.0], [(0, 2, np.array([110.0]))])
+    assert (bars[0], prices[0], reasons[0]) == (1, 90.0, 'stop_loss')
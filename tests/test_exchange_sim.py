@@ -0,0 +1,62 @@
+import ccxt
+import pytest
+
+from exchange_sim import DEFAULTS, Venue, _walk
+
+KEY = 'test-key'
+
+
+def _venue(**config) -> Venue:
+    return Venue('binance', dict(DEFAULTS, start=1_700_000_000_000, speed=0.0, **config))
+
+
+def _naive_walk(levels, amount):
+    remaining, cost = amount, 0.0
+    for price, size in levels:
+        if remaining <= 0:
+            break
+        take = min(remaining, size)
+        cost, remaining = cost + take * price, remaining - take
+    return (cost + remaining * levels[-1][0]) / amount
+
+
+def test_walk_matches_a_naive_loop():
+    levels = [[100.0, 1.0], [101.0, 2.0], [102.0, 0.5]]
+    for amount in (0.5, 1.0, 2.5, 3.5, 10.0):
+        assert _walk(levels, amount) == pytest.approx(_naive_walk(levels, amount))
+
+
+def test_prices_are_deterministic_across_venues():
+    a, b = _venue(), _venue()
+    assert a.ohlcv('BTC/USDT', '1m', limit=10) == b.ohlcv('BTC/USDT', '1m', limit=10)
+
+
+def test_a_market_buy_through_the_book_never_overdraws():
+    venue = _venue()
+    book = venue.order_book('BTC/USDT')
+    depth = sum(size for _, size in book['asks'])
+    fee = DEFAULTS['fee']
+    # Just affordable at the top ask, but walking the book costs more.
+    amount = min(depth * 0.9, DEFAULTS['balance_usd'] / (book['asks'][0][0] * (1 + fee)))
+    walked = _walk(book['asks'], amount) * amount * (1 + fee)
+    if walked > DEFAULTS['balance_usd']:
+        with pytest.raises(ccxt.InsufficientFunds):
+            venue.create_order(KEY, 'BTC/USDT', 'market', 'buy', amount)
+        amount *= DEFAULTS['balance_usd'] / walked
+    order = venue.create_order(KEY, 'BTC/USDT', 'market', 'buy', amount)
+    balance = venue.balance(KEY)
+    assert order['status'] == 'closed'
+    assert balance['free']['USDT'] >= 0 and balance['used']['USDT'] == pytest.approx(0, abs=1e-6)
+    assert balance['total']['USDT'] == pytest.approx(DEFAULTS['balance_usd'] - order['cost'] - order['fee']['cost'])
+    assert balance['total']['BTC'] == pytest.approx(amount)
+
+
+def test_a_resting_limit_order_releases_its_reservation_on_cancel():
+    venue = _venue()
+    order = venue.create_order(KEY, 'BTC/USDT', 'limit', 'buy', 0.1, 1000.0)
+    assert order['status'] == 'open'
+    assert venue.balance(KEY)['used']['USDT'] == pytest.approx(0.1 * 1000.0 * (1 + DEFAULTS['fee']))
+    venue.cancel_order(KEY, order['id'])
+    balance = venue.balance(KEY)
+    assert balance['free']['USDT'] == pytest.approx(DEFAULTS['balance_usd']) and balance['used']['USDT'] == 0
+
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import IndicatorRegistry, ema, rsi, sma, spec
+
+KEY = ('binance', 'BTC/USDT', '1m')
+
+
+def _frame(close) -> pd.DataFrame:
+    close = np.asarray(close, dtype=float)
+    return pd.DataFrame({'timestamp': np.arange(len(close)) * 60_000.0, 'open': close, 'high': close,
+                         'low': close, 'close': close, 'volume': np.ones(len(close))})
+
+
+def _naive_sma(values, period):
+    return [np.nan if i + 1 < period else sum(values[i + 1 - period:i + 1]) / period for i in range(len(values))]
+
+
+def _naive_ema(values, period):
+    out, prev = [], None
+    for i in range(len(values)):
+        if i + 1 < period:
+            out.append(np.nan)
+            continue
+        prev = sum(values[:period]) / period if prev is None else prev + (values[i] - prev) * 2 / (period + 1)
+        out.append(prev)
+    return out
+
+
+def _naive_rsi(values, period):
+    out = [np.nan] * len(values)
+    moves = [b - a for a, b in zip(values, values[1:])]
+    if len(moves) < period:
+        return out
+    gain = sum(max(m, 0) for m in moves[:period]) / period
+    loss = sum(max(-m, 0) for m in moves[:period]) / period
+    for i in range(period, len(values)):
+        if i > period:
+            m = moves[i - 1]
+            gain = (gain * (period - 1) + max(m, 0)) / period
+            loss = (loss * (period - 1) + max(-m, 0)) / period
+        out[i] = 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+    return out
+
+
+@pytest.mark.parametrize('fn, naive, period', [(sma, _naive_sma, 5), (ema, _naive_ema, 5), (rsi, _naive_rsi, 14)])
+def test_indicators_match_a_naive_loop(fn, naive, period):
+    values = list(100 + np.cumsum(np.random.default_rng(1).normal(size=200)))
+    np.testing.assert_allclose(fn(np.array(values), period), naive(values, period), rtol=1e-9)
+
+
+def test_registry_computes_each_spec_once_per_bar():
+    registry = IndicatorRegistry()
+    df = _frame(np.arange(1, 51))
+    first = registry.compute(KEY, df, [spec('sma', period=3)])
+    again = registry.compute(KEY, df, [spec('sma', period=3)])
+    assert registry.computed == 1
+    assert again[spec('sma', period=3)] is first[spec('sma', period=3)]
+
+
+def test_registry_recomputes_when_the_forming_bar_changes():
+    registry = IndicatorRegistry()
+    df = _frame([10, 20, 30, 40])
+    assert registry.compute(KEY, df, [spec('sma', period=3)])[spec('sma', period=3)][-1] == pytest.approx(30.0)
+    df.loc[df.index[-1], ['high', 'close']] = 1000.0       # same bar, new last trade
+    assert registry.compute(KEY, df, [spec('sma', period=3)])[spec('sma', period=3)][-1] == pytest.approx(350.0)
+
+
+def test_registry_keeps_series_apart_and_evicts_least_recently_used():
+    registry = IndicatorRegistry(max_series=2)
+    s = spec('sma', period=2)
+    a = registry.compute(('binance',) + KEY[1:], _frame([1, 2, 3]), [s])[s]
+    b = registry.compute(('kraken',) + KEY[1:], _frame([5, 6, 7]), [s])[s]
+    assert a[-1] == 2.5 and b[-1] == 6.5
+    registry.compute(('binance',) + KEY[1:], _frame([1, 2, 3]), [s])
+    registry.compute(('coinbase',) + KEY[1:], _frame([1, 2, 3]), [s])
+    assert list(registry._series) == [('binance',) + KEY[1:], ('coinbase',) + KEY[1:]]
@@ -0,0 +1,59 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from monte_carlo import run_monte_carlo, simulate_returns, simulate_trades
+
+
+def _naive_paths(pnls, initial_capital, n_sims, seed):
+    """One path at a time, with the same draws as the bootstrap, stopping at ruin."""
+    draws = np.random.default_rng(seed).integers(0, len(pnls), size=(n_sims, len(pnls)))
+    finals, drawdowns = [], []
+    for row in draws:
+        equity, peak, worst = initial_capital, initial_capital, 0.0
+        for i in row:
+            equity = max(equity + pnls[i], 0.0) if equity > 0 else 0.0
+            peak = max(peak, equity)
+            worst = min(worst, (equity - peak) / peak * 100)
+        finals.append(equity)
+        drawdowns.append(worst)
+    return np.array(finals), np.array(drawdowns)
+
+
+@pytest.mark.parametrize('pnls', [[120.0, -80.0, 40.0, -30.0, 15.0], [-20000.0, 100.0]])
+def test_bootstrap_matches_a_naive_loop(pnls):
+    result = simulate_trades(pnls, 10000, n_sims=500, method='bootstrap', seed=7)
+    finals, drawdowns = _naive_paths(pnls, 10000, 500, seed=7)
+    assert result['final_capital']['mean'] == pytest.approx(finals.mean())
+    assert result['max_drawdown_pct']['mean'] == pytest.approx(drawdowns.mean())
+    assert result['probability_of_ruin'] == pytest.approx((finals <= 0).mean())
+
+
+def test_ruin_is_absorbing():
+    result = simulate_trades([-20000.0, 100.0], 10000, n_sims=2000, method='bootstrap', seed=1)
+    assert result['max_drawdown_pct']['percentiles']['p5'] >= -100.0
+    assert result['final_capital']['percentiles']['p5'] == 0.0
+    assert 0 < result['probability_of_ruin'] < 1
+    assert np.isfinite(result['sharpe_ratio']['mean'])
+
+
+def test_shuffle_keeps_the_final_capital():
+    result = simulate_trades([100.0, -50.0, 25.0], 10000, n_sims=100, method='shuffle', seed=2)
+    assert result['final_capital']['std'] == pytest.approx(0.0)
+    assert result['final_capital']['mean'] == pytest.approx(10075.0)
+    assert result['probability_of_ruin'] == 0.0
+
+
+def test_block_bootstrap_of_a_flat_curve_is_flat():
+    result = simulate_returns([10000.0] * 50, n_sims=100, seed=3)
+    assert result['final_capital']['mean'] == pytest.approx(10000.0)
+    assert result['max_drawdown_pct']['mean'] == 0.0
+
+
+def test_a_backtest_without_trades_skips_the_trade_analyses():
+    engine = SimpleNamespace(closed_trades=[], initial_capital=10000.0, equity_curve=[10000.0, 10010.0, 10005.0])
+    result = run_monte_carlo(engine, n_sims=100, seed=4)
+    assert set(result) == {'return_bootstrap'}
+    with pytest.raises(ValueError):
+        simulate_trades([], 10000)
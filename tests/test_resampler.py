@@ -0,0 +1,75 @@
+import numpy as np
+import pytest
+
+import resampler
+from resampler import Fetch, SymbolBars, resample, timeframe_ms
+
+T0 = 1_700_006_400_000      # a 1d boundary
+
+
+def _minutes(n, seed=0, skip=()):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, n))
+    rows = []
+    for i, c in enumerate(close):
+        if i in skip:
+            continue
+        o = close[i - 1] if i else c
+        rows.append([T0 + i * 60_000, o, max(o, c) + 0.05, min(o, c) - 0.05, c, float(rng.integers(1, 10))])
+    return rows
+
+
+def _naive_resample(rows, timeframe):
+    step, offset = timeframe_ms(timeframe)
+    buckets = {}
+    for ms, o, h, l, c, v in rows:
+        start = (int(ms) - offset) // step * step + offset
+        if start not in buckets:
+            buckets[start] = [start, o, h, l, c, v]
+        else:
+            b = buckets[start]
+            b[2], b[3], b[4], b[5] = max(b[2], h), min(b[3], l), c, b[5] + v
+    return [buckets[k] for k in sorted(buckets)]
+
+
+@pytest.mark.parametrize('timeframe', ['5m', '15m', '1h', '7m', '1d', '1w'])
+def test_resample_matches_a_naive_loop(timeframe):
+    rows = _minutes(20_000, skip=set(range(300, 420)) | {5000, 5001})
+    np.testing.assert_allclose(resample(rows, timeframe), _naive_resample(rows, timeframe))
+
+
+def test_incremental_updates_match_a_full_resample():
+    rows = _minutes(600, seed=1)
+    series = SymbolBars('BTC/USDT')
+    series.update(rows[:100])
+    series.frame('15m')
+    for i in range(100, len(rows)):
+        forming = list(rows[i])
+        # The forming 1m bar is seen twice: first part-way, then closed.
+        series.update([[forming[0], forming[1], forming[1], forming[1], forming[1], 0.5]])
+        series.update([forming])
+    assert series.select('15m', 1000) == [[int(b[0])] + b[1:] for b in _naive_resample(rows, '15m')]
+
+
+def test_a_poll_that_skips_ahead_reseeds_instead_of_bridging_the_gap():
+    rows = _minutes(200, seed=2)
+    series = SymbolBars('BTC/USDT')
+    series.apply(Fetch('base', '1m', 1000, None), rows[:50])
+    series.frame('5m')
+    series.apply(Fetch('base', '1m', 1000, int(rows[49][0])), rows[120:])
+    assert series.base[0][0] == rows[120][0]
+    assert series.select('5m', 1000)[0][0] >= rows[120][0]
+
+
+def test_an_idle_symbol_asks_for_the_latest_window():
+    series = SymbolBars('BTC/USDT')
+    series.apply(Fetch('base', '1m', 1000, None), _minutes(10))
+    series.polled_at = T0 / 1000 + 10 * 60
+    now = series.polled_at + 60
+    assert series.next_fetch('1m', 10, now=now).since == int(series.base[-1][0])
+    idle = now + resampler.BASE_FETCH * 60
+    assert series.next_fetch('1m', 10, now=idle).since is None
+
+
+def test_unbuildable_timeframes():
+    assert resampler.buildable('15m') and not resampler.buildable('1M') and not resampler.buildable('0m')
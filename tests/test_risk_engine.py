@@ -0,0 +1,97 @@
+import os
+import time
+
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+
+import pytest
+
+import risk_engine
+import trading_engine
+from models import TradingMode
+from risk_engine import Book, RiskEngine, RiskRejected
+
+USER_ID = 1
+
+
+def _engine(balance=0.0, risk_per_trade=2.0, max_open_trades=5) -> RiskEngine:
+    """A RiskEngine whose LIVE book is already loaded, so no DB is needed."""
+    engine = RiskEngine(resync_seconds=3600)
+    book = Book()
+    book.max_open_trades, book.risk_per_trade, book.balance = max_open_trades, risk_per_trade, balance
+    book.synced_at = time.monotonic()
+    engine._books[(USER_ID, TradingMode.LIVE)] = book
+    return engine
+
+
+class FakeConnector:
+    def __init__(self, last=100.0, quote_balance=1000.0):
+        self.exchange = object()
+        self.last = last
+        self.quote_balance = quote_balance
+        self.orders = []
+
+    def connect(self):
+        return self.exchange
+
+    def get_ticker(self, symbol):
+        return {'last': self.last}
+
+    def get_balance(self):
+        return {'total': {'USDT': self.quote_balance}, 'free': {'USDT': self.quote_balance}}
+
+    def create_market_buy(self, symbol, amount):
+        self.orders.append((symbol, amount))
+        return {'id': 'x1', 'status': 'closed'}
+
+
+def test_live_check_uses_the_given_balance():
+    engine = _engine()
+    # $1,000 * 10% default stop = $100 at risk; 2% of $1,000 is $20.
+    with pytest.raises(RiskRejected) as e:
+        engine.check(USER_ID, TradingMode.LIVE, 'BTC/USDT', 10, 100.0, balance=1000.0)
+    assert e.value.rule == 'risk_per_trade'
+    engine.check(USER_ID, TradingMode.LIVE, 'BTC/USDT', 1, 100.0, balance=1000.0)
+
+
+def test_live_check_without_a_balance_is_rejected():
+    engine = _engine()
+    with pytest.raises(RiskRejected) as e:
+        engine.check(USER_ID, TradingMode.LIVE, 'BTC/USDT', 1, 100.0)
+    assert e.value.rule == 'balance'
+    engine.check(USER_ID, TradingMode.LIVE, 'BTC/USDT', 1)      # unpriced: count rules only
+
+
+def test_live_buy_over_risk_per_trade_is_rejected(monkeypatch):
+    monkeypatch.setattr(risk_engine, 'shared', _engine())
+    engine = trading_engine.TradingEngine(USER_ID, 'binance')
+    engine.connector = FakeConnector(last=100.0, quote_balance=1000.0)
+    with pytest.raises(RiskRejected) as e:
+        engine.execute_buy('BTC/USDT', 10, mode='live')
+    assert e.value.rule == 'risk_per_trade'
+    assert engine.connector.orders == []
+
+
+def test_live_balance_is_cached_per_user():
+    engine = _engine()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return 500.0
+
+    assert engine.live_balance(USER_ID, 'binance', 'USDT', fetch) == 500.0
+    assert engine.live_balance(USER_ID, 'binance', 'USDT', fetch) == 500.0
+    assert len(calls) == 1
+    engine.on_open(USER_ID, TradingMode.LIVE, 7, 'BTC/USDT', 'buy', 100.0)
+    engine.live_balance(USER_ID, 'binance', 'USDT', fetch)
+    assert len(calls) == 2
+
+
+def test_basket_legs_in_one_symbol_share_the_exposure_cap(monkeypatch):
+    monkeypatch.setattr(risk_engine, 'MAX_SYMBOL_EXPOSURE_PCT', 50.0)
+    engine = _engine(risk_per_trade=None)
+    engine.check_basket(USER_ID, TradingMode.LIVE, [('BTC/USDT', 4, 100.0, None)], balances={'BTC/USDT': 1000.0})
+    with pytest.raises(RiskRejected) as e:
+        engine.check_basket(USER_ID, TradingMode.LIVE, [('BTC/USDT', 4, 100.0, None), ('BTC/USDT', 4, 100.0, None)],
+                            balances={'BTC/USDT': 1000.0})
+    assert e.value.rule == 'symbol_exposure'
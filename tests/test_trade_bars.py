@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+import pytest
+
+from trade_bars import BarBuilder, TradeTape, parse_interval
+
+T0 = 1_700_000_000_000
+
+
+def _trades(n=3000, seed=0):
+    rng = np.random.default_rng(seed)
+    ms = T0 + np.cumsum(rng.integers(0, 700, n))
+    price = 100 + np.cumsum(rng.normal(0, 0.05, n))
+    amount = rng.uniform(0.01, 2.0, n)
+    return np.column_stack([ms, price, amount])
+
+
+def _naive_bars(trades, interval):
+    """One trade at a time: a new bar whenever the bucket id changes."""
+    kind, size = parse_interval(interval)
+    bars, current, total = [], None, 0.0
+    for ms, price, amount in trades:
+        if kind == 'time':
+            bar_id = int(ms) // int(size)
+        else:
+            bar_id = math.floor(total / size)
+            total += {'tick': 1.0, 'vol': amount, 'dollar': price * amount}[kind]
+        if bar_id != current:
+            start = bar_id * size if kind == 'time' else ms
+            bars.append([start, price, price, price, price, amount])
+            current = bar_id
+        else:
+            bar = bars[-1]
+            bar[2], bar[3], bar[4], bar[5] = max(bar[2], price), min(bar[3], price), price, bar[5] + amount
+    return bars
+
+
+@pytest.mark.parametrize('interval', ['5s', '1m', 'tick:50', 'vol:20', 'dollar:2500'])
+def test_batched_bars_match_a_naive_loop(interval):
+    trades = _trades()
+    builder = BarBuilder(interval)
+    cuts = np.sort(np.random.default_rng(1).choice(np.arange(1, len(trades)), 40, replace=False))
+    for batch in np.split(trades, cuts):
+        builder.add(batch)
+    got = builder.select(limit=10_000)
+    expected = _naive_bars(trades, interval)
+    assert [row[0] for row in got] == [int(row[0]) for row in expected]
+    np.testing.assert_allclose([row[1:] for row in got], [row[1:] for row in expected])
+
+
+def _dicts(rows, with_ids=True):
+    return [{'id': str(i) if with_ids else None, 'timestamp': int(ms), 'price': p, 'amount': a}
+            for i, (ms, p, a) in enumerate(rows)]
+
+
+def test_overlapping_polls_are_deduplicated():
+    rows = _trades(200)
+    for with_ids in (True, False):
+        tape = TradeTape('BTC/USDT')
+        tape.builder('tick:10')
+        trades = _dicts(rows, with_ids)
+        tape.ingest(trades[:120])
+        tape.ingest(trades[100:], since=tape.cursor())      # overlaps the first poll
+        assert len(tape.trades) == len(rows)
+        assert sum(bar[5] for bar in tape.select('tick:10', 1000)) == pytest.approx(rows[:, 2].sum())
+
+
+def test_a_poll_that_misses_trades_restarts_the_tape():
+    rows = _trades(200)
+    trades = _dicts(rows)
+    tape = TradeTape('BTC/USDT')
+    tape.builder('tick:10')
+    tape.ingest(trades[:50])
+    tape.ingest(trades[150:], since=tape.cursor())     # trades 50..149 never arrived
+    assert len(tape.trades) == 50
+    assert tape.select('tick:10', 1000)[0][0] == int(rows[150, 0])
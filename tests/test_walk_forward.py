@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import indicators
+import walk_forward
+from backtesting import run_signal_backtest, simple_ma_crossover_strategy
+
+
+def _candles(n=1200, seed=3) -> pd.DataFrame:
+    close = 100 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0, 0.01, n)))
+    return pd.DataFrame({'timestamp': pd.date_range('2024-01-01', periods=n, freq='h'), 'open': close,
+                         'high': close * 1.002, 'low': close * 0.998, 'close': close, 'volume': 1.0})
+
+
+def _run(df, **kwargs):
+    walk_forward.clear_cache()
+    return walk_forward.walk_forward(df, [5, 10], [20, 40], train_bars=400, test_bars=200, workers=1, **kwargs)
+
+
+def _naive_stitch(folds, initial_capital=10000):
+    """Compound each bar's return once, taking a bar from the first fold that has it."""
+    level, seen, out = initial_capital, None, []
+    for f in folds:
+        prev = initial_capital
+        for t, v in zip(f['test_timestamps'], f['test_equity']):
+            if seen is None or t > seen:
+                level *= v / prev
+                out.append(level)
+                seen = t
+            prev = v
+    return out
+
+
+def test_each_fold_picks_the_best_train_parameters():
+    df = _candles()
+    result = _run(df)
+    for fold in result['folds']:
+        train = df.iloc[fold['train_start']:fold['train_end']].reset_index(drop=True)
+        scores = {}
+        for fast, slow in [(5, 20), (5, 40), (10, 20), (10, 40)]:
+            engine = run_signal_backtest(simple_ma_crossover_strategy(train, fast, slow), 10000, 0.001, 10)
+            scores[(fast, slow)] = engine.get_stats()['total_return_pct']
+        best = max(scores.values())
+        params = fold['params']
+        assert scores[(params['fast_period'], params['slow_period'])] == pytest.approx(best)
+    assert not indicators.shared._series        # folds use their own registry
+
+
+@pytest.mark.parametrize('step', [200, 100])
+def test_stitched_curve_counts_each_bar_once(step):
+    result = _run(_candles(), step=step)
+    expected = _naive_stitch(result['folds'])
+    np.testing.assert_allclose(result['oos_equity'], expected, rtol=1e-9)
+    assert len(result['oos_timestamps']) == len(set(result['oos_timestamps'])) == len(expected)
+    assert result['oos_return_pct'] == pytest.approx((expected[-1] - 10000) / 10000 * 100)
+
+
+def test_unchanged_folds_are_reused():
+    df = _candles()
+    walk_forward.clear_cache()
+    walk_forward.walk_forward(df.iloc[:1000], [5], [20], 400, 200, workers=1)
+    result = walk_forward.walk_forward(df, [5], [20], 400, 200, workers=1)
+    assert result['reused_folds'] == 3
@@ -0,0 +1,217 @@
+"""Request-scoped span tracing without an external APM.
+
+Every request gets a request id (X-Request-ID, taken from the client if it is
+up to 64 of [A-Za-z0-9-], else generated) and a root span. Code opens nested spans with
+
+    with tracing.span('trading.execute_buy', symbol=symbol):
+        ...
+
+Outside a request (scripts, backtests) span() does nothing.
+
+Spans are collected for every request because it's only a few objects. The
+decision to keep a trace is made when the request finishes: every trace
+slower than TRACE_SLOW_MS is kept, and other traces are kept with
+probability TRACE_SAMPLE_RATE. Kept traces go to an in-process ring buffer
+and are appended as JSON lines to TRACE_FILE, so the viewer endpoint sees
+traces from every gunicorn worker.
+"""
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+TRACE_SAMPLE_RATE = float(os.environ.get('TRACE_SAMPLE_RATE', 0.01))
+TRACE_SLOW_MS = float(os.environ.get('TRACE_SLOW_MS', 1000))
+TRACE_BUFFER_SIZE = 200
+TRACE_FILE = os.environ.get('TRACE_FILE', os.path.join(tempfile.gettempdir(), 'prismtrade_traces.jsonl'))
+TRACE_FILE_MAX_BYTES = 20 * 1024 * 1024   # rotated to TRACE_FILE + '.1' past this size
+_REQUEST_ID = re.compile(r'[A-Za-z0-9-]{1,64}')     # what a client-supplied X-Request-ID may be
+
+_current = contextvars.ContextVar('prismtrade_trace', default=None)
+_recent = deque(maxlen=TRACE_BUFFER_SIZE)
+_file_lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('name', 'tags', 'start', 'end', 'error', 'children')
+
+    def __init__(self, name: str, tags: dict):
+        self.name = name
+        self.tags = tags
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+        self.children = []
+
+    def to_dict(self, origin: float) -> dict:
+        end = self.end if self.end is not None else time.perf_counter()
+        d = {
+            'name': self.name,
+            'start_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round((end - self.start) * 1000, 3),
+        }
+        if self.tags:
+            d['tags'] = self.tags
+        if self.error:
+            d['error'] = self.error
+        if self.children:
+            d['children'] = [c.to_dict(origin) for c in self.children]
+        return d
+
+
+class Trace:
+    __slots__ = ('request_id', 'root', 'stack', 'started_at')
+
+    def __init__(self, request_id: str, name: str, tags: dict):
+        self.request_id = request_id
+        self.root = Span(name, tags)
+        self.stack = [self.root]
+        self.started_at = time.time()
+
+
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **tags):
+    """Nested span under the current request; a no-op outside one."""
+    trace = _current.get()
+    if trace is None:
+        yield None
+        return
+    s = Span(name, tags)
+    trace.stack[-1].children.append(s)
+    trace.stack.append(s)
+    try:
+        yield s
+    except Exception as e:
+        s.error = f'{type(e).__name__}: {e}'
+        raise
+    finally:
+        s.end = time.perf_counter()
+        trace.stack.pop()
+
+
+def traced(name: str):
+    """Decorator form of span() for whole functions."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def start_trace(name: str, request_id: str = None, **tags):
+    """Begin a trace in this context. Returns a token for finish_trace().
+
+    A request_id that is not a short [A-Za-z0-9-] string is replaced by a generated one.
+    """
+    if not request_id or not _REQUEST_ID.fullmatch(request_id):
+        request_id = uuid.uuid4().hex[:16]
+    trace = Trace(request_id, name, tags)
+    return _current.set(trace)
+
+
+def finish_trace(token, **tags):
+    """End the current trace; returns its dict if it was kept (slow or sampled), else None."""
+    trace = _current.get()
+    try:
+        _current.reset(token)
+    except ValueError:
+        _current.set(None)    # finished from a different context than it started in
+    if trace is None:
+        return None
+    root = trace.root
+    root.end = time.perf_counter()
+    root.tags.update(tags)
+    duration_ms = (root.end - root.start) * 1000
+    slow = duration_ms >= TRACE_SLOW_MS
+    if not slow and random.random() >= TRACE_SAMPLE_RATE:
+        return None
+    record = {
+        'request_id': trace.request_id,
+        'timestamp': trace.started_at,
+        'duration_ms': round(duration_ms, 3),
+        'slow': slow,
+        'pid': os.getpid(),
+        'root': root.to_dict(root.start),
+    }
+    _recent.append(record)
+    if TRACE_FILE:
+        _write(record)
+    return record
+
+
+def _write(record: dict):
+    line = json.dumps(record, default=str) + '\n'
+    with _file_lock:
+        try:
+            if os.path.exists(TRACE_FILE) and os.path.getsize(TRACE_FILE) > TRACE_FILE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + '.1')
+            # O_APPEND writes of one line are atomic enough across workers for a debug log.
+            with open(TRACE_FILE, 'a') as f:
+                f.write(line)
+        except OSError:
+            pass
+
+
+def recent_traces(limit: int = 50, slow_only: bool = False) -> list:
+    """Newest-first kept traces from TRACE_FILE (all workers) or this worker's ring buffer."""
+    records = []
+    if TRACE_FILE and os.path.exists(TRACE_FILE):
+        with open(TRACE_FILE, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            f.seek(max(0, f.tell() - 2 * 1024 * 1024))
+            for line in f.read().splitlines():
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue    # partial first line after seeking, or a torn write
+    else:
+        records = list(_recent)
+    if slow_only:
+        records = [r for r in records if r.get('slow')]
+    return records[::-1][:limit]
+
+
+def find_trace(request_id: str):
+    for record in recent_traces(limit=TRACE_BUFFER_SIZE * 10):
+        if record['request_id'] == request_id:
+            return record
+    return None
+
+
+def instrument_app(app):
+    """Open a root span per request and echo the request id in X-Request-ID."""
+    from flask import g, request
+
+    @app.before_request
+    def _start_trace():
+        g.trace_token = start_trace(f'{request.method} {request.path}',
+                                    request_id=request.headers.get('X-Request-ID'))
+
+    @app.after_request
+    def _tag_response(response):
+        request_id = current_request_id()
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        g.trace_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_trace(exc):
+        token = g.pop('trace_token', None)
+        if token is not None:
+            finish_trace(token, endpoint=request.endpoint, status=g.pop('trace_status', 500))
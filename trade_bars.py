@@ -0,0 +1,250 @@
+"""Bars built locally from the public trade stream.
+
+Exchanges serve OHLCV at fixed timeframes, with a minute or more of latency
+on the forming bar. This module folds raw trades into bars as they arrive,
+so a bar is current to the last trade polled. It also builds bar types
+exchanges don't offer:
+
+    1s, 5s, 1m, ...     time bars ('Ns', 'Nm', 'Nh')
+    tick:100            a bar every 100 trades
+    vol:2.5             a bar every 2.5 units of base volume
+    dollar:1000000      a bar every 1,000,000 of quote volume (price * amount)
+
+A threshold bar starts at the trade whose running total before it crosses a
+multiple of the size. Trades are never split, so one bar may overshoot. The
+overshoot counts towards the next bar, so bars average exactly the size.
+Non-time bars are stamped with their first trade's time. Time buckets with no
+trades are omitted, as exchanges do.
+
+Each symbol has one TradeTape. It keeps the last TRADE_WINDOW trades and a
+BarBuilder per interval asked for. A new builder replays the tape, so it
+starts with history. A poll whose oldest trade is newer than the cursor it
+was fetched from has missed trades in between (more arrived than the fetch
+limit, or the exchange ignored `since`); the tape then restarts from that
+poll rather than fold a silent hole into tick, volume and dollar bars. Trades and bars live in fixed-size numpy ring buffers,
+and a batch of trades is folded with reduceat rather than one trade at a
+time. As with resampler, callers own the I/O:
+
+    tape = trade_bars.tape(symbol)
+    since = tape.cursor()
+    changed = tape.ingest(fetch_trades(symbol, since=since), since)   # {interval: [bar, ...]} new or updated
+    tape.select('5s', limit=500)
+"""
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+TRADE_WINDOW = 100_000       # raw trades kept per symbol (replayed into new builders)
+BAR_WINDOW = 5000            # completed bars kept per symbol/interval
+MAX_SYMBOLS = 50
+
+_TIME_UNITS = {'s': 1000, 'm': 60_000, 'h': 3_600_000}
+_KINDS = ('tick', 'vol', 'dollar')
+
+
+def parse_interval(interval: str) -> tuple:
+    """'5s' -> ('time', 5000); 'dollar:1e6' -> ('dollar', 1000000.0). Raises ValueError if unsupported."""
+    match = re.fullmatch(r'(\d+)([smh])', interval or '')
+    if match and int(match.group(1)) > 0:
+        return 'time', int(match.group(1)) * _TIME_UNITS[match.group(2)]
+    kind, _, size = (interval or '').partition(':')
+    try:
+        size = float(size)
+    except ValueError:
+        size = 0.0
+    if kind not in _KINDS or not size > 0:
+        raise ValueError(f"Unsupported trade bar interval {interval}")
+    return kind, size
+
+
+def is_trade_interval(interval: str) -> bool:
+    """Intervals only trades can build: sub-minute time bars and tick/volume/dollar bars."""
+    try:
+        kind, size = parse_interval(interval)
+    except ValueError:
+        return False
+    return kind != 'time' or size < 60_000
+
+
+class Ring:
+    """Fixed-capacity float64 row buffer; the oldest rows are overwritten."""
+
+    def __init__(self, capacity: int, width: int):
+        self.data = np.empty((capacity, width))
+        self.start = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def extend(self, rows: np.ndarray):
+        capacity = len(self.data)
+        rows = rows[-capacity:]
+        n = len(rows)
+        if not n:
+            return
+        end = (self.start + self.size) % capacity
+        first = min(n, capacity - end)
+        self.data[end:end + first] = rows[:first]
+        self.data[:n - first] = rows[first:]
+        overflow = max(0, self.size + n - capacity)
+        self.start = (self.start + overflow) % capacity
+        self.size = min(capacity, self.size + n)
+
+    def last(self, n: int = None) -> np.ndarray:
+        """The newest n rows (all by default), oldest first, as a copy."""
+        n = self.size if n is None else min(n, self.size)
+        idx = (self.start + self.size - n + np.arange(n)) % len(self.data)
+        return self.data[idx]
+
+
+class BarBuilder:
+    """Incremental bars of one interval: a ring of completed bars plus the forming one."""
+
+    def __init__(self, interval: str, capacity: int = BAR_WINDOW):
+        self.interval = interval
+        self.kind, self.size = parse_interval(interval)
+        self.bars = Ring(capacity, 6)
+        self.forming = None       # [ms, o, h, l, c, v]
+        self.forming_id = None
+        self.total = 0.0          # ticks/volume/dollars seen so far, for threshold bars
+
+    def add(self, trades: np.ndarray) -> list:
+        """Fold [[ms, price, amount], ...] (oldest first) in. Returns the bars completed or updated."""
+        if not len(trades):
+            return []
+        ms, price, amount = trades[:, 0], trades[:, 1], trades[:, 2]
+        if self.kind == 'time':
+            ids = ms.astype(np.int64) // int(self.size)
+        else:
+            measure = {'tick': np.ones(len(trades)), 'vol': amount, 'dollar': price * amount}[self.kind]
+            running = self.total + np.cumsum(measure)
+            ids = np.floor((running - measure) / self.size).astype(np.int64)
+            self.total = float(running[-1])
+        starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+        ends = np.r_[starts[1:], len(trades)] - 1
+        groups = np.empty((len(starts), 6))
+        groups[:, 0] = ids[starts] * self.size if self.kind == 'time' else ms[starts]
+        groups[:, 1] = price[starts]
+        groups[:, 2] = np.maximum.reduceat(price, starts)
+        groups[:, 3] = np.minimum.reduceat(price, starts)
+        groups[:, 4] = price[ends]
+        groups[:, 5] = np.add.reduceat(amount, starts)
+
+        changed = []
+        if self.forming is not None and ids[0] == self.forming_id:
+            bar, first = self.forming, groups[0]
+            bar[2], bar[3], bar[4], bar[5] = max(bar[2], first[2]), min(bar[3], first[3]), first[4], bar[5] + first[5]
+            groups[0] = bar
+        elif self.forming is not None:
+            self.bars.extend(np.array([self.forming]))
+            changed.append(list(self.forming))
+        self.bars.extend(groups[:-1])
+        self.forming, self.forming_id = groups[-1].tolist(), ids[-1]
+        changed.extend(groups.tolist())
+        return changed
+
+    def select(self, limit: int, since: int = None) -> list:
+        """Up to `limit` bars, oldest first, the forming bar last; `since` keeps bars starting at or after it."""
+        rows = self.bars.last().tolist()
+        if self.forming is not None:
+            rows.append(list(self.forming))
+        if since is not None:
+            rows = [r for r in rows if r[0] >= since][:limit]
+        else:
+            rows = rows[-limit:] if limit else []
+        for row in rows:
+            row[0] = int(row[0])
+        return rows
+
+
+class TradeTape:
+    """Recent trades of one symbol and the bar builders fed from them."""
+
+    def __init__(self, symbol: str, capacity: int = TRADE_WINDOW):
+        self.symbol = symbol
+        self.capacity = capacity
+        self.builders = {}                    # interval -> BarBuilder
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every trade and bar; builders stay registered and start empty."""
+        self.trades = Ring(self.capacity, 3)  # [ms, price, amount]
+        self.builders = {interval: BarBuilder(interval) for interval in self.builders}
+        self.last_ms = None
+        self._ids_at_last = set()             # trade keys seen at last_ms (polls overlap there)
+
+    def cursor(self):
+        """`since` for the next fetch_trades poll: the newest trade time seen, or None."""
+        return int(self.last_ms) if self.last_ms is not None else None
+
+    def ingest(self, trades, since: int = None) -> dict:
+        """Add ccxt trade dicts (any order, may repeat earlier polls). Returns {interval: changed bars}.
+
+        `since` is the cursor() the trades were fetched from. If they don't reach back to it,
+        trades were missed and the tape restarts from these.
+        """
+        trades = sorted((t for t in trades if t.get('timestamp') is not None), key=lambda t: t['timestamp'])
+        if since is not None and trades and trades[0]['timestamp'] > since and since == self.last_ms:
+            with self.lock:
+                self.reset()
+        rows, ids = [], []
+        for t in trades:
+            ts = t['timestamp']
+            if t.get('price') is None or t.get('amount') is None:
+                continue
+            # Exchanges without trade ids: a trade is known by what it is.
+            key = t['id'] if t.get('id') is not None else (ts, t['price'], t['amount'])
+            if self.last_ms is not None and (ts < self.last_ms or (ts == self.last_ms and key in self._ids_at_last)):
+                continue
+            rows.append((ts, t['price'], t['amount']))
+            ids.append((ts, key))
+        if not rows:
+            return {}
+        with self.lock:
+            newest = rows[-1][0]
+            if newest != self.last_ms:
+                self._ids_at_last = set()
+            self._ids_at_last.update(i for ts, i in ids if ts == newest)
+            self.last_ms = newest
+            rows = np.asarray(rows, dtype=np.float64)
+            self.trades.extend(rows)
+            return {interval: b.add(rows) for interval, b in self.builders.items()}
+
+    def builder(self, interval: str) -> BarBuilder:
+        """The builder for `interval`, created on first use from the trades on the tape."""
+        with self.lock:
+            b = self.builders.get(interval)
+            if b is None:
+                b = self.builders[interval] = BarBuilder(interval)
+                b.add(self.trades.last())
+            return b
+
+    def select(self, interval: str, limit: int, since: int = None) -> list:
+        b = self.builder(interval)
+        with self.lock:
+            return b.select(limit, since)
+
+
+_tapes = OrderedDict()     # symbol -> TradeTape, least recently used first
+_tapes_lock = threading.Lock()
+
+
+def tape(symbol: str) -> TradeTape:
+    with _tapes_lock:
+        t = _tapes.get(symbol)
+        if t is None:
+            t = _tapes[symbol] = TradeTape(symbol)
+            while len(_tapes) > MAX_SYMBOLS:
+                _tapes.popitem(last=False)
+        else:
+            _tapes.move_to_end(symbol)
+        return t
+
+
+def clear():
+    with _tapes_lock:
+        _tapes.clear()
@@ -1,14 +1,22 @@
 from exchange_connector import ExchangeConnector
 from models import Trade, Strategy, User, TradingMode, TradeStatus
 from database import DBSession
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from sqlalchemy import func, or_
+import contextvars
 import logging
-import ccxt
+import math
+import risk_engine
+import symbol_index
+import tracing
 
 logger = logging.getLogger(__name__)
 
 # Realistic taker fee applied to PAPER fills so demo P&L reflects real costs.
 PAPER_FEE_RATE = 0.001  # 0.10%
+MAX_BASKET_LEGS = 50
+BASKET_CONCURRENCY = 8   # concurrent price fetches / live order submissions per basket
 
 class TradingEngine:
     """Core trading engine.
@@ -26,14 +34,32 @@ class TradingEngine:
     # ---- helpers ---------------------------------------------------------
     @staticmethod
     def _to_ccxt_symbol(symbol: str) -> str:
-        """'BTCUSDT' -> 'BTC/USDT' (CCXT format). Pass-through if already slashed."""
+        """'BTCUSDT' -> 'BTC/USDT' (CCXT format). Pass-through if already slashed.
+
+        Exact matches come from the on-disk symbol index (no network); the quote-suffix split
+        is only the fallback for symbols it doesn't know.
+        """
         if '/' in symbol:
             return symbol
+        market = symbol_index.shared.ensure().resolve(symbol, fallback=False)
+        if market is not None:
+            return market.symbol
         for quote in ('USDT', 'USDC', 'USD', 'BTC', 'ETH', 'BNB'):
             if symbol.endswith(quote):
                 return f"{symbol[:-len(quote)]}/{quote}"
         return symbol
 
+    def _live_balance(self, symbol: str) -> float:
+        """The exchange balance in `symbol`'s quote currency (cached by the risk engine): the
+        base for LIVE risk percentages."""
+        quote = self._to_ccxt_symbol(symbol).partition('/')[2].split(':')[0]
+
+        def fetch():
+            balance = self.connector.get_balance()
+            return (balance.get('total') or {}).get(quote) or (balance.get('free') or {}).get(quote)
+
+        return risk_engine.shared.live_balance(self.user_id, self.exchange, quote, fetch)
+
     def _public_price(self, symbol: str):
         """Live price from public market data — no API key needed (for PAPER).
         Uses the self-healing market_proxy (Binance.US / Kraken / Coinbase fallback)."""
@@ -44,22 +70,30 @@ class TradingEngine:
             logger.warning(f"public price fetch failed for {symbol}: {e}")
             return None
     
+    @tracing.traced('trading.execute_buy')
     def execute_buy(self, symbol: str, amount: float, strategy_id: int = None,
                     stop_loss_pct: float = None, take_profit_pct: float = None,
                     mode: str = 'paper', price: float = None) -> dict:
         """Execute market buy. mode='paper' simulates; mode='live' hits the exchange."""
         try:
             is_paper = (mode != 'live')
+            trading_mode = TradingMode.PAPER if is_paper else TradingMode.LIVE
+            risk = risk_engine.shared
+            # Cheap rules first, before fetching a price; the sizing rules once it is known.
+            risk.check(self.user_id, trading_mode, symbol, amount)
 
             if is_paper:
                 entry_price = float(price) if price else self._public_price(symbol)
                 if not entry_price:
                     raise Exception("Could not determine a price for the paper fill")
+                risk.check(self.user_id, trading_mode, symbol, amount, entry_price, stop_loss_pct)
                 order = {'id': None, 'status': 'filled', 'paper': True}
             else:
                 self.connector.connect()
                 ticker = self.connector.get_ticker(symbol)
                 entry_price = ticker['last']
+                risk.check(self.user_id, trading_mode, symbol, amount, entry_price, stop_loss_pct,
+                           balance=self._live_balance(symbol))
                 order = self.connector.create_market_buy(symbol, amount)
 
             fee = entry_price * amount * PAPER_FEE_RATE
@@ -86,7 +120,7 @@ class TradingEngine:
                     entry_price=entry_price,
                     entry_amount=amount,
                     entry_time=datetime.utcnow(),
-                    trading_mode=TradingMode.PAPER if is_paper else TradingMode.LIVE,
+                    trading_mode=trading_mode,
                     status=TradeStatus.OPEN,
                     fees=fee,
                     stop_loss=stop_loss,
@@ -95,6 +129,8 @@ class TradingEngine:
                 db.add(trade)
                 db.commit()
                 db.refresh(trade)
+                risk.on_open(self.user_id, trading_mode, trade.id, symbol, 'buy', entry_price * amount,
+                             cash=-(entry_price * amount + fee) if is_paper else 0.0)
 
                 return {
                     'success': True,
@@ -110,10 +146,14 @@ class TradingEngine:
                                       if is_paper else None),
                 }
 
+        except risk_engine.RiskRejected as e:
+            logger.info(f"Buy order rejected [{tracing.current_request_id()}]: {str(e)}")
+            raise
         except Exception as e:
-            logger.error(f"Buy order failed: {str(e)}")
+            logger.error(f"Buy order failed [{tracing.current_request_id()}]: {str(e)}")
             raise Exception(f"Failed to execute buy order: {str(e)}")
     
+    @tracing.traced('trading.execute_sell')
     def execute_sell(self, symbol: str, amount: float, trade_id: int = None,
                      mode: str = 'paper', price: float = None) -> dict:
         """Execute market sell / close a position. Paper credits proceeds + P&L to paper_balance."""
@@ -165,6 +205,9 @@ class TradingEngine:
                         user.paper_balance = (user.paper_balance or 0.0) + (exit_price * amount - fee)
 
                 db.commit()
+                if trade:
+                    risk_engine.shared.on_close(self.user_id, trade.trading_mode, trade.id, trade.profit_loss,
+                                                cash=exit_price * amount - fee if is_paper else 0.0)
 
                 return {
                     'success': True,
@@ -180,9 +223,231 @@ class TradingEngine:
                 }
 
         except Exception as e:
-            logger.error(f"Sell order failed: {str(e)}")
+            logger.error(f"Sell order failed [{tracing.current_request_id()}]: {str(e)}")
             raise Exception(f"Failed to execute sell order: {str(e)}")
     
+    # ---- baskets ---------------------------------------------------------
+
+    @staticmethod
+    def _basket_legs(orders: list) -> list:
+        """Validate basket orders and coerce their numeric fields; raises ValueError listing every bad leg."""
+        if not isinstance(orders, list) or not orders:
+            raise ValueError("orders must be a non-empty list")
+        if len(orders) > MAX_BASKET_LEGS:
+            raise ValueError(f"at most {MAX_BASKET_LEGS} orders per basket")
+        legs, errors = [], []
+        for i, order in enumerate(orders):
+            order = order if isinstance(order, dict) else {}
+            side = str(order.get('side', '')).lower()
+            leg = {'index': i, 'symbol': order.get('symbol'), 'side': side}
+            if not order.get('symbol'):
+                errors.append(f"#{i}: symbol required")
+            elif side not in ('buy', 'sell'):
+                errors.append(f"#{i}: side must be buy or sell")
+            for field, kind, required in (('amount', float, True), ('price', float, False),
+                                          ('stop_loss_pct', float, False), ('take_profit_pct', float, False),
+                                          ('trade_id', int, False), ('strategy_id', int, False)):
+                value = order.get(field)
+                if value is None or value == '':
+                    leg[field] = None
+                    if required:
+                        errors.append(f"#{i}: {field} required")
+                    continue
+                try:
+                    leg[field] = kind(value)
+                    if isinstance(value, bool) or not math.isfinite(leg[field]) or leg[field] < 0:
+                        raise ValueError
+                except (TypeError, ValueError):
+                    errors.append(f"#{i}: {field} must be a non-negative number")
+                    continue
+                if field == 'amount' and not leg[field] > 0:
+                    errors.append(f"#{i}: amount must be positive")
+            legs.append(leg)
+        if errors:
+            raise ValueError("invalid basket: " + "; ".join(errors))
+        for leg in legs:
+            leg['price'] = leg['price'] or None
+        return legs
+
+    def _marks(self, symbols) -> dict:
+        """One price snapshot for several symbols, fetched concurrently."""
+        symbols = sorted(symbols)
+        if not symbols:
+            return {}
+        with ThreadPoolExecutor(min(len(symbols), BASKET_CONCURRENCY)) as pool:
+            return dict(zip(symbols, pool.map(self._public_price, symbols)))
+
+    def _submit_live(self, legs: list) -> None:
+        """Place every leg's market order concurrently, paced at the exchange's rate limit."""
+        from backfill import RateLimiter
+        exchange = self.connector.exchange or self.connector.connect()
+        limiter = RateLimiter(1000.0 / (getattr(exchange, 'rateLimit', None) or 1000))
+
+        def submit(leg):
+            symbol = self._to_ccxt_symbol(leg['symbol'])
+            limiter.acquire()
+            try:
+                if leg['side'] == 'buy':
+                    leg['order'] = self.connector.create_market_buy(symbol, leg['amount'])
+                else:
+                    leg['order'] = self.connector.create_market_sell(symbol, leg['amount'])
+                leg['price'] = leg['order'].get('average') or leg['order'].get('price') or leg['price']
+                leg['status'] = 'filled'
+            except Exception as e:
+                leg['status'], leg['error'] = 'failed', str(e)
+
+        # Each leg runs in a copy of the request's context, so its spans and logs keep the request id.
+        with ThreadPoolExecutor(min(len(legs), BASKET_CONCURRENCY)) as pool:
+            for future in [pool.submit(contextvars.copy_context().run, submit, leg) for leg in legs]:
+                future.result()
+
+    @tracing.traced('trading.execute_basket')
+    def execute_basket(self, orders: list, mode: str = 'paper') -> dict:
+        """Execute several buy/sell orders in one call, recorded in one DB transaction.
+
+        Legs are validated and risk-checked together, and priced from one mark snapshot.
+        PAPER baskets are all-or-nothing. LIVE legs are submitted concurrently; each leg
+        reports its own status, and only the filled ones are recorded.
+        """
+        is_paper = (mode != 'live')
+        trading_mode = TradingMode.PAPER if is_paper else TradingMode.LIVE
+        legs = self._basket_legs(orders)
+
+        marks = self._marks({leg['symbol'] for leg in legs if not leg['price']})
+        missing = sorted({leg['symbol'] for leg in legs if not leg['price'] and not marks.get(leg['symbol'])})
+        if missing:
+            raise Exception(f"Could not determine a price for {', '.join(missing)}")
+        for leg in legs:
+            leg['price'] = leg['price'] or marks[leg['symbol']]
+            leg['status'] = 'filled' if is_paper else 'pending'
+
+        sells = [leg for leg in legs if leg['side'] == 'sell']
+        buys = [leg for leg in legs if leg['side'] == 'buy']
+        if sells:
+            # Sells close the newest open positions, one distinct trade per leg.
+            with DBSession() as db:
+                open_trades = db.query(Trade.id, Trade.trading_pair).filter(
+                    Trade.user_id == self.user_id,
+                    Trade.trading_mode == trading_mode,
+                    Trade.status == TradeStatus.OPEN,
+                    or_(Trade.trading_pair.in_(sorted({leg['symbol'] for leg in sells})),
+                        Trade.id.in_([leg['trade_id'] for leg in sells if leg['trade_id']])),
+                ).order_by(Trade.entry_time.desc()).all()
+            available = dict(open_trades)
+            for leg in sells:
+                if leg['trade_id'] and available.pop(leg['trade_id'], None) is None:
+                    raise Exception(f"#{leg['index']}: trade {leg['trade_id']} is not an open position")
+            for leg in sells:
+                if not leg['trade_id']:
+                    leg['trade_id'] = next((tid for tid, pair in available.items() if pair == leg['symbol']), None)
+                    if leg['trade_id'] is not None:
+                        del available[leg['trade_id']]
+                    elif is_paper:
+                        raise Exception(f"#{leg['index']}: no open paper position in {leg['symbol']} to sell")
+
+        risk = risk_engine.shared
+        balances = None
+        if not is_paper and buys:
+            self.connector.connect()
+            balances = {symbol: self._live_balance(symbol) for symbol in {leg['symbol'] for leg in buys}}
+        risk.check_basket(self.user_id, trading_mode,
+                          [(leg['symbol'], leg['amount'], leg['price'], leg['stop_loss_pct']) for leg in buys],
+                          closes=sum(1 for leg in sells if leg['trade_id']), balances=balances)
+        if not is_paper:
+            self._submit_live(legs)      # no DB session is held open across exchange calls
+
+        with DBSession() as db:
+            user = db.query(User).filter(User.id == self.user_id).first()
+            closing = {t.id: t for t in db.query(Trade).filter(
+                Trade.id.in_([leg['trade_id'] for leg in sells if leg['trade_id']]),
+                Trade.status == TradeStatus.OPEN).all()} if sells else {}
+            for leg in sells:
+                leg['trade'] = closing.get(leg['trade_id'])
+                if leg['trade_id'] and leg['trade'] is None and is_paper:
+                    raise Exception(f"#{leg['index']}: trade {leg['trade_id']} was closed meanwhile")
+            if is_paper:
+                if user.paper_balance is None:
+                    user.paper_balance = 10000.0
+                cash = sum((-1 if leg['side'] == 'buy' else 1) * leg['price'] * leg['amount'] for leg in legs) \
+                    - sum(leg['price'] * leg['amount'] * PAPER_FEE_RATE for leg in legs)
+                if user.paper_balance + cash < 0:
+                    raise Exception(f"Insufficient paper balance: basket needs ${-cash:,.2f}, "
+                                    f"have ${user.paper_balance:,.2f}")
+
+            now = datetime.utcnow()
+            opened, closed = [], []
+            for leg in legs:
+                if leg['status'] != 'filled':
+                    continue
+                price, amount = leg['price'], leg['amount']
+                leg['fee'] = price * amount * PAPER_FEE_RATE
+                if leg['side'] == 'buy':
+                    sl, tp = leg['stop_loss_pct'], leg['take_profit_pct']
+                    leg['trade'] = Trade(
+                        user_id=self.user_id,
+                        strategy_id=leg['strategy_id'],
+                        exchange_order_id=(leg.get('order') or {}).get('id'),
+                        trading_pair=leg['symbol'],
+                        side='buy',
+                        entry_price=price,
+                        entry_amount=amount,
+                        entry_time=now,
+                        trading_mode=trading_mode,
+                        status=TradeStatus.OPEN,
+                        fees=leg['fee'],
+                        stop_loss=price * (1 - sl / 100) if sl else None,
+                        take_profit=price * (1 + tp / 100) if tp else None,
+                    )
+                    opened.append(leg)
+                elif leg.get('trade') is not None:
+                    trade = leg['trade']
+                    trade.exit_price = price
+                    trade.exit_amount = amount
+                    trade.exit_time = now
+                    trade.status = TradeStatus.CLOSED
+                    trade.fees = (trade.fees or 0.0) + leg['fee']
+                    if trade.side == 'buy':
+                        trade.profit_loss = (price - trade.entry_price) * amount - trade.fees
+                        trade.profit_loss_pct = ((price - trade.entry_price) / trade.entry_price) * 100
+                    trade.exit_reason = 'basket'
+                    closed.append(leg)
+            db.add_all([leg['trade'] for leg in opened])
+            if is_paper:
+                user.paper_balance += cash
+            db.commit()
+
+            for leg in opened:
+                risk.on_open(self.user_id, trading_mode, leg['trade'].id, leg['symbol'], 'buy',
+                             leg['price'] * leg['amount'],
+                             cash=-(leg['price'] * leg['amount'] + leg['fee']) if is_paper else 0.0)
+            for leg in closed:
+                risk.on_close(self.user_id, trading_mode, leg['trade'].id, leg['trade'].profit_loss,
+                              cash=leg['price'] * leg['amount'] - leg['fee'] if is_paper else 0.0)
+
+            def recorded(leg):
+                return leg['status'] == 'filled' and leg.get('trade') is not None
+
+            results = [{
+                'index': leg['index'],
+                'symbol': leg['symbol'],
+                'side': leg['side'],
+                'amount': leg['amount'],
+                'status': leg['status'],
+                'price': leg['price'] if leg['status'] == 'filled' else None,
+                'fee': leg.get('fee'),
+                'trade_id': leg['trade'].id if recorded(leg) else None,
+                'profit_loss': leg['trade'].profit_loss if recorded(leg) and leg['side'] == 'sell' else None,
+                'order': leg.get('order') or ({'id': None, 'status': 'filled', 'paper': True} if is_paper else None),
+                'error': leg.get('error'),
+            } for leg in legs]
+            return {
+                'success': all(leg['status'] == 'filled' for leg in legs),
+                'mode': 'paper' if is_paper else 'live',
+                'legs': results,
+                'paper_balance': user.paper_balance if is_paper else None,
+            }
+
+    @tracing.traced('trading.get_balance')
     def get_balance(self) -> dict:
         """Get account balance"""
         try:
@@ -193,6 +458,7 @@ class TradingEngine:
             logger.error(f"Failed to get balance: {str(e)}")
             raise Exception(f"Failed to get balance: {str(e)}")
     
+    @tracing.traced('trading.get_open_positions')
     def get_open_positions(self) -> list:
         """Get all open positions for user"""
         try:
@@ -242,6 +508,16 @@ class TradingEngine:
             logger.error(f"Failed to get positions: {str(e)}")
             raise Exception(f"Failed to get positions: {str(e)}")
     
+    def get_trade_history_version(self) -> tuple:
+        """(count, latest updated_at) of the rows get_trade_history() reads -- a cheap ETag source."""
+        with DBSession() as db:
+            return db.query(func.count(Trade.id), func.max(Trade.updated_at)).filter(
+                Trade.user_id == self.user_id,
+                Trade.status == TradeStatus.CLOSED,
+                Trade.trading_mode == TradingMode.LIVE
+            ).one()
+
+    @tracing.traced('trading.get_trade_history')
     def get_trade_history(self, limit: int = 50) -> list:
         """Get closed trade history"""
         try:
@@ -316,6 +592,7 @@ class TradingEngine:
             logger.error(f"Failed to check SL/TP: {str(e)}")
             return {'action': 'none', 'reason': 'error', 'error': str(e)}
     
+    @tracing.traced('trading.close_position')
     def close_position(self, trade_id: int, reason: str = 'manual') -> dict:
         """Close an open position"""
         try:
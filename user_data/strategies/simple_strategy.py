@@ -11,10 +11,21 @@ class SimpleStrategy(IStrategy):
     stoploss = -0.10
     trailing_stop = False
 
+    # Declared so the PrismTrade backtester can fill them from the shared
+    # indicator registry; freqtrade ignores this and computes them below.
+    indicators = {
+        "rsi": {"name": "rsi", "period": 14},
+        "sma_20": {"name": "sma", "period": 20},
+        "sma_50": {"name": "sma", "period": 50},
+    }
+
     def populate_indicators(self, dataframe: DataFrame, metadata: dict) -> DataFrame:
-        dataframe["rsi"] = talib.RSI(dataframe["close"], timeperiod=14)
-        dataframe["sma_20"] = talib.SMA(dataframe["close"], timeperiod=20)
-        dataframe["sma_50"] = talib.SMA(dataframe["close"], timeperiod=50)
+        if "rsi" not in dataframe:
+            dataframe["rsi"] = talib.RSI(dataframe["close"], timeperiod=14)
+        if "sma_20" not in dataframe:
+            dataframe["sma_20"] = talib.SMA(dataframe["close"], timeperiod=20)
+        if "sma_50" not in dataframe:
+            dataframe["sma_50"] = talib.SMA(dataframe["close"], timeperiod=50)
         return dataframe
 
     def populate_entry_trend(self, dataframe: DataFrame, metadata: dict) -> DataFrame:
@@ -0,0 +1,200 @@
+"""Walk-forward optimization for simple_ma_crossover_strategy.
+
+The series is split into rolling train/test windows. Each fold sweeps the
+parameter grid on its train window, picks the best parameters by an
+objective from get_stats(), and evaluates them out-of-sample on the test
+window that follows. Test equity curves are stitched into one out-of-sample
+curve.
+
+Folds run in a process pool. OHLCV is placed in one shared-memory block that
+every worker maps, instead of being pickled to each task. Fold results are
+cached by a hash of their inputs (window data, grid, objective, costs), so
+re-running after new bars arrive only computes the folds that changed.
+"""
+import hashlib
+import itertools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from backtesting import run_signal_backtest, simple_ma_crossover_strategy
+from indicators import IndicatorRegistry
+
+COLUMNS = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+
+_fold_cache = {}     # fold input hash -> fold result
+
+# Worker-side view of the shared OHLCV block (set by _attach).
+_shm = None
+_ohlcv = None
+
+
+def _attach(name: str, shape: tuple):
+    global _shm, _ohlcv
+    _shm = shared_memory.SharedMemory(name=name)
+    _ohlcv = np.ndarray(shape, dtype=np.float64, buffer=_shm.buf)
+
+
+def _detach():
+    global _shm, _ohlcv
+    if _shm is not None:
+        _ohlcv = None
+        _shm.close()
+        _shm = None
+
+
+def _to_ms(timestamps: pd.Series) -> np.ndarray:
+    if np.issubdtype(timestamps.dtype, np.number):
+        return timestamps.to_numpy(dtype=np.float64)
+    delta = pd.to_datetime(timestamps, utc=True) - pd.Timestamp(0, tz='UTC')
+    return (delta // pd.Timedelta(milliseconds=1)).to_numpy(dtype=np.float64)
+
+
+def _frame(start: int, end: int) -> pd.DataFrame:
+    """DataFrame over rows [start, end) of the shared block."""
+    block = _ohlcv[start:end]
+    df = pd.DataFrame(block, columns=COLUMNS)
+    df['timestamp'] = pd.to_datetime(block[:, 0], unit='ms')
+    return df
+
+
+def _score(stats: dict, objective: str) -> float:
+    value = stats.get(objective)
+    return float(value) if value is not None and np.isfinite(value) else float('-inf')
+
+
+def _run(df: pd.DataFrame, fast: int, slow: int, registry, initial_capital, fee_pct, risk_pct):
+    signals = simple_ma_crossover_strategy(df, fast_period=fast, slow_period=slow, series_key='train', registry=registry)
+    return run_signal_backtest(signals, initial_capital=initial_capital, fee_pct=fee_pct, risk_pct=risk_pct)
+
+
+def _run_fold(fold: dict) -> dict:
+    """Optimize on the train window, evaluate the winner on the test window."""
+    train_start, train_end, test_end = fold['train_start'], fold['train_end'], fold['test_end']
+    costs = (fold['initial_capital'], fold['fee_pct'], fold['risk_pct'])
+
+    # The SMAs for every grid point come from an indicator registry private to
+    # this fold, so a period used by several combinations is computed once and
+    # nothing is left behind in the process-wide registry.
+    train = _frame(train_start, train_end)
+    registry = IndicatorRegistry(max_series=1)
+    best, best_score, best_stats = None, float('-inf'), None
+    for fast, slow in fold['grid']:
+        stats = _run(train, fast, slow, registry, *costs).get_stats()
+        score = _score(stats, fold['objective'])
+        if best is None or score > best_score:
+            best, best_score, best_stats = (fast, slow), score, stats
+
+    # Warm the MAs up on the bars before the test window, then keep only the test bars.
+    fast, slow = best
+    warmup = min(slow, train_end)
+    signals = simple_ma_crossover_strategy(_frame(train_end - warmup, test_end), fast, slow).iloc[warmup:]
+    test = run_signal_backtest(signals.reset_index(drop=True), *costs)
+    return {
+        'train_start': train_start, 'train_end': train_end, 'test_end': test_end,
+        'params': {'fast_period': fast, 'slow_period': slow},
+        'train_stats': best_stats,
+        'test_stats': test.get_stats(),
+        'test_equity': test.equity_curve,
+        'test_timestamps': test.timestamps,
+    }
+
+
+def make_folds(n_bars: int, train_bars: int, test_bars: int, step: int = None, anchored: bool = False) -> list:
+    """[(train_start, train_end, test_end)] for rolling (or anchored) walk-forward windows."""
+    step = step or test_bars
+    folds = []
+    train_end = train_bars
+    while train_end + test_bars <= n_bars:
+        folds.append((0 if anchored else train_end - train_bars, train_end, train_end + test_bars))
+        train_end += step
+    return folds
+
+
+def _fold_key(ohlcv: np.ndarray, fold: dict) -> str:
+    h = hashlib.sha1(ohlcv[fold['train_start']:fold['test_end']].tobytes())
+    h.update(repr(sorted(fold.items())).encode())
+    return h.hexdigest()
+
+
+def walk_forward(df: pd.DataFrame, fast_periods, slow_periods, train_bars: int, test_bars: int,
+                 step: int = None, anchored: bool = False, objective: str = 'total_return_pct',
+                 initial_capital: float = 10000, fee_pct: float = 0.001, risk_pct: float = 10,
+                 workers: int = None) -> dict:
+    """Walk-forward optimize simple_ma_crossover_strategy over `df` (timestamp/open/high/low/close/volume).
+
+    Returns per-fold parameters and get_stats() for train and test, plus the
+    stitched out-of-sample equity curve (each fold's bars past the previous fold's
+    rescaled to continue from where it ended).
+    """
+    grid = [(f, s) for f, s in itertools.product(fast_periods, slow_periods) if f < s]
+    if not grid:
+        raise Exception("Parameter grid is empty (need fast_period < slow_period)")
+    ohlcv = np.ascontiguousarray(np.column_stack(
+        [_to_ms(df['timestamp'])] +
+        [df[c].to_numpy(dtype=np.float64) if c in df else np.zeros(len(df)) for c in COLUMNS[1:]]))
+
+    folds = [{
+        'train_start': a, 'train_end': b, 'test_end': c, 'grid': grid, 'objective': objective,
+        'initial_capital': initial_capital, 'fee_pct': fee_pct, 'risk_pct': risk_pct,
+    } for a, b, c in make_folds(len(df), train_bars, test_bars, step, anchored)]
+    if not folds:
+        raise Exception("Series too short for one train/test window")
+
+    keys = [_fold_key(ohlcv, f) for f in folds]
+    todo = [(k, f) for k, f in zip(keys, folds) if k not in _fold_cache]
+
+    if todo:
+        shm = shared_memory.SharedMemory(create=True, size=ohlcv.nbytes)
+        try:
+            np.ndarray(ohlcv.shape, dtype=np.float64, buffer=shm.buf)[:] = ohlcv
+            workers = min(workers or os.cpu_count() or 1, len(todo))
+            if workers > 1:
+                with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                         initargs=(shm.name, ohlcv.shape)) as pool:
+                    results = list(pool.map(_run_fold, [f for _, f in todo]))
+            else:
+                _attach(shm.name, ohlcv.shape)
+                results = [_run_fold(f) for _, f in todo]
+        finally:
+            _detach()
+            shm.close()
+            shm.unlink()
+        for (k, _), result in zip(todo, results):
+            _fold_cache[k] = result
+
+    fold_results = [_fold_cache[k] for k in keys]
+
+    # Stitch: append each fold's bars after the last one already stitched. A step shorter
+    # than test_bars overlaps test windows, and the first fold's view of a bar wins. The
+    # appended part is rescaled at the seam: from the fold's own equity just before its
+    # first new bar (initial_capital if there is none) to the running level. Overlapping
+    # bars' returns are therefore counted once.
+    equity, timestamps = [], []
+    level = initial_capital
+    for r in fold_results:
+        curve = np.asarray(r['test_equity'], dtype=float)
+        seen = timestamps[-1] if timestamps else None
+        first = next((i for i, t in enumerate(r['test_timestamps']) if seen is None or t > seen), len(curve))
+        if first == len(curve):
+            continue
+        base = curve[first - 1] if first else initial_capital
+        scaled = curve[first:] * (level / base)
+        timestamps.extend(r['test_timestamps'][first:])
+        equity.extend(float(v) for v in scaled)
+        level = float(scaled[-1])
+
+    return {
+        'folds': fold_results,
+        'oos_equity': equity,
+        'oos_timestamps': timestamps,
+        'oos_return_pct': (level - initial_capital) / initial_capital * 100,
+        'reused_folds': len(folds) - len(todo),
+    }
+
+
+def clear_cache():
+    _fold_cache.clear()